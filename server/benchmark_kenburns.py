@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Benchmark for Ken Burns scene renders: the NumPy frame generator piped to the
+encoder against the zoompan filter strings the UI builds, at 720p and 1080p.
+
+zoompan is run as the UI sends it and with the 4x pre-upscale commonly
+needed to hide its integer-pixel jitter.
+
+    python benchmark_kenburns.py [--duration 10] [--workers N] [--sizes 1280x720,1920x1080]
+"""
+
+import argparse
+import os
+import subprocess
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+from module.kenburns import (
+    KENBURNS_FPS, KENBURNS_MAX_WORKERS, KenBurnsRenderer, create_kenburns_video, kenburns_path
+)
+
+SETTINGS = {"startScale": 1.0, "endScale": 1.4, "direction": ["zoom-in", "pan-right"], "intensity": 6}
+
+
+def make_image(path: str, width: int, height: int):
+    # Gradients plus noise, so the encoder can't shortcut flat frames
+    rng = np.random.default_rng(42)
+    y, x = np.mgrid[0:height, 0:width]
+    rgb = np.stack([x * 255 / width, y * 255 / height, (x + y) * 127 / (width + height)], axis=-1)
+    rgb += rng.normal(0, 12, rgb.shape)
+    Image.fromarray(np.clip(rgb, 0, 255).astype(np.uint8)).save(path)
+
+
+def zoompan_expression(width: int, height: int, duration: float, upscale: int = 1) -> str:
+    """Same expression kenBurnsFilterExpression builds in the UI for SETTINGS."""
+    frames = int(duration * KENBURNS_FPS)
+    start, end = SETTINGS["startScale"], SETTINGS["endScale"]
+    intensity = SETTINGS["intensity"] / 10
+    zoom = f"{start}+({end}-{start})*on/{frames}"
+    x = f"iw/2-(iw/zoom/2)-((iw/zoom-{width * upscale})*on/{frames}*{intensity})"
+    y = "ih/2-(ih/zoom/2)"
+    prefix = f"scale={width * upscale}:-1," if upscale > 1 else ""
+    return f"{prefix}zoompan=z='{zoom}':x='{x}':y='{y}':d=1:s={width}x{height}:fps={KENBURNS_FPS}"
+
+
+def bench(label: str, fn, frames: int) -> float:
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    print(f"  {label:<32} {elapsed:7.2f} s  {frames / elapsed:7.1f} fps")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--workers", type=int, default=KENBURNS_MAX_WORKERS)
+    parser.add_argument("--sizes", default="1280x720,1920x1080")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        audio_path = os.path.join(tmpdir, "narration.mp3")
+        subprocess.run([
+            "ffmpeg", "-v", "error", "-y", "-f", "lavfi",
+            "-i", f"sine=frequency=220:duration={args.duration}", audio_path
+        ], check=True)
+        frames = int(args.duration * KENBURNS_FPS)
+        print(f"{args.duration:g} s scene, {frames} frames, {args.workers} workers, {os.cpu_count()} cores")
+
+        for size in args.sizes.split(","):
+            width, height = (int(v) for v in size.split("x"))
+            image_path = os.path.join(tmpdir, f"{size}.png")
+            output_path = os.path.join(tmpdir, f"{size}.mp4")
+            make_image(image_path, width, height)
+            print(f"{size}:")
+
+            def zoompan(upscale):
+                subprocess.run(
+                    ["ffmpeg", "-v", "error", "-y", "-loop", "1", "-i", image_path, "-i", audio_path,
+                     "-vf", zoompan_expression(width, height, args.duration, upscale),
+                     "-c:v", "libx264", "-preset", "veryfast", "-profile:v", "high", "-level", "4.0",
+                     "-pix_fmt", "yuv420p", "-c:a", "aac", "-b:a", "192k", "-shortest", output_path],
+                    check=True
+                )
+
+            baseline = bench("zoompan (as sent by the UI)", lambda: zoompan(1), frames)
+            upscaled = bench("zoompan with 4x pre-upscale", lambda: zoompan(4), frames)
+            numpy_time = bench(
+                "NumPy frame generator",
+                lambda: create_kenburns_video(image_path, audio_path, SETTINGS, output_path,
+                                              max_workers=args.workers),
+                frames
+            )
+            print(f"  speedup: {baseline / numpy_time:.1f}x vs zoompan, "
+                  f"{upscaled / numpy_time:.1f}x vs jitter-free zoompan")
+            # Frame generation alone, in one process: what the pool spreads over the workers
+            renderer = KenBurnsRenderer(image_path, width, height, kenburns_path(SETTINGS, frames))
+            bench("frames only, one process", lambda: renderer.frames(0, frames), frames)
+
+
+if __name__ == "__main__":
+    main()
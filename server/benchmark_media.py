@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the media backends: the ffmpeg/ffprobe subprocess backend
+against in-process PyAV, on the operations the pipeline repeats per scene.
+
+Probes are timed per call, since a story render runs dozens of them; decodes,
+transcodes and the frame encode are timed per run over a generated narration.
+Encoder-bound rows also compare codec builds: PyAV wheels bundle their own
+libav and libmp3lame, which can be slower than a system ffmpeg.
+
+    python benchmark_media.py [--duration 60] [--probes 50] [--backends subprocess,pyav]
+"""
+
+import argparse
+import os
+import subprocess
+import tempfile
+import time
+
+import numpy as np
+
+from module.audio_enhance import build_enhancement_filters
+from module.media import create_media_backend
+
+ENHANCE_SETTINGS = {"normalize": True, "compress": True, "bassBoost": 3, "fadeIn": 500, "limitPeaks": True}
+FRAME_SIZE = (1280, 720)
+FRAME_SECONDS = 4
+
+
+def bench(fn, repeat: int = 1) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--duration", type=float, default=60, help="Length of the test narration in seconds")
+    parser.add_argument("--probes", type=int, default=50, help="Probe calls to average over")
+    parser.add_argument("--backends", default="subprocess,pyav")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        audio_path = os.path.join(tmpdir, "narration.mp3")
+        video_path = os.path.join(tmpdir, "scene.mp4")
+        subprocess.run([
+            "ffmpeg", "-v", "error", "-y", "-f", "lavfi",
+            "-i", f"sine=frequency=220:duration={args.duration}", "-ac", "1", "-ar", "44100", audio_path
+        ], check=True)
+        subprocess.run([
+            "ffmpeg", "-v", "error", "-y", "-f", "lavfi", "-i", f"testsrc=size=640x360:rate=25:duration=5",
+            "-i", audio_path, "-c:v", "libx264", "-preset", "ultrafast", "-c:a", "aac", "-shortest", video_path
+        ], check=True)
+        raw_path = os.path.join(tmpdir, "mix.f32")
+        rng = np.random.default_rng(42)
+        (rng.standard_normal((int(args.duration * 48000), 2)) * 0.1).astype(np.float32).tofile(raw_path)
+        width, height = FRAME_SIZE
+        frame = rng.integers(0, 255, width * height * 3 // 2, dtype=np.uint8).tobytes()
+        frame_count = FRAME_SECONDS * 25
+        short_audio = os.path.join(tmpdir, "short.mp3")
+        subprocess.run(["ffmpeg", "-v", "error", "-y", "-i", audio_path, "-t", str(FRAME_SECONDS), short_audio],
+                       check=True)
+
+        print(f"{args.duration:g} s narration, {args.probes} probes, {os.cpu_count()} cores")
+        results = {}
+        for name in args.backends.split(","):
+            backend = create_media_backend(name)
+            out = os.path.join(tmpdir, name)
+            timings = {
+                "probe_audio (per call)": bench(lambda: backend.probe_audio(audio_path), args.probes),
+                "stream_durations (per call)": bench(lambda: backend.stream_durations(video_path), args.probes),
+                "decode to float32 blocks": bench(
+                    lambda: sum(len(b) for b in backend.iter_audio_blocks(audio_path, 44100, 1, 441000))),
+                "decode 10 s window": bench(lambda: backend.decode_audio(audio_path, 48000, 2, 20, 10)),
+                "enhance chain to MP3": bench(lambda: backend.transcode_audio(
+                    audio_path, f"{out}-enhanced.mp3", codec="libmp3lame", bitrate="128k", sample_rate=44100,
+                    filters=build_enhancement_filters(ENHANCE_SETTINGS, args.duration))),
+                "encode raw mix to FLAC master": bench(lambda: backend.transcode_audio(
+                    raw_path, f"{out}-master.flac", "flac", codec="flac", sample_fmt="s16",
+                    raw_input=(48000, 2))),
+                f"encode {frame_count} frames + AAC": bench(lambda: backend.encode_video(
+                    (frame for _ in range(frame_count)), width, height, 25, short_audio, f"{out}-frames.mp4")),
+            }
+            results[name] = timings
+
+        names = list(results)
+        print(f"{'operation':<32}" + "".join(f"{n:>14}" for n in names))
+        for op in results[names[0]]:
+            row = "".join(f"{results[n][op] * 1000:12.1f}ms" for n in names)
+            if len(names) == 2:
+                row += f"  {results[names[0]][op] / results[names[1]][op]:5.1f}x"
+            print(f"{op:<32}{row}")
+
+
+if __name__ == "__main__":
+    main()
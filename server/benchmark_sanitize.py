@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for prompt sanitization: the compiled single-pass engine
+against the previous one-re.sub/str.replace-per-rule approach.
+
+Before timing, it checks a few rule shapes the hoisted ``\\b`` fast path
+must not change (e.g. a pattern with a top-level ``|``).
+
+    python benchmark_sanitize.py [--words 20000] [--runs 50]
+"""
+
+import argparse
+import random
+import re
+import time
+
+from module.sanitize import CompiledRules, get_sanitization_engine
+
+FILLER = (
+    "the hallway stretched into darkness while rain tapped against the old window "
+    "and Arjun walked slowly past the staircase holding a lantern near the door"
+).split()
+SENSITIVE = [
+    "tragic", "poverty", "lonely", "isolated", "solitude", "melancholic", "grief", "sad",
+    "sadness", "abandoned", "decay", "poignant", "weary", "memories", "death", "blood",
+    "haunted", "corpse", "Sad", "Lonely",
+]
+
+
+def build_story(words: int) -> str:
+    rng = random.Random(42)
+    return " ".join(
+        rng.choice(SENSITIVE) if rng.random() < 0.08 else rng.choice(FILLER) for _ in range(words)
+    )
+
+
+# (rules, text, expected): each must give the same result as one re.sub per rule
+REGRESSION_CASES = [
+    ([{"pattern": r"\bblood|gore\b", "replacement": "red"}], "some gore and blood", "some red and red"),
+    ([{"pattern": r"\bblood|gore\b", "replacement": "red"}, {"term": "sad", "replacement": "quiet"}],
+     "Sad gore", "Quiet red"),
+    ([{"pattern": r"\b(?:dead|dying)\b", "replacement": "still"}, {"term": "grief", "replacement": "longing"}],
+     "dying in grief", "still in longing"),
+    ([{"pattern": r"\bcorpse[|]s\b", "replacement": "figure"}], "corpse|s", "figure"),
+]
+
+
+def check_regressions():
+    for rules, text, expected in REGRESSION_CASES:
+        result = CompiledRules(rules).apply(text)
+        assert result == expected, f"{rules}: {text!r} -> {result!r}, expected {expected!r}"
+    print(f"{len(REGRESSION_CASES)} regression cases pass")
+
+
+def legacy_sanitize(text: str, rules: list) -> str:
+    for rule in rules:
+        text = re.sub(rule["pattern"], rule["replacement"], text, flags=re.IGNORECASE)
+    return text.strip()
+
+
+def legacy_visual(text: str, rules: list) -> str:
+    for rule in rules:
+        text = text.replace(rule["term"], rule["replacement"])
+    return text
+
+
+def bench(label: str, fn, text: str, runs: int) -> float:
+    fn(text)  # warm up caches
+    start = time.perf_counter()
+    for _ in range(runs):
+        fn(text)
+    elapsed = (time.perf_counter() - start) / runs * 1000
+    print(f"  {label:<28} {elapsed:8.3f} ms/prompt")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--words", type=int, default=20000)
+    parser.add_argument("--runs", type=int, default=50)
+    args = parser.parse_args()
+
+    check_regressions()
+    engine = get_sanitization_engine()
+    raw = engine._raw["default"]
+    text = build_story(args.words)
+    print(f"Story text: {args.words} words, {len(text)} characters, {args.runs} runs")
+
+    print("sanitize rules:")
+    legacy = bench("legacy (re.sub per rule)", lambda t: legacy_sanitize(t, raw["sanitize"]), text, args.runs)
+    compiled = bench("compiled single pass", lambda t: engine.apply(t, "sanitize").strip(), text, args.runs)
+    print(f"  speedup: {legacy / compiled:.1f}x")
+
+    print("visual rules:")
+    legacy = bench("legacy (str.replace)", lambda t: legacy_visual(t, raw["visual"]), text, args.runs)
+    compiled = bench("compiled single pass", lambda t: engine.apply(t, "visual"), text, args.runs)
+    print(f"  speedup: {legacy / compiled:.1f}x (legacy also rewrites inside words)")
+
+
+if __name__ == "__main__":
+    main()
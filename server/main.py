@@ -1,21 +1,43 @@
-from module.voice import generate_tts, mix_audio_tracks
-from module.video import create_video_with_ffmpeg, merge_videos, create_video_with_ffmpeg_multi_frame
+from module.voice import generate_tts, generate_tts_chunked, mix_audio_tracks, narration_params, stream_tts
+from module.mixer import mix_peak, mix_tracks
+from module.video import create_video_with_ffmpeg, merge_videos, create_video_with_ffmpeg_multi_frame, replace_video_audio
 from module.image import generate_scene_image
-from module.text import generate_text
-from module.util import extract_base64_from_data_url
-from module.audio_enhance import enhance_audio, get_audio_analysis
+from module.text import generate_text, generate_story_visual_prompts, stream_text, get_text_cache_stats
+from module.util import extract_base64_from_data_url, format_sse
+from module.audio_enhance import enhance_audio, get_audio_analysis, create_enhancement_preview
+from module.ingest import ingest_image, save_story_settings
+from module.prompt_index import get_prompt_index
+from module.tts_cache import get_narration_cache
+from module.assets import store_upload, get_asset_path, list_assets
+from module.enhance_cache import get_enhancement_cache
+from module.batch_enhance import batch_enhance_story
+from module.waveform import try_generate_waveform, waveform_path, waveform_url
+from module.render import start_story_render, get_render_status
+from module.timeline import build_timeline, render_timeline, timeline_inputs
+from module.kenburns import create_kenburns_video
+from module.media import PREVIEW_BITRATE
+from module.previews import PREVIEWS_DIR, PREVIEW_MEDIA_TYPES, ensure_previews, preview_urls
+from module.mezzanine import (
+    mezzanine_enabled, mezzanine_source, move_master, write_master, MEZZANINE_FORMAT, MEZZANINE_OPTIONS
+)
+from module.manifest import (
+    record_file, render_if_stale, scene_video_inputs, scene_video_params, story_video_inputs, stale_artifacts,
+    story_status, NARRATION, SCENE_VIDEO, STORY_VIDEO
+)
 
 import os
 import base64
+import hashlib
 import re
 import json
 
 from pathlib import Path
 from fastapi import FastAPI, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Literal, Optional
 import uvicorn
 
 from dotenv import load_dotenv
@@ -24,6 +46,8 @@ load_dotenv()
 
 
 CHUNK_SIZE = 1024 * 1024  # 1MB
+PREVIEW_WINDOW_SECONDS = 10
+MAX_PREVIEW_SECONDS = 60
 
 # Create FastAPI app instance
 app = FastAPI(
@@ -39,6 +63,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # Allows all methods
     allow_headers=["*"],  # Allows all headers
+    expose_headers=["X-Proxy-Url", "X-Poster-Url", "X-Thumbnails-Url", "X-Waveform-Url"],  # Readable by the UI's fetch
 )
 
 # Pydantic models for request/response
@@ -52,6 +77,10 @@ class ImageGenerationRequest(BaseModel):
     width: Optional[int] = 512
     height: Optional[int] = 512
     reference_scene_id: Optional[str] = None
+    # Near-duplicate reuse: when set, a stored image whose prompt similarity is at
+    # least this value is returned instead of generating a new one
+    reuse_threshold: Optional[float] = None
+    suggest_threshold: Optional[float] = 0.5
 
 class AudioGenerationRequest(BaseModel):
     story_id: str
@@ -69,23 +98,65 @@ class VideoGenerationRequest(BaseModel):
     image: str
     animation: Optional[str] = None
 
-    animation_type: str = 'single-frame'
+    animation_type: str = 'single-frame'  # 'single-frame', 'multi-frame' or 'kenburns'
     ffmpeg_command: Optional[str] = None  # Required for multi-frame animations
+    kenburns: Optional[Dict[str, Any]] = None  # startScale, endScale, direction, intensity, fps for 'kenburns'
     total_duration: Optional[float] = None
     frames: Optional[List[VideoFrame]] = [] # For multi-frame animations
+    force_regenerate: bool = False  # Re-encode even if the inputs are unchanged
 
 class VisualPromptGenerationRequest(BaseModel):
     text: str
     previous_reference: Optional[str] = None
+    genre: Optional[str] = None  # Selects the sanitization rule set
+    force_regenerate: bool = False  # Bypass the visual prompt cache
+    stream: bool = False  # Stream tokens as Server-Sent Events
+
+class StoryScene(BaseModel):
+    scene_id: str
+    text: str
+
+class StoryVisualPromptRequest(BaseModel):
+    story_id: Optional[str] = None
+    scenes: List[StoryScene]
+    previous_reference: Optional[str] = None
+    genre: Optional[str] = None
+    batch_size: int = 10  # Scenes per LLM call
+
+class RenderScene(BaseModel):
+    scene_id: str
+    text: str
+    narration: Optional[str] = None  # Defaults to text
+    visual_prompt: Optional[str] = None  # Generated from text when missing
+    continue_prompt: bool = False  # Generate from the previous scene's visual prompt instead of its text
+    negative_prompt: Optional[str] = None
+    reference_scene_id: Optional[str] = None
+    animation: Optional[str] = None  # ffmpeg -vf string, as sent to /generate/video
+    kenburns: Optional[Dict[str, Any]] = None  # Rendered by the Ken Burns frame generator instead of -vf
+    voice_settings: Dict[str, Any] = {}
+
+class StoryRenderRequest(BaseModel):
+    scenes: List[RenderScene]
+    voice_settings: Dict[str, Any] = {}
+    genre: Optional[str] = None
+    width: Optional[int] = None
+    height: Optional[int] = None
+    resume: bool = True  # Skip nodes completed by a previous (possibly crashed) run
+    renderer: Literal["concat", "timeline"] = "concat"  # "timeline" skips the per-scene videos and encodes story.mp4 in one pass
 
 class AccumulateRequest(BaseModel):
     story_id: str
     scenes: list[str]
     width: Optional[int] = 512
     height: Optional[int] = 512
+    renderer: Literal["concat", "timeline"] = "concat"  # "timeline" encodes story.mp4 from images and audio in one pass
+    animations: Dict[str, Optional[str]] = {}  # Per-scene -vf strings for the timeline renderer
 
 class InitRequest(BaseModel):
     story_id: str
+    width: Optional[int] = None  # Canonical render size used to normalize uploads
+    height: Optional[int] = None
+    fit: Optional[str] = None  # letterbox | cover | stretch
 
 class GenerationResponse(BaseModel):
     success: bool
@@ -96,27 +167,63 @@ class GenerationResponse(BaseModel):
 class ImageGenerationResponse(BaseModel):
     success: bool
     image: str
+    reused: bool = False
+    similar: List[Dict[str, Any]] = []
 
 class AudioGenerationResponse(BaseModel):
     success: bool
     audio_url: str
     duration: float
+    waveform_url: Optional[str] = None
 
 class AudioEnhancementRequest(BaseModel):
     story_id: str
     scene_id: str
     audio_filename: str
     settings: Dict[str, Any]
+    force_regenerate: bool = False  # Re-render even if this variant is cached
+
+class BatchEnhancementRequest(BaseModel):
+    story_id: str
+    settings: Dict[str, Any] = {}  # Applied to every scene
+    scene_ids: Optional[List[str]] = None  # Defaults to every scene narration in the story
+    scene_settings: Dict[str, Dict[str, Any]] = {}  # Per-scene overrides
+    target_lufs: float = -16.0
+    peak_ceiling: float = -1.5
+
+class AudioEnhancementPreviewRequest(BaseModel):
+    story_id: str
+    scene_id: str
+    audio_filename: str
+    settings: Dict[str, Any]
+    start: float = 0.0  # Window start in seconds
+    duration: float = PREVIEW_WINDOW_SECONDS
+
+class AudioPreviewResponse(BaseModel):
+    success: bool
+    preview_url: str
+    start: float
+    duration: float
 
 class AudioEnhancementResponse(BaseModel):
     success: bool
     filename: str
     message: str = ""
     analysis: Dict[str, Any] = {}
+    cached: bool = False
+    variant_key: Optional[str] = None
+    variant_url: Optional[str] = None  # Stable per-settings URL for A/B playback
+    waveform_url: Optional[str] = None
 
 class VideoGenerationResponse(BaseModel):
     success: bool
     video_url: str
+    cached: bool = False  # True when the inputs were unchanged and the existing video was returned
+    remuxed: bool = False  # True when only the audio changed and was swapped into the existing video
+    # Low-res previews for playback and scrubbing, so the UI never loads the full-res file for them
+    proxy_url: Optional[str] = None
+    poster_url: Optional[str] = None
+    thumbnails_url: Optional[str] = None  # WebVTT cues pointing into the thumbnail sprite sheets
 
 class VisualPromptResponse(BaseModel):
     success: bool
@@ -152,11 +259,18 @@ async def get_file(request: Request, story_id: str, dir: str, filename: str):
         media_type = "audio/mp3"
     elif dir == "images":
         media_type = "image/png"
+    elif dir == PREVIEWS_DIR:
+        media_type = PREVIEW_MEDIA_TYPES.get(file_path.suffix, "application/octet-stream")
     else:
         media_type = "application/octet-stream"
 
-    file_size = file_path.stat().st_size
+    stat = file_path.stat()
+    file_size = stat.st_size
     range_header = request.headers.get("range")
+    # Weak validator so clients can revalidate (e.g. waveforms) without re-downloading
+    etag = f'W/"{stat.st_mtime_ns:x}-{file_size:x}"'
+    if not range_header and request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
 
     def iterfile(start=0, end=None):
         with open(file_path, "rb") as f:
@@ -191,7 +305,8 @@ async def get_file(request: Request, story_id: str, dir: str, filename: str):
     headers = {
         "Accept-Ranges": "bytes",
         "Content-Length": str(file_size),
-        "Cache-Control": "no-cache"
+        "Cache-Control": "no-cache",
+        "ETag": etag
     }
     return StreamingResponse(iterfile(), media_type=media_type, headers=headers)
 
@@ -204,17 +319,22 @@ async def upload_image(request: Request):
     if not story_id or not scene_id or not image:
         raise HTTPException(status_code=400, detail="story_id, scene_id, and image are required")
     image_bytes = base64.b64decode(extract_base64_from_data_url(image))
-    data_dir = Path(os.getenv("DATA_DIR", "/story")) / \
-            story_id
-    image_dir = data_dir / "images"
-    image_dir.mkdir(parents=True, exist_ok=True)
-    image_path = image_dir / f"{scene_id}.png"
-    if image_path.exists():
-        os.remove(image_path)
-    with open(image_path, "wb") as img_file:
-        img_file.write(image_bytes)
-    print(f"Image saved to {image_path}")
-    return {"success": True, "filename": f"{scene_id}.png"}
+    try:
+        info = ingest_image(
+            story_id=story_id,
+            scene_id=scene_id,
+            image_bytes=image_bytes,
+            width=data.get("width"),
+            height=data.get("height"),
+            fit=data.get("fit")
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        print(f"Image ingest failed: {str(e)}")
+        raise HTTPException(status_code=400, detail=f"Invalid image: {str(e)}")
+    print(f"Image saved for scene {scene_id}")
+    return {"success": True, "filename": f"{scene_id}.png", "metadata": info}
 
 @app.post("/upload/audio")
 async def upload_audio(request: Request):
@@ -252,7 +372,13 @@ async def upload_audio(request: Request):
         audio_file.write(audio_bytes)
     
     print(f"Audio saved to {audio_path}")
-    return {"success": True, "filename": f"{scene_id}{file_ext}"}
+    record_file(audio_path, NARRATION, params={"source": "upload"}, scene_id=scene_id)
+    try_generate_waveform(audio_path)
+    return {
+        "success": True,
+        "filename": f"{scene_id}{file_ext}",
+        "waveform_url": waveform_url(story_id, f"{scene_id}{file_ext}")
+    }
 
 @app.post("/generate/image", response_model=ImageGenerationResponse)
 async def generate_image(request: ImageGenerationRequest):
@@ -276,6 +402,45 @@ async def generate_image(request: ImageGenerationRequest):
             raise HTTPException(
                 status_code=400, detail="scene_id is required")
 
+        similar = []
+        reusable = []
+        try:
+            if request.suggest_threshold is not None:
+                # Suggestions stay within the story; other stories' images are not theirs to show
+                similar = get_prompt_index().query(
+                    request.visual_prompt,
+                    request.negative_prompt,
+                    threshold=request.suggest_threshold,
+                    where={"story_id": request.story_id}
+                )
+            if request.reuse_threshold is not None:
+                # Only an image rendered for the same story, size and reference scene can stand in
+                reusable = get_prompt_index().query(
+                    request.visual_prompt,
+                    request.negative_prompt,
+                    threshold=request.reuse_threshold,
+                    limit=1,
+                    where={
+                        "story_id": request.story_id,
+                        "width": request.width,
+                        "height": request.height,
+                        "reference_scene_id": request.reference_scene_id
+                    }
+                )
+        except Exception as e:
+            print(f"Prompt index lookup failed: {str(e)}")
+        for match in similar + reusable:
+            match["image_url"] = f"http://localhost:8000/files/_prompt_index/images/{match['image']}"
+
+        if reusable:
+            print(f"Reusing image {reusable[0]['id']} (similarity {reusable[0]['similarity']})")
+            return ImageGenerationResponse(
+                success=True,
+                image=get_prompt_index().load_image_base64(reusable[0]["id"]),
+                reused=True,
+                similar=similar or reusable
+            )
+
         result = generate_scene_image(
             story_id=request.story_id,
             scene_id=request.scene_id,
@@ -289,7 +454,8 @@ async def generate_image(request: ImageGenerationRequest):
 
         return ImageGenerationResponse(
             success=True,
-            image=result
+            image=result,
+            similar=similar
         )
 
     except Exception as e:
@@ -321,16 +487,24 @@ async def generate_audio(request: AudioGenerationRequest):
         # Simulate audio generation process
         file_path = data_dir / f"{request.scene_id}.mp3"
 
-        filename, duration = generate_tts(request.text,
+        # voice_settings.chunked splits long narrations into sentence chunks synthesized in parallel
+        tts = generate_tts_chunked if request.voice_settings.get("chunked", False) else generate_tts
+        filename, duration = tts(request.text,
                      file_path,
                      voice=request.voice_settings.get("voice", "coral"),
-                     instruction=request.voice_settings.get("instruction", "")
+                     instruction=request.voice_settings.get("instruction", ""),
+                     use_cache=not request.voice_settings.get("force_regenerate", False)
                      )
+        record_file(file_path, NARRATION, params=narration_params(request.text, request.voice_settings),
+                    scene_id=request.scene_id)
+
+        try_generate_waveform(file_path)
 
         return AudioGenerationResponse(
             success=True,
             audio_url=f"http://localhost:8000/files/{request.story_id}/audios/{request.scene_id}.mp3",
-            duration=duration
+            duration=duration,
+            waveform_url=waveform_url(request.story_id, f"{request.scene_id}.mp3")
         )
 
     except Exception as e:
@@ -338,6 +512,55 @@ async def generate_audio(request: AudioGenerationRequest):
         raise HTTPException(
             status_code=500, detail=f"Audio generation failed: {str(e)}")
 
+@app.post("/generate/audio/stream")
+async def generate_audio_stream(request: AudioGenerationRequest):
+    """
+    Generate narration and stream it to the client while it is being synthesized.
+
+    The audio is written to the scene's audio file at the same time, so once the
+    stream ends the file is available at the URL given in X-Audio-Url.
+    """
+    if not request.text:
+        raise HTTPException(status_code=400, detail="Text input is required")
+
+    audio_dir = Path(os.getenv("DATA_DIR", "/story")) / request.story_id / "audios"
+    audio_dir.mkdir(parents=True, exist_ok=True)
+    file_path = audio_dir / f"{request.scene_id}.mp3"
+
+    chunks = stream_tts(
+        request.text,
+        str(file_path),
+        voice=request.voice_settings.get("voice", "coral"),
+        instruction=request.voice_settings.get("instruction", ""),
+        use_cache=not request.voice_settings.get("force_regenerate", False)
+    )
+    try:
+        # Pull the first chunk eagerly so API errors still surface as HTTP errors; the TTS
+        # request blocks until the provider answers, so it runs off the event loop
+        first_chunk = await run_in_threadpool(next, chunks, b"")
+    except Exception as e:
+        print(f"Audio generation failed: {str(e)}")
+        raise HTTPException(
+            status_code=500, detail=f"Audio generation failed: {str(e)}")
+
+    def audio_stream():
+        yield first_chunk
+        yield from chunks
+        # The file is complete once the stream is exhausted
+        params = narration_params(request.text, {**request.voice_settings, "chunked": False})
+        record_file(file_path, NARRATION, params=params, scene_id=request.scene_id)
+        try_generate_waveform(file_path)
+
+    return StreamingResponse(
+        audio_stream(),
+        media_type="audio/mpeg",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Audio-Url": f"http://localhost:8000/files/{request.story_id}/audios/{request.scene_id}.mp3",
+            "X-Waveform-Url": waveform_url(request.story_id, f"{request.scene_id}.mp3")
+        }
+    )
+
 @app.post("/enhance/audio", response_model=AudioEnhancementResponse)
 async def enhance_audio_endpoint(request: AudioEnhancementRequest):
     """
@@ -370,21 +593,35 @@ async def enhance_audio_endpoint(request: AudioEnhancementRequest):
         enhanced_filename = f"enhanced_{base_name}.mp3"
         output_audio_path = data_dir / enhanced_filename
 
-        # Get audio analysis
-        analysis = get_audio_analysis(str(input_audio_path))
+        # Decode from the scene's lossless master when there is one
+        source_path = mezzanine_source(input_audio_path)
 
-        # Enhance the audio
-        enhance_audio(
-            str(input_audio_path), 
-            str(output_audio_path), 
-            request.settings
+        # Get audio analysis
+        analysis = get_audio_analysis(source_path)
+
+        # Enhance the audio, reusing a cached render of the same input and settings
+        cache = get_enhancement_cache()
+        if request.force_regenerate:
+            cache.invalidate(source_path, request.settings)
+        variant_key, cached = cache.get_or_create(
+            source_path,
+            str(output_audio_path),
+            request.settings,
+            lambda source, target: enhance_audio(source, target, request.settings),
+            story_id=request.story_id,
+            scene_id=request.scene_id
         )
+        try_generate_waveform(output_audio_path)
 
         return AudioEnhancementResponse(
             success=True,
             filename=enhanced_filename,
-            message="Audio enhanced successfully",
-            analysis=analysis
+            message="Audio enhanced successfully" + (" (cached)" if cached else ""),
+            analysis=analysis,
+            cached=cached,
+            variant_key=variant_key,
+            variant_url=f"http://localhost:8000/files/_enhance_cache/audios/{variant_key}.mp3",
+            waveform_url=waveform_url(request.story_id, enhanced_filename)
         )
 
     except HTTPException:
@@ -398,6 +635,42 @@ async def enhance_audio_endpoint(request: AudioEnhancementRequest):
             detail=f"Audio enhancement failed: {str(e)}"
         )
 
+@app.get("/enhance/audio/variants/{story_id}/{scene_id}")
+async def list_enhancement_variants(story_id: str, scene_id: str):
+    """List the cached enhancement variants of a scene, most recently used first"""
+    variants = get_enhancement_cache().list_variants(story_id, scene_id)
+    for variant in variants:
+        variant["variant_url"] = f"http://localhost:8000/files/_enhance_cache/audios/{variant['key']}.mp3"
+    return {"success": True, "variants": variants}
+
+@app.post("/enhance/audio/batch")
+async def batch_enhance_audio(request: BatchEnhancementRequest):
+    """
+    Enhance all scenes of a story to a common loudness target in one parallel job.
+    Returns the summary report, also saved as audios/enhance_report.json.
+    """
+    try:
+        # The job runs for as long as the whole story takes, so it must not hold the event loop
+        report = await run_in_threadpool(
+            batch_enhance_story,
+            request.story_id,
+            request.settings,
+            scene_ids=request.scene_ids,
+            scene_settings=request.scene_settings,
+            target_lufs=request.target_lufs,
+            peak_ceiling=request.peak_ceiling
+        )
+        for scene in report["scenes"]:
+            scene["audio_url"] = f"http://localhost:8000/files/{request.story_id}/audios/{scene['filename']}"
+            scene["waveform_url"] = waveform_url(request.story_id, scene["filename"])
+        return {"success": True, "report": report}
+
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        print(f"Batch audio enhancement failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Batch audio enhancement failed: {str(e)}")
+
 @app.post("/generate/video", response_model=VideoGenerationResponse)
 async def generate_video(request: VideoGenerationRequest):
     """
@@ -428,33 +701,82 @@ async def generate_video(request: VideoGenerationRequest):
         audio_path = data_dir / "audios" / f"{request.scene_id}.mp3"
         print(f"Audio path is {audio_path}, exists: {audio_path.exists()}")
         print(f"Video will be saved to {video_path}")
+        params = {
+            "animation_type": request.animation_type,
+            "animation": request.animation,
+            "ffmpeg_command": request.ffmpeg_command,
+        }
         if request.animation_type == 'single-frame':
-            create_video_with_ffmpeg(
-                image_path=str(image_path),
-                audio_path=str(audio_path),
-                animation_str=request.animation,
-                output_path=str(video_path)
-            )
-            print(f"single-frame video generation process completed.")
+            def render():
+                create_video_with_ffmpeg(
+                    image_path=str(image_path),
+                    audio_path=mezzanine_source(audio_path),
+                    animation_str=request.animation,
+                    output_path=str(video_path)
+                )
+                print(f"single-frame video generation process completed.")
+        elif request.animation_type == 'kenburns':
+            if not request.kenburns:
+                raise HTTPException(
+                    status_code=400, detail="kenburns settings are required for a kenburns animation")
+            params["kenburns"] = request.kenburns
+
+            def render():
+                create_kenburns_video(
+                    image_path=str(image_path),
+                    audio_path=mezzanine_source(audio_path),
+                    settings=request.kenburns,
+                    output_path=str(video_path)
+                )
         else:
             frame_images = [frame.uploadedImageData for frame in request.frames if frame.uploadedImageData]
             if not frame_images:
                 raise HTTPException(
                     status_code=400, detail="At least one frame image is required for multi-frame animation")
-            create_video_with_ffmpeg_multi_frame(
-                scene_id=request.scene_id,
-                image_path=str(image_path),
-                frame_images=frame_images,
-                audio_path=str(audio_path),
-                ffmpeg_command=request.ffmpeg_command,
-                output_path=str(video_path)
-            )
-            print(f"multi-frame video generation process completed.")
+            # Frames arrive inline, so they are tracked by hash as render parameters
+            params["frames"] = [hashlib.sha256(frame.encode("utf-8")).hexdigest() for frame in frame_images]
+
+            def render():
+                create_video_with_ffmpeg_multi_frame(
+                    scene_id=request.scene_id,
+                    image_path=str(image_path),
+                    frame_images=frame_images,
+                    audio_path=str(audio_path),
+                    ffmpeg_command=request.ffmpeg_command,
+                    output_path=str(video_path)
+                )
+                print(f"multi-frame video generation process completed.")
+
+        remuxed = False
+
+        def remux():
+            # Narration-only changes keep the encoded picture and swap the audio track
+            nonlocal remuxed
+            replace_video_audio(str(video_path), mezzanine_source(audio_path))
+            remuxed = True
+
+        cached = render_if_stale(
+            request.story_id,
+            f"videos/{request.scene_id}.mp4",
+            SCENE_VIDEO,
+            scene_video_inputs(request.scene_id),
+            scene_video_params(request.story_id, request.scene_id, params),
+            render,
+            scene_id=request.scene_id,
+            force=request.force_regenerate,
+            partial={f"audios/{request.scene_id}.mp3": remux}
+        )
+        ensure_previews(video_path)
 
         return VideoGenerationResponse(
             success=True,
-            video_url=f"http://localhost:8000/files/{request.story_id}/videos/{request.scene_id}.mp4"
+            video_url=f"http://localhost:8000/files/{request.story_id}/videos/{request.scene_id}.mp4",
+            cached=cached,
+            remuxed=remuxed,
+            **preview_urls(request.story_id, video_path)
         )
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Video generation failed: {str(e)}")
         raise HTTPException(
@@ -464,16 +786,124 @@ async def generate_video(request: VideoGenerationRequest):
 async def generate_visual_prompt(request: VisualPromptGenerationRequest):
     """
     Generate a visual prompt from a story snippet
+
+    With stream=true the response is a Server-Sent Events stream of "token"
+    events as the model produces them, followed by a "done" event carrying the
+    final sanitized prompt (or an "error" event).
     """
+    if request.stream:
+        def event_stream():
+            try:
+                for event, text in stream_text(
+                    prompt=request.text,
+                    reference=request.previous_reference,
+                    genre=request.genre,
+                    force_regenerate=request.force_regenerate
+                ):
+                    if event == "token":
+                        yield format_sse("token", {"token": text})
+                    else:
+                        yield format_sse("done", {"success": True, "visual_prompt": text})
+            except Exception as e:
+                print(f"Visual prompt streaming failed: {str(e)}")
+                yield format_sse("error", {"success": False, "detail": str(e)})
+
+        return StreamingResponse(
+            event_stream(),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+
     visual_prompt = generate_text(
         prompt=request.text,
-        reference=request.previous_reference
+        reference=request.previous_reference,
+        genre=request.genre,
+        force_regenerate=request.force_regenerate
     )
     return VisualPromptResponse(
         success=True,
         visual_prompt=visual_prompt
     )
 
+@app.post("/generate/visual/prompts")
+async def generate_story_visual_prompts_endpoint(request: StoryVisualPromptRequest):
+    """
+    Generate visual prompts for every scene of a story in a few batched LLM calls.
+
+    Streams Server-Sent Events: one "prompt" event per scene as soon as it is
+    parsed, then a "done" event with all prompts in scene order (or "error").
+    """
+    if not request.scenes:
+        raise HTTPException(status_code=400, detail="scenes must be a non-empty list")
+    if request.batch_size < 1:
+        raise HTTPException(status_code=400, detail="batch_size must be at least 1")
+    scene_ids = [scene.scene_id for scene in request.scenes]
+    if len(set(scene_ids)) != len(scene_ids):
+        # The model answers per scene_id, so duplicates could not be told apart
+        raise HTTPException(status_code=400, detail="scene_id values must be unique")
+
+    def event_stream():
+        prompts = [None] * len(request.scenes)
+        try:
+            for item in generate_story_visual_prompts(
+                scenes=[scene.model_dump() for scene in request.scenes],
+                reference=request.previous_reference,
+                genre=request.genre,
+                batch_size=request.batch_size
+            ):
+                prompts[item["index"]] = item["visual_prompt"]
+                yield format_sse("prompt", item)
+            yield format_sse("done", {
+                "success": True,
+                "prompts": [
+                    {"scene_id": scene.scene_id, "visual_prompt": prompt}
+                    for scene, prompt in zip(request.scenes, prompts)
+                ]
+            })
+        except Exception as e:
+            print(f"Story visual prompt generation failed: {str(e)}")
+            yield format_sse("error", {"success": False, "detail": str(e)})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/stories/{story_id}/render")
+async def render_story(story_id: str, request: StoryRenderRequest):
+    """
+    Render a whole story (prompts, images, narration, scene videos, story.mp4)
+    as one dependency graph in the background. Poll GET on the same path for
+    per-node status.
+    """
+    if not request.scenes:
+        raise HTTPException(status_code=400, detail="scenes must be a non-empty list")
+    try:
+        render = start_story_render(
+            story_id,
+            [scene.model_dump() for scene in request.scenes],
+            request.model_dump(exclude={"scenes"})
+        )
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        print(f"Story render failed to start: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Story render failed to start: {str(e)}")
+    return {
+        "success": True,
+        "status_url": f"http://localhost:8000/stories/{story_id}/render",
+        "nodes": len(render.nodes)
+    }
+
+@app.get("/stories/{story_id}/render")
+async def render_story_status(story_id: str):
+    """Per-node status of the story's current or last render"""
+    state = get_render_status(story_id)
+    if state is None:
+        raise HTTPException(status_code=404, detail=f"No render found for story {story_id}")
+    return {"success": True, **state}
+
 @app.post("/accumulate", response_model=None)
 async def accumulate(request: AccumulateRequest):
     """
@@ -492,21 +922,43 @@ async def accumulate(request: AccumulateRequest):
             raise HTTPException(
                 status_code=400, detail="scenes must be a non-empty list")
         data_dir = Path(os.getenv("DATA_DIR", "/story")) / request.story_id
-        video_paths = []
-        for scene_id in request.scenes:
-            video_file = data_dir / "videos" / f"{scene_id}.mp4"
-            if not video_file.exists():
-                raise HTTPException(
-                    status_code=404, detail=f"Video file not found for scene_id: {scene_id}")
-            video_paths.append(str(video_file))
         output_path = data_dir / "story.mp4"
-        # Delete the output file if it exists
-        if output_path.exists():
-            output_path.unlink()
-        merge_videos(video_paths, str(output_path), width=request.width, height=request.height)
+
+        if request.renderer == "timeline":
+            # Straight from images and narration; scene videos are only needed for multi-frame scenes
+            try:
+                timeline = build_timeline(request.story_id, request.scenes, request.animations)
+            except FileNotFoundError as e:
+                raise HTTPException(status_code=404, detail=str(e))
+            inputs = timeline_inputs(timeline)
+            params = {"renderer": "timeline", "timeline": timeline,
+                      "width": request.width, "height": request.height}
+
+            def render():
+                render_timeline(request.story_id, timeline, output_path, request.width, request.height)
+        else:
+            video_paths = []
+            for scene_id in request.scenes:
+                video_file = data_dir / "videos" / f"{scene_id}.mp4"
+                if not video_file.exists():
+                    raise HTTPException(
+                        status_code=404, detail=f"Video file not found for scene_id: {scene_id}")
+                video_paths.append(str(video_file))
+            inputs = story_video_inputs(request.scenes)
+            params = {"scenes": request.scenes, "width": request.width, "height": request.height}
+
+            def render():
+                # Delete the output file if it exists
+                if output_path.exists():
+                    output_path.unlink()
+                merge_videos(video_paths, str(output_path), width=request.width, height=request.height)
+
+        render_if_stale(request.story_id, "story.mp4", STORY_VIDEO, inputs, params, render)
 
         if not output_path.exists():
             raise HTTPException(status_code=500, detail="Merged video file not found after processing.")
+        ensure_previews(output_path)
+        urls = preview_urls(request.story_id, output_path)
 
         return FileResponse(
             path=str(output_path),
@@ -515,10 +967,13 @@ async def accumulate(request: AccumulateRequest):
             headers={
                 "X-Debug-Story-Id": request.story_id,
                 "X-Debug-Scenes": ",".join(request.scenes),
-                "X-Debug-File-Path": str(output_path)
+                "X-Debug-File-Path": str(output_path),
+                **{f"X-{field[:-4].capitalize()}-Url": url for field, url in urls.items()}
             }
         )
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Accumulation failed: {str(e)}")
@@ -550,109 +1005,246 @@ async def init_story(request: InitRequest):
         video_dir = data_dir / "videos"
         video_dir.mkdir(parents=True, exist_ok=True)
 
+        settings = save_story_settings(request.story_id, {
+            "width": request.width,
+            "height": request.height,
+            "fit": request.fit
+        })
+
         return GenerationResponse(
             success=True,
-            message=f"Story '{request.story_id}' initialized successfully"
+            message=f"Story '{request.story_id}' initialized successfully",
+            metadata={"settings": settings}
         )
 
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Story initialization failed: {str(e)}")
 
-@app.post("/generate/audio/mix")
-async def mix_audio(request: Request):
+async def parse_mix_form(request: Request):
     """
-    Mix base audio with overlay tracks
+    Read the multipart mix form shared by /generate/audio/mix and /preview/audio/mix.
     Handles dynamic form field names: overlay_file_0, overlay_file_1, etc.
     and track_config_0, track_config_1, etc.
+    A track config may carry "asset_hash" (sha256 returned by an earlier mix)
+    instead of a matching overlay_file, so unchanged overlays aren't re-sent.
+
+    Returns (metadata, audio_dir, processed_tracks, assets).
+    """
+    form_data = await request.form()
+
+    # Get metadata
+    metadata_str = form_data.get("metadata")
+    if not metadata_str:
+        raise HTTPException(status_code=400, detail="metadata is required")
+
+    meta = json.loads(metadata_str)
+    print(f"Mixing audio for story_id: {meta.get('story_id')}")
+
+    story_id = meta.get("story_id")
+    if not story_id:
+        raise HTTPException(status_code=400, detail="story_id is required in metadata")
+
+    scene_id = meta.get("scene_id")
+    if not scene_id:
+        raise HTTPException(status_code=400, detail="scene_id is required in metadata")
+
+    data_dir = Path(os.getenv("DATA_DIR", "/story")) / story_id
+    audio_dir = data_dir / "audios"
+    audio_dir.mkdir(parents=True, exist_ok=True)
+
+    # Extract overlay files and configs by matching field name patterns
+    overlay_files = {}
+    track_configs = {}
+
+    for field_name, field_value in form_data.items():
+        if field_name.startswith("overlay_file_"):
+            index = field_name.split("_")[-1]  # Get index from overlay_file_0, overlay_file_1, etc.
+            overlay_files[index] = field_value
+        elif field_name.startswith("track_config_"):
+            index = field_name.split("_")[-1]  # Get index from track_config_0, track_config_1, etc.
+            track_configs[index] = field_value
+
+    # Process uploaded overlay files and their configs
+    processed_tracks = []
+    assets = []
+
+    for index in sorted(track_configs.keys()):
+        config = json.loads(track_configs[index])
+        file = overlay_files.get(index)
+
+        if file is not None:
+            # Stream the upload into the story's content-addressed asset store
+            asset = await store_upload(story_id, file)
+            file_path = get_asset_path(story_id, asset["hash"])
+            print(f"Processing file: {file.filename} ({asset['hash'][:12]}) with config: {config}")
+        elif config.get("asset_hash"):
+            # Overlay uploaded earlier; the client only sends its hash
+            file_path = get_asset_path(story_id, config["asset_hash"])
+            if file_path is None:
+                raise HTTPException(
+                    status_code=404, detail=f"Unknown overlay asset: {config['asset_hash']}")
+            asset = {"hash": config["asset_hash"], "deduplicated": True}
+            print(f"Processing stored asset {config['asset_hash'][:12]} with config: {config}")
+        else:
+            continue
+
+        assets.append({"index": index, "hash": asset["hash"], "deduplicated": asset["deduplicated"]})
+        processed_tracks.append({
+            "file_path": str(file_path),
+            "config": config,
+            "index": index
+        })
+
+    return meta, audio_dir, processed_tracks, assets
+
+@app.post("/generate/audio/mix")
+async def mix_audio(request: Request):
+    """
+    Mix base audio with overlay tracks (see parse_mix_form for the form layout)
     """
     try:
-        form_data = await request.form()
-        
-        # Get metadata
-        metadata_str = form_data.get("metadata")
-        if not metadata_str:
-            raise HTTPException(status_code=400, detail="metadata is required")
-        
-        meta = json.loads(metadata_str)
-        print(f"Mixing audio for story_id: {meta.get('story_id')}")
-        
-        story_id = meta.get("story_id")
-        if not story_id:
-            raise HTTPException(status_code=400, detail="story_id is required in metadata")
-        
-        scene_id = meta.get("scene_id")
-        if not scene_id:
-            raise HTTPException(status_code=400, detail="scene_id is required in metadata")
+        meta, audio_dir, processed_tracks, assets = await parse_mix_form(request)
+        story_id = meta["story_id"]
+        scene_id = meta["scene_id"]
 
         # Get base audio info
         output_format = meta.get("output_format", "mp3")
         normalize = meta.get("normalize", True)
         export_quality = meta.get("export_quality", "high")
 
-        data_dir = Path(os.getenv("DATA_DIR", "/story")) / story_id
-        audio_dir = data_dir / "audios"
-        audio_dir.mkdir(parents=True, exist_ok=True)
-
         audio_file = audio_dir / f"{scene_id}.mp3"
 
-        # Extract overlay files and configs by matching field name patterns
-        overlay_files = {}
-        track_configs = {}
-        
-        for field_name, field_value in form_data.items():
-            if field_name.startswith("overlay_file_"):
-                index = field_name.split("_")[-1]  # Get index from overlay_file_0, overlay_file_1, etc.
-                overlay_files[index] = field_value
-            elif field_name.startswith("track_config_"):
-                index = field_name.split("_")[-1]  # Get index from track_config_0, track_config_1, etc.
-                track_configs[index] = field_value
-        
-        # Process uploaded overlay files and their configs
-        processed_tracks = []
-        
-        for index in sorted(overlay_files.keys()):
-            if index in track_configs:
-                file = overlay_files[index]
-                config_str = track_configs[index]
-                config = json.loads(config_str)
-                
-                print(f"Processing file: {file.filename} with config: {config}")
-                
-                # Save the uploaded file temporarily
-                file_path = audio_dir / f"overlay_{scene_id}_{index}_{file.filename}"
-                audio_data = await file.read()
-                with open(file_path, "wb") as f:
-                    f.write(audio_data)
-                
-                processed_tracks.append({
-                    "file_path": str(file_path),
-                    "config": config,
-                    "index": index
-                })
         output_file = str(audio_dir / f"{scene_id}_mixed.{output_format}")
         # Delete the output file if it exists
         if os.path.exists(output_file):
             os.remove(output_file)
-        mix_audio_tracks(base_audio=str(audio_file),
-                  processed_tracks=processed_tracks,
-                  output_file=output_file,
-                  normalize=normalize,
-                  export_format=output_format)
+        if mezzanine_enabled() and output_format == "mp3":
+            # Mix from the scene's master into a new master; the MP3 is encoded from it once
+            write_master(output_file, lambda master: mix_audio_tracks(
+                base_audio=mezzanine_source(audio_file),
+                processed_tracks=processed_tracks,
+                output_file=master,
+                normalize=normalize,
+                export_format=MEZZANINE_FORMAT,
+                output_options=MEZZANINE_OPTIONS))
+        else:
+            mix_audio_tracks(base_audio=str(audio_file),
+                      processed_tracks=processed_tracks,
+                      output_file=output_file,
+                      normalize=normalize,
+                      export_format=output_format)
 
         print(f"Successfully processed {len(processed_tracks)} overlay tracks")
         print(f"Mixed audio saved to: {output_file}")
+        try_generate_waveform(output_file)
         return {
             "success": True,
-            "mixed_audio_url": f"http://localhost:8000/files/{story_id}/audios/{scene_id}_mixed.{output_format}"
+            "mixed_audio_url": f"http://localhost:8000/files/{story_id}/audios/{scene_id}_mixed.{output_format}",
+            "waveform_url": waveform_url(story_id, f"{scene_id}_mixed.{output_format}"),
+            "assets": assets
         }
         
+    except HTTPException:
+        raise
     except json.JSONDecodeError as e:
         raise HTTPException(status_code=400, detail=f"Invalid JSON in metadata or track config: {str(e)}")
     except Exception as e:
         print(f"Audio mixing failed: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Audio mixing failed: {str(e)}")
-        
+
+@app.post("/preview/audio/mix")
+async def preview_mix_audio(request: Request):
+    """
+    Render a short low-bitrate window of a mix for slider tuning.
+    Same form as /generate/audio/mix; metadata adds preview_start and
+    preview_duration (seconds, default 0 and 10).
+    """
+    try:
+        meta, audio_dir, processed_tracks, assets = await parse_mix_form(request)
+        story_id = meta["story_id"]
+        scene_id = meta["scene_id"]
+        start = max(float(meta.get("preview_start", 0)), 0.0)
+        duration = float(meta.get("preview_duration", PREVIEW_WINDOW_SECONDS))
+        if duration <= 0:
+            raise HTTPException(status_code=400, detail="preview_duration must be positive")
+        duration = min(duration, MAX_PREVIEW_SECONDS)
+
+        preview_name = f"preview_{scene_id}_mix.mp3"
+        base_audio = str(audio_dir / f"{scene_id}.mp3")
+        normalize = meta.get("normalize", True)
+        mix_tracks(
+            base_audio,
+            processed_tracks,
+            str(audio_dir / preview_name),
+            normalize=normalize,
+            export_format="mp3",
+            bitrate=PREVIEW_BITRATE,
+            start=start,
+            duration=duration,
+            # The window is normalized like the final mix, not to its own peak
+            peak=mix_peak(base_audio, processed_tracks) if normalize else None
+        )
+        return {
+            "success": True,
+            "preview_url": f"http://localhost:8000/files/{story_id}/audios/{preview_name}",
+            "start": start,
+            "duration": duration,
+            "assets": assets
+        }
+
+    except HTTPException:
+        raise
+    except json.JSONDecodeError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid JSON in metadata or track config: {str(e)}")
+    except Exception as e:
+        print(f"Mix preview failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Mix preview failed: {str(e)}")
+
+@app.post("/preview/audio/enhance", response_model=AudioPreviewResponse)
+async def preview_enhance_audio(request: AudioEnhancementPreviewRequest):
+    """
+    Render a short low-bitrate window of an enhancement chain for slider tuning
+    """
+    try:
+        data_dir = Path(os.getenv("DATA_DIR", "/story")) / request.story_id / "audios"
+        input_audio_path = data_dir / request.audio_filename
+        if not input_audio_path.exists():
+            raise HTTPException(
+                status_code=404,
+                detail=f"Audio file not found: {request.audio_filename}"
+            )
+
+        if request.duration <= 0:
+            raise HTTPException(status_code=400, detail="duration must be positive")
+        start = max(request.start, 0.0)
+        duration = min(request.duration, MAX_PREVIEW_SECONDS)
+        preview_name = f"preview_{Path(request.audio_filename).stem}_enhanced.mp3"
+        create_enhancement_preview(
+            str(input_audio_path),
+            str(data_dir / preview_name),
+            request.settings,
+            start_time_ms=int(start * 1000),
+            duration_ms=int(duration * 1000)
+        )
+        return AudioPreviewResponse(
+            success=True,
+            preview_url=f"http://localhost:8000/files/{request.story_id}/audios/{preview_name}",
+            start=start,
+            duration=duration
+        )
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Enhancement preview failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Enhancement preview failed: {str(e)}")
+
+@app.get("/assets/{story_id}")
+async def get_story_assets(story_id: str):
+    """List the story's content-addressed assets keyed by sha256, so clients can skip re-uploads"""
+    return {"success": True, "assets": list_assets(story_id)}
+
 @app.post("/generate/audio/accept")
 async def accept_mixed_audio(request: Request):
     """Accept mixed audio and finalize changes"""
@@ -673,14 +1265,38 @@ async def accept_mixed_audio(request: Request):
         if final_audio_file.exists():
             final_audio_file.unlink()
         mixed_audio_file.rename(final_audio_file)
+        move_master(mixed_audio_file, final_audio_file)
+        record_file(final_audio_file, NARRATION, params={"source": "mix"}, scene_id=scene_id)
+        # The mixed waveform describes the same content, so it moves along with the audio and is only recorded
+        mixed_waveform = waveform_path(mixed_audio_file)
+        if mixed_waveform.exists():
+            os.replace(mixed_waveform, waveform_path(final_audio_file))
+        try_generate_waveform(final_audio_file)
         # Simulate acceptance process
         print(f"Accepting mixed audio for Story ID: {story_id}, Scene ID: {scene_id}")
-        return {"success": True}
+        stale = stale_artifacts(story_id, scene_id)
+        for artifact in stale:
+            print(f"{artifact['artifact']} is now stale: {', '.join(artifact['reasons'])}")
+        return {"success": True, "stale": stale}
 
     except Exception as e:
         print(f"Error accepting mixed audio: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error accepting mixed audio: {str(e)}")
 
+@app.get("/stories/{story_id}/status")
+async def get_story_status(story_id: str):
+    """Which scenes have images, audio and videos, and which videos are stale, from the story manifest"""
+    return {"success": True, **story_status(story_id)}
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """Report size and hit-rate metrics of the server-side caches"""
+    return {
+        "visual_prompt": get_text_cache_stats(),
+        "tts": get_narration_cache().stats(),
+        "enhancement": get_enhancement_cache().stats()
+    }
+
 # Health check endpoint
 @app.get("/health")
 async def health_check():
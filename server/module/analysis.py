@@ -0,0 +1,267 @@
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+
+import numpy as np
+
+from module.mixer import iter_audio_blocks, probe_audio
+from module.util import content_hash
+
+CACHE_NAME = "_analysis_cache"
+ANALYSIS_VERSION = 2  # Bump when the result format changes to invalidate cached results
+
+ANALYSIS_RATE = 48000  # K-weighting coefficients below are defined at 48 kHz (ITU-R BS.1770)
+BLOCK_FRAMES = 10 * ANALYSIS_RATE  # Multiple of the 100 ms gating hop
+GATE_HOP = ANALYSIS_RATE // 10  # 100 ms; 400 ms gating blocks overlap by 75%
+ABSOLUTE_GATE_LUFS = -70.0
+RELATIVE_GATE_LU = -10.0
+
+TRUE_PEAK_OVERSAMPLE = 4
+TRUE_PEAK_TAPS = 12  # Taps per interpolation phase
+
+CLIP_LEVEL = 0.999
+SILENCE_WINDOW = ANALYSIS_RATE // 20  # 50 ms
+SILENCE_THRESHOLD_DB = -50.0
+MIN_SILENCE_SECONDS = 0.5
+
+# Pre-filter (high shelf) and RLB high-pass of the K-weighting curve at 48 kHz
+K_WEIGHTING = (
+    "biquad=b0=1.53512485958697:b1=-2.69169618940638:b2=1.19839281085285"
+    ":a0=1:a1=-1.69065929318241:a2=0.73248077421585",
+    "biquad=b0=1.0:b1=-2.0:b2=1.0:a0=1:a1=-1.99004745483398:a2=0.99007225036621"
+)
+# Each channel is duplicated and only the copies are K-weighted: layout, duplication, weighted channels.
+# The layouts are ffmpeg's defaults for 2 and 4 channels, so the backend's final conversion keeps them as is.
+MEASURE_LAYOUTS = {
+    1: ("mono", "pan=stereo|c0=c0|c1=c0", "FR"),
+    2: ("stereo", "pan=4.0|c0=c0|c1=c1|c2=c0|c3=c1", "FC+BC"),
+}
+
+
+def _to_db(value: float):
+    """Level in dB rounded for reporting; None for digital silence (JSON has no -inf)."""
+    return round(float(20 * np.log10(value)), 2) if value > 0 else None
+
+
+class TruePeakMeter:
+    """
+    Streaming 4x oversampled peak (BS.1770 style): three windowed-sinc FIR
+    phases interpolate between samples; the last taps of each block are
+    carried over so block boundaries are measured with full filter support.
+    """
+
+    def __init__(self, channels: int):
+        half = TRUE_PEAK_TAPS // 2
+        offsets = np.arange(-half + 1, half + 1)
+        window = np.kaiser(TRUE_PEAK_TAPS, 5.0)
+        self.phases = [
+            (np.sinc(offsets - p / TRUE_PEAK_OVERSAMPLE) * window)[::-1]
+            for p in range(1, TRUE_PEAK_OVERSAMPLE)
+        ]
+        self.carry = np.zeros((half - 1, channels), dtype=np.float32)
+        self.peak = 0.0
+
+    def update(self, samples: np.ndarray):
+        buffer = np.concatenate([self.carry, samples])
+        if len(buffer) >= TRUE_PEAK_TAPS:
+            for channel in buffer.T:
+                for taps in self.phases:
+                    interpolated = np.convolve(channel, taps, mode="valid")
+                    self.peak = max(self.peak, float(np.abs(interpolated).max()))
+        self.peak = max(self.peak, float(np.abs(samples).max(initial=0.0)))
+        self.carry = buffer[-(TRUE_PEAK_TAPS - 1):]
+
+    def finish(self) -> float:
+        self.update(np.zeros((TRUE_PEAK_TAPS // 2, self.carry.shape[1]), dtype=np.float32))
+        return self.peak
+
+
+def analyze_audio_stream(audio_file_path: str, pre_filters: list = None) -> dict:
+    """
+    Measure an audio file in one streamed pass.
+
+    The media backend decodes to 48 kHz float32 and, through a filter chain
+    that duplicates every channel and K-weights the copies, each block carries
+    both the plain and the weighted signal. NumPy then accumulates, per block:
+    sample/true peak, sum of squares (RMS), clipped samples, 50 ms silence
+    windows and 100 ms K-weighted mean squares for the gated integrated loudness.
+
+    ``pre_filters`` (ffmpeg audio filters) are applied before measuring, which
+    lets callers measure what a processing chain would produce without
+    rendering it to disk.
+    """
+    info = probe_audio(audio_file_path)
+    # Surround sources are measured as a stereo downmix
+    channels = min(info["channels"], 2)
+    layout, duplicate, weighted_channels = MEASURE_LAYOUTS[channels]
+    filters = [
+        *(pre_filters or []),
+        f"aresample={ANALYSIS_RATE}",
+        f"aformat=sample_fmts=flt:channel_layouts={layout}",
+        duplicate,
+        *(f"{biquad}:c={weighted_channels}" for biquad in K_WEIGHTING),
+    ]
+
+    frames = 0
+    sum_squares = 0.0
+    sample_peak = 0.0
+    clipped = 0
+    hop_powers = []
+    silence_regions = []
+    silence_start = None
+    true_peak = TruePeakMeter(channels)
+    carry_plain = np.zeros((0, channels), dtype=np.float32)
+    carry_k = np.zeros((0, channels), dtype=np.float32)
+    windows_seen = 0
+
+    for block in iter_audio_blocks(audio_file_path, ANALYSIS_RATE, channels * 2, BLOCK_FRAMES, filters=filters):
+        plain = block[:, :channels]
+        weighted = block[:, channels:]
+
+        frames += len(plain)
+        sum_squares += float(np.square(plain, dtype=np.float64).sum())
+        block_abs = np.abs(plain)
+        sample_peak = max(sample_peak, float(block_abs.max(initial=0.0)))
+        clipped += int(np.count_nonzero(block_abs >= CLIP_LEVEL))
+        true_peak.update(plain)
+
+        # Loudness: mean square of the K-weighted signal per 100 ms hop, summed over channels
+        weighted = np.concatenate([carry_k, weighted])
+        usable = len(weighted) - len(weighted) % GATE_HOP
+        hops = weighted[:usable].reshape(-1, GATE_HOP, channels)
+        hop_powers.extend(np.mean(np.square(hops, dtype=np.float64), axis=1).sum(axis=1))
+        carry_k = weighted[usable:]
+
+        # Silence: 50 ms windows below the threshold, merged into regions
+        plain = np.concatenate([carry_plain, plain])
+        usable = len(plain) - len(plain) % SILENCE_WINDOW
+        windows = plain[:usable].reshape(-1, SILENCE_WINDOW, channels)
+        rms = np.sqrt(np.mean(np.square(windows, dtype=np.float64), axis=(1, 2)))
+        quiet = rms < 10 ** (SILENCE_THRESHOLD_DB / 20)
+        carry_plain = plain[usable:]
+        edges = np.flatnonzero(np.diff(np.concatenate([[0], quiet.astype(np.int8), [0]])))
+        for begin, end in zip(edges[::2], edges[1::2]):
+            begin += windows_seen
+            end += windows_seen
+            if silence_start is not None and begin == silence_start[1]:
+                silence_start = (silence_start[0], end)  # continues the region from the last block
+                continue
+            if silence_start is not None:
+                silence_regions.append(silence_start)
+            silence_start = (begin, end)
+        windows_seen += len(quiet)
+    if silence_start is not None:
+        silence_regions.append(silence_start)
+
+    window_seconds = SILENCE_WINDOW / ANALYSIS_RATE
+    silence_regions = [
+        [round(float(begin * window_seconds), 3), round(float(end * window_seconds), 3)]
+        for begin, end in silence_regions
+        if (end - begin) * window_seconds >= MIN_SILENCE_SECONDS
+    ]
+
+    # Gated integrated loudness (BS.1770-4): 400 ms blocks = 4 consecutive 100 ms hops
+    hop_powers = np.asarray(hop_powers)
+    integrated = None
+    if len(hop_powers) >= 4:
+        block_powers = np.convolve(hop_powers, np.ones(4) / 4, mode="valid")
+        loudness = -0.691 + 10 * np.log10(np.maximum(block_powers, 1e-20))
+        gated = block_powers[loudness > ABSOLUTE_GATE_LUFS]
+        if len(gated):
+            relative_gate = -0.691 + 10 * np.log10(gated.mean()) + RELATIVE_GATE_LU
+            gated = block_powers[(loudness > ABSOLUTE_GATE_LUFS) & (loudness > relative_gate)]
+            if len(gated):
+                integrated = round(float(-0.691 + 10 * np.log10(gated.mean())), 2)
+
+    rms = float(np.sqrt(sum_squares / (frames * channels))) if frames else 0.0
+    return {
+        "duration_seconds": info["duration"] or frames / ANALYSIS_RATE,
+        "sample_rate": info["sample_rate"],
+        "channels": info["channels"],
+        "frame_count": frames,
+        "integrated_lufs": integrated,
+        "true_peak_dbtp": _to_db(true_peak.finish()),
+        "sample_peak_dbfs": _to_db(sample_peak),
+        "rms": round(rms, 6),
+        "rms_dbfs": _to_db(rms),
+        "crest_factor_db": _to_db(sample_peak / rms) if rms > 0 else None,
+        "clipped_samples": clipped,
+        "silence_regions": silence_regions,
+    }
+
+
+class AnalysisCache:
+    """
+    Analysis results keyed by the sha256 of the file content, kept in memory
+    and as JSON files so they survive restarts.
+    """
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = Path(cache_dir)
+        self._lock = threading.Lock()
+        self._results = {}
+
+    def content_hash(self, path: str) -> str:
+        return content_hash(path)
+
+    def get(self, digest: str):
+        result = self._results.get(digest)
+        if result is not None:
+            return result
+        path = self.cache_dir / f"{digest}.json"
+        if path.exists():
+            with open(path, "r", encoding="utf-8") as f:
+                result = json.load(f)
+            if result.get("version") == ANALYSIS_VERSION:
+                with self._lock:
+                    self._results[digest] = result
+                return result
+        return None
+
+    def set(self, digest: str, result: dict):
+        result = {**result, "version": ANALYSIS_VERSION}
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.cache_dir / f".{digest}.json.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(result, f)
+        os.replace(tmp_path, self.cache_dir / f"{digest}.json")
+        with self._lock:
+            self._results[digest] = result
+        return result
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_analysis_cache() -> AnalysisCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                cache_dir = os.getenv("ANALYSIS_CACHE_DIR") or \
+                    str(Path(os.getenv("DATA_DIR", "/story")) / CACHE_NAME)
+                _cache = AnalysisCache(cache_dir)
+    return _cache
+
+
+def analyze_audio(audio_file_path: str, pre_filters: list = None) -> dict:
+    """
+    Return the (cached) stream analysis of an audio file, keyed by its content
+    hash and, when measuring through a filter chain, by the chain as well.
+    """
+    cache = get_analysis_cache()
+    source_hash = cache.content_hash(audio_file_path)
+    digest = source_hash
+    if pre_filters:
+        chain = ",".join(pre_filters).encode("utf-8")
+        digest = hashlib.sha256(source_hash.encode("ascii") + b"|" + chain).hexdigest()
+    result = cache.get(digest)
+    if result is not None:
+        print(f"Audio analysis served from cache for {audio_file_path}")
+        return {**result, "cached": True}
+    result = analyze_audio_stream(audio_file_path, pre_filters=pre_filters)
+    result = cache.set(digest, {**result, "content_hash": source_hash})
+    return {**result, "cached": False}
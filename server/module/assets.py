@@ -0,0 +1,102 @@
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+ASSETS_DIR = "assets"
+INDEX_FILE = "index.json"
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # 1MB
+
+_HASH_RE = re.compile(r"^[0-9a-f]{64}$")
+_index_lock = threading.Lock()
+
+
+def _assets_dir(story_id: str) -> Path:
+    return Path(os.getenv("DATA_DIR", "/story")) / story_id / ASSETS_DIR
+
+
+def _load_index(assets_dir: Path) -> dict:
+    index_path = assets_dir / INDEX_FILE
+    if not index_path.exists():
+        return {}
+    with open(index_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _save_index(assets_dir: Path, index: dict):
+    tmp_path = assets_dir / f".{INDEX_FILE}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(index, f, indent=2)
+    os.replace(tmp_path, assets_dir / INDEX_FILE)
+
+
+def is_asset_hash(value: str) -> bool:
+    return bool(value) and bool(_HASH_RE.match(value))
+
+
+def get_asset_path(story_id: str, digest: str):
+    """Return the stored path of an asset by its sha256 hex digest, or None if unknown."""
+    if not is_asset_hash(digest):
+        return None
+    assets_dir = _assets_dir(story_id)
+    entry = _load_index(assets_dir).get(digest)
+    if not entry:
+        return None
+    path = assets_dir / entry["stored_name"]
+    return path if path.exists() else None
+
+
+def list_assets(story_id: str) -> dict:
+    return _load_index(_assets_dir(story_id))
+
+
+async def store_upload(story_id: str, upload_file) -> dict:
+    """
+    Stream an uploaded file into the story's content-addressed asset store.
+
+    The upload is read in UPLOAD_CHUNK_SIZE chunks while it is hashed and
+    written to a temp file, so it is never held in memory. If an asset with the
+    same sha256 already exists, the temp file is dropped and the existing asset
+    is reused.
+    """
+    assets_dir = _assets_dir(story_id)
+    assets_dir.mkdir(parents=True, exist_ok=True)
+    ext = os.path.splitext(upload_file.filename or "")[1].lower()
+
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=assets_dir, prefix=".upload_")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            while chunk := await upload_file.read(UPLOAD_CHUNK_SIZE):
+                digest.update(chunk)
+                f.write(chunk)
+                size += len(chunk)
+        digest = digest.hexdigest()
+
+        with _index_lock:
+            index = _load_index(assets_dir)
+            entry = index.get(digest)
+            if entry and (assets_dir / entry["stored_name"]).exists():
+                os.remove(tmp_path)
+                print(f"Asset {digest[:12]} already stored, skipping upload copy")
+                return {"hash": digest, "deduplicated": True, **entry}
+            entry = {
+                "stored_name": f"{digest}{ext}",
+                "filename": upload_file.filename,
+                "size": size,
+                "created_at": time.time(),
+            }
+            os.replace(tmp_path, assets_dir / entry["stored_name"])
+            index[digest] = entry
+            _save_index(assets_dir, index)
+        print(f"Stored asset {digest[:12]} ({size} bytes) for story {story_id}")
+        return {"hash": digest, "deduplicated": False, **entry}
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
@@ -1,152 +1,157 @@
-import subprocess
-import json
-import os
-import tempfile
 from pathlib import Path
-from pydub import AudioSegment
-from pydub.effects import normalize, compress_dynamic_range
-from pydub.playback import play
 import traceback
 
-def enhance_audio(audio_file_path: str, output_path: str, settings: dict) -> str:
+from module.analysis import analyze_audio
+from module.media import get_media_backend, PREVIEW_BITRATE
+
+NORMALIZE_TARGET_LUFS = -16
+
+def build_enhancement_filters(settings: dict, duration_s: float = None) -> list:
     """
-    Enhance audio file with various processing options using pydub and ffmpeg.
+    Compile an enhancement settings dict into an ordered list of ffmpeg audio filters.
+
+    Args:
+        settings: Dictionary containing enhancement settings
+        duration_s: Duration of the audio being processed, needed to place a fade-out
+
+    Returns:
+        List of ffmpeg filter strings, to be joined with "," for -af
+    """
+    filters = []
+
+    # Apply volume adjustment
+    if settings.get('volume', 0) != 0:
+        filters.append(f"volume={settings['volume']}dB")
+        print(f"Added volume adjustment: {settings['volume']}dB")
+
+    # Apply normalization (streaming loudness normalization instead of a peak scan)
+    if settings.get('normalize', False):
+        target = settings.get('normalizeTarget', NORMALIZE_TARGET_LUFS)
+        filters.append(f"loudnorm=I={target}:TP=-1.5:LRA=11")
+        print(f"Added loudness normalization to {target} LUFS")
+
+    # Apply dynamic range compression
+    if settings.get('compress', False):
+        filters.append("acompressor=threshold=-20dB:ratio=4:attack=5:release=50")
+        print("Added dynamic range compression")
+
+    # Apply fade effects
+    fade_in = settings.get('fadeIn', 0)
+    fade_out = settings.get('fadeOut', 0)
+
+    if fade_in > 0:
+        filters.append(f"afade=t=in:st=0:d={fade_in / 1000:.3f}")
+        print(f"Added fade-in: {fade_in}ms")
+
+    if fade_out > 0 and duration_s:
+        start = max(duration_s - fade_out / 1000, 0)
+        filters.append(f"afade=t=out:st={start:.3f}:d={fade_out / 1000:.3f}")
+        print(f"Added fade-out: {fade_out}ms")
+
+    # EQ adjustments
+    bass_boost = settings.get('bassBoost', 0)
+    mid_boost = settings.get('midBoost', 0)
+    treble_boost = settings.get('trebleBoost', 0)
+
+    if bass_boost != 0:
+        filters.append(f"equalizer=f=100:width_type=o:width=2:g={bass_boost}")
+    if mid_boost != 0:
+        filters.append(f"equalizer=f=1000:width_type=o:width=2:g={mid_boost}")
+    if treble_boost != 0:
+        filters.append(f"equalizer=f=10000:width_type=o:width=2:g={treble_boost}")
+    if bass_boost != 0 or mid_boost != 0 or treble_boost != 0:
+        print(f"Added EQ filter - Bass: {bass_boost}dB, Mid: {mid_boost}dB, Treble: {treble_boost}dB")
+
+    # Noise reduction and gating
+    if settings.get('noiseReduction', False):
+        filters.append("afftdn=nf=-25")
+        print("Added noise reduction filter")
+
+    if settings.get('noiseGate', False):
+        gate_threshold = settings.get('gateThreshold', -40)
+        filters.append(f"agate=threshold={gate_threshold}dB:ratio=2:attack=3:release=8")
+        print(f"Added noise gate filter - Threshold: {gate_threshold}dB")
+
+    # Reverb effect
+    if settings.get('reverb', False):
+        reverb_amount = settings.get('reverbAmount', 0.2)
+        # Create a simple reverb using delays
+        filters.append(f"aecho=0.8:0.9:{max(int(50 * reverb_amount), 1)}:{reverb_amount}")
+        print(f"Added reverb effect - Amount: {reverb_amount}")
+
+    # Echo effect
+    if settings.get('echo', False):
+        echo_delay = settings.get('echoDelay', 500)
+        echo_decay = settings.get('echoDecay', 0.3)
+        filters.append(f"aecho={echo_decay}:0.9:{echo_delay}:{echo_decay}")
+        print(f"Added echo effect - Delay: {echo_delay}ms, Decay: {echo_decay}")
+
+    # Stereo widening (TTS narration is often mono, extrastereo needs two channels)
+    if settings.get('stereoWiden', False):
+        filters.append("aformat=channel_layouts=stereo")
+        filters.append("extrastereo=m=2.5:c=false")
+        print("Added stereo widening effect")
+
+    # Output stage: makeup gain (e.g. from batch loudness matching) and a true peak ceiling
+    if settings.get('outputGain', 0) != 0:
+        filters.append(f"volume={settings['outputGain']:.2f}dB")
+        print(f"Added output gain: {settings['outputGain']:.2f}dB")
+
+    if settings.get('limitPeaks', False):
+        ceiling = settings.get('peakCeiling', -1.5)
+        filters.append(f"alimiter=limit={10 ** (ceiling / 20):.4f}:level=false")
+        print(f"Added peak limiter at {ceiling} dBFS")
+
+    return filters
+
+
+def enhance_audio(audio_file_path: str, output_path: str, settings: dict, bitrate: str = "192k",
+                  start_time_ms: int = None, duration_ms: int = None) -> str:
+    """
+    Enhance audio file with various processing options in a single ffmpeg run.
+
+    The whole settings dict is compiled into one -af chain, so the input is
+    streamed through decode, filters and MP3 encode once, with no temporary
+    WAV and no in-memory decode.
     
     Args:
         audio_file_path: Path to input audio file
         output_path: Path for output enhanced audio file  
         settings: Dictionary containing enhancement settings
+        bitrate: MP3 bitrate of the output
+        start_time_ms: Optional window start (input seek) in milliseconds
+        duration_ms: Optional window duration in milliseconds
         
     Returns:
         Path to enhanced audio file
     """
     try:
-        print(f"Loading audio file: {audio_file_path}")
-        audio = AudioSegment.from_file(audio_file_path)
-        
-        # Apply volume adjustment
-        if settings.get('volume', 0) != 0:
-            volume_db = settings['volume']
-            audio = audio + volume_db
-            print(f"Applied volume adjustment: {volume_db}dB")
-        
-        # Apply normalization
-        if settings.get('normalize', False):
-            audio = normalize(audio)
-            print("Applied audio normalization")
-        
-        # Apply dynamic range compression
-        if settings.get('compress', False):
-            audio = compress_dynamic_range(audio, threshold=-20.0, ratio=4.0, attack=5.0, release=50.0)
-            print("Applied dynamic range compression")
-        
-        # Apply fade effects
-        fade_in = settings.get('fadeIn', 0)
-        fade_out = settings.get('fadeOut', 0)
-        
-        if fade_in > 0:
-            audio = audio.fade_in(fade_in)
-            print(f"Applied fade-in: {fade_in}ms")
-            
-        if fade_out > 0:
-            audio = audio.fade_out(fade_out)
-            print(f"Applied fade-out: {fade_out}ms")
-        
-        # Export to temporary file for ffmpeg processing
-        temp_file = tempfile.NamedTemporaryFile(suffix='.wav', delete=False)
-        audio.export(temp_file.name, format='wav')
-        
-        # Build ffmpeg command for advanced processing
-        ffmpeg_filters = []
-        
-        # EQ adjustments
-        bass_boost = settings.get('bassBoost', 0)
-        mid_boost = settings.get('midBoost', 0)
-        treble_boost = settings.get('trebleBoost', 0)
-        
-        if bass_boost != 0 or mid_boost != 0 or treble_boost != 0:
-            # Create equalizer filter
-            eq_filter = f"equalizer=f=100:width_type=o:width=2:g={bass_boost}," + \
-                       f"equalizer=f=1000:width_type=o:width=2:g={mid_boost}," + \
-                       f"equalizer=f=10000:width_type=o:width=2:g={treble_boost}"
-            ffmpeg_filters.append(eq_filter)
-            print(f"Added EQ filter - Bass: {bass_boost}dB, Mid: {mid_boost}dB, Treble: {treble_boost}dB")
-        
-        # Noise reduction and gating
-        if settings.get('noiseReduction', False):
-            ffmpeg_filters.append("afftdn=nf=-25")
-            print("Added noise reduction filter")
-        
-        if settings.get('noiseGate', False):
-            gate_threshold = settings.get('gateThreshold', -40)
-            gate_filter = f"agate=threshold={gate_threshold}dB:ratio=2:attack=3:release=8"
-            ffmpeg_filters.append(gate_filter)
-            print(f"Added noise gate filter - Threshold: {gate_threshold}dB")
-        
-        # Reverb effect
-        if settings.get('reverb', False):
-            reverb_amount = settings.get('reverbAmount', 0.2)
-            # Create a simple reverb using delays
-            reverb_filter = f"aecho=0.8:0.9:{int(50 * reverb_amount)}:{reverb_amount}"
-            ffmpeg_filters.append(reverb_filter)
-            print(f"Added reverb effect - Amount: {reverb_amount}")
-        
-        # Echo effect
-        if settings.get('echo', False):
-            echo_delay = settings.get('echoDelay', 500)
-            echo_decay = settings.get('echoDecay', 0.3)
-            echo_filter = f"aecho={echo_decay}:0.9:{echo_delay}:{echo_decay}"
-            ffmpeg_filters.append(echo_filter)
-            print(f"Added echo effect - Delay: {echo_delay}ms, Decay: {echo_decay}")
-        
-        # Stereo widening
-        if settings.get('stereoWiden', False):
-            ffmpeg_filters.append("extrastereo=m=2.5:c=false")
-            print("Added stereo widening effect")
-        
-        # Apply ffmpeg filters if any exist
-        if ffmpeg_filters:
-            filter_complex = ",".join(ffmpeg_filters)
-            
-            cmd = [
-                "ffmpeg",
-                "-i", temp_file.name,
-                "-af", filter_complex,
-                "-acodec", "libmp3lame",
-                "-ab", "192k",
-                "-ar", "44100",
-                "-y",  # Overwrite output files
-                output_path
-            ]
-            
-            print(f"Running ffmpeg command: {' '.join(cmd)}")
-            
-            result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-            print("FFmpeg processing completed successfully")
-            
-        else:
-            # No ffmpeg filters needed, just export the pydub processed audio
-            audio.export(output_path, format='mp3', bitrate='192k')
-            print("Exported audio using pydub only")
-        
-        # Clean up temporary file
-        os.unlink(temp_file.name)
-        
+        print(f"Enhancing audio file: {audio_file_path}")
+        duration_s = None
+        if settings.get('fadeOut', 0) > 0:
+            total_ms = get_audio_duration_ms(audio_file_path)
+            if total_ms is not None:
+                duration_s = total_ms / 1000
+
+        filters = build_enhancement_filters(settings, duration_s)
+        if start_time_ms and filters:
+            # Fades are placed on the track's own timeline: frames of a window carry their
+            # absolute time through the chain, so a fade resumes at the gain it has there
+            filters = [f"asetpts=PTS-STARTPTS+{start_time_ms / 1000:.3f}/TB", *filters, "asetpts=PTS-STARTPTS"]
+
+        print(f"Enhancing with filters: {','.join(filters) or 'none'}")
+        get_media_backend().transcode_audio(
+            audio_file_path, output_path,
+            codec="libmp3lame",
+            bitrate=bitrate,
+            sample_rate=44100,
+            filters=filters,
+            start=start_time_ms / 1000 if start_time_ms else None,
+            duration=duration_ms / 1000 if duration_ms else None
+        )
         print(f"Enhanced audio saved to: {output_path}")
         return output_path
-        
-    except subprocess.CalledProcessError as e:
-        print(f"FFmpeg error: {e}")
-        print(f"FFmpeg stderr: {e.stderr}")
-        # Fallback to pydub-only processing
-        try:
-            audio.export(output_path, format='mp3', bitrate='192k')
-            print("Fallback: Exported using pydub only")
-            return output_path
-        except Exception as fallback_error:
-            print(f"Fallback export failed: {fallback_error}")
-            raise fallback_error
-            
+
     except Exception as e:
         print(f"Error enhancing audio: {e}")
         traceback.print_exc()
@@ -155,6 +160,10 @@ def enhance_audio(audio_file_path: str, output_path: str, settings: dict) -> str
 def get_audio_analysis(audio_file_path: str) -> dict:
     """
     Analyze audio file properties for enhancement recommendations.
+
+    Measurements come from the streamed analysis engine (module.analysis) and
+    are cached by file content hash, so repeated calls on the same file don't
+    decode it again.
     
     Args:
         audio_file_path: Path to audio file
@@ -163,32 +172,25 @@ def get_audio_analysis(audio_file_path: str) -> dict:
         Dictionary with audio analysis results
     """
     try:
-        audio = AudioSegment.from_file(audio_file_path)
-        
-        # Basic properties
-        analysis = {
-            'duration_seconds': len(audio) / 1000.0,
-            'sample_rate': audio.frame_rate,
-            'channels': audio.channels,
-            'frame_count': audio.frame_count(),
-            'frame_width': audio.frame_width,
-        }
-        
-        # Calculate RMS (approximate loudness)
-        rms = audio.rms
-        analysis['rms'] = rms
-        analysis['db_level'] = 20 * (rms / audio.max_possible_amplitude) if rms > 0 else -float('inf')
+        analysis = analyze_audio(audio_file_path)
+        analysis['db_level'] = analysis['rms_dbfs']
         
         # Detect if audio is too quiet or too loud
-        if analysis['db_level'] < -30:
+        lufs = analysis['integrated_lufs']
+        if lufs is None:
+            analysis['recommendations'] = []  # Silent, nothing to adjust
+        elif lufs < NORMALIZE_TARGET_LUFS - 14:
             analysis['recommendations'] = ['volume_boost', 'normalize']
-        elif analysis['db_level'] > -6:
+        elif lufs > NORMALIZE_TARGET_LUFS + 6 or (analysis['crest_factor_db'] or 0) > 20:
             analysis['recommendations'] = ['volume_reduce', 'compress']
         else:
             analysis['recommendations'] = ['normalize']
+
+        if analysis['clipped_samples'] > 0 or (analysis['true_peak_dbtp'] or -120) > -1.0:
+            analysis['recommendations'].append('limit_peaks')
         
         # Check for mono vs stereo
-        if audio.channels == 1:
+        if analysis['channels'] == 1:
             analysis['recommendations'].append('stereo_conversion')
         
         print(f"Audio analysis completed: {analysis}")
@@ -201,7 +203,19 @@ def get_audio_analysis(audio_file_path: str) -> dict:
             'recommendations': []
         }
 
-def create_audio_preview(audio_file_path: str, start_time_ms: int = 0, duration_ms: int = 30000) -> str:
+def _cut_audio_window(audio_file_path: str, output_path: str, start_time_ms: int, duration_ms: int,
+                      **output_options):
+    """Cut a window with input seeking, so only the requested range is decoded."""
+    get_media_backend().transcode_audio(
+        audio_file_path, output_path,
+        start=start_time_ms / 1000,
+        duration=duration_ms / 1000,
+        **output_options
+    )
+
+
+def create_audio_preview(audio_file_path: str, start_time_ms: int = 0, duration_ms: int = 30000,
+                         output_path: str = None, bitrate: str = PREVIEW_BITRATE) -> str:
     """
     Create a preview clip of audio file for quick testing.
     
@@ -209,27 +223,42 @@ def create_audio_preview(audio_file_path: str, start_time_ms: int = 0, duration_
         audio_file_path: Path to audio file
         start_time_ms: Start time in milliseconds
         duration_ms: Duration of preview in milliseconds
+        output_path: Preview path (defaults to preview_<name>.mp3 next to the input)
+        bitrate: MP3 bitrate of the preview
         
     Returns:
         Path to preview audio file
     """
     try:
-        audio = AudioSegment.from_file(audio_file_path)
-        
-        # Extract preview segment
-        end_time = min(start_time_ms + duration_ms, len(audio))
-        preview = audio[start_time_ms:end_time]
-        
-        # Create preview filename
         base_path = Path(audio_file_path)
-        preview_path = base_path.parent / f"preview_{base_path.stem}.mp3"
-        
-        # Export preview
-        preview.export(str(preview_path), format='mp3', bitrate='128k')
-        
+        preview_path = output_path or str(base_path.parent / f"preview_{base_path.stem}.mp3")
+        _cut_audio_window(audio_file_path, preview_path, start_time_ms, duration_ms,
+                          codec="libmp3lame", bitrate=bitrate)
         print(f"Created audio preview: {preview_path}")
-        return str(preview_path)
+        return preview_path
         
     except Exception as e:
         print(f"Error creating audio preview: {e}")
         raise e
+
+
+def create_enhancement_preview(audio_file_path: str, output_path: str, settings: dict,
+                               start_time_ms: int = 0, duration_ms: int = 10000) -> str:
+    """
+    Render only a window of the enhancement chain for interactive tuning.
+
+    The window is selected with an input seek, so only that range is decoded.
+    Fades keep their place on the track's timeline, so the window has the
+    gain the full render has there. The result is a low-bitrate MP3.
+    """
+    return enhance_audio(audio_file_path, output_path, settings, bitrate=PREVIEW_BITRATE,
+                         start_time_ms=start_time_ms, duration_ms=duration_ms)
+
+
+def get_audio_duration_ms(audio_file_path: str):
+    """Container duration in milliseconds, or None if it can't be read."""
+    try:
+        return get_media_backend().format_duration(audio_file_path) * 1000
+    except Exception as e:
+        print(f"Could not determine duration for {audio_file_path}: {e}")
+        return None
@@ -0,0 +1,140 @@
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+
+from module.analysis import analyze_audio
+from module.audio_enhance import (
+    NORMALIZE_TARGET_LUFS, build_enhancement_filters, enhance_audio, get_audio_duration_ms
+)
+from module.enhance_cache import get_enhancement_cache
+from module.mezzanine import mezzanine_source
+from module.waveform import try_generate_waveform
+
+REPORT_FILE = "enhance_report.json"
+BATCH_MAX_WORKERS = int(os.getenv("BATCH_MAX_WORKERS", str(os.cpu_count() or 2)))
+MAX_GAIN_DB = 24.0  # Never boost near-silent scenes by more than this
+DERIVED_PREFIXES = ("enhanced_", "preview_")
+
+
+def discover_scene_ids(audio_dir: Path) -> list:
+    """Scene narration files are <scene_id>.mp3; skip enhanced, preview and mix outputs."""
+    return sorted(
+        path.stem for path in audio_dir.glob("*.mp3")
+        if not path.name.startswith(DERIVED_PREFIXES) and not path.stem.endswith("_mixed")
+    )
+
+
+def _measure_settings(settings: dict) -> dict:
+    # The batch target replaces per-scene normalization and any previous output stage
+    measured = {k: v for k, v in settings.items() if k not in ("normalize", "outputGain")}
+    measured["limitPeaks"] = False
+    return measured
+
+
+def measure_scene_loudness(audio_path: str, settings: dict) -> dict:
+    """
+    First pass for one scene: the loudness the enhancement chain would produce.
+    Runs in a worker process; results are cached per (content hash, filter chain).
+    """
+    duration_s = None
+    if settings.get('fadeOut', 0) > 0:
+        duration_ms = get_audio_duration_ms(audio_path)
+        duration_s = duration_ms / 1000 if duration_ms else None
+    return analyze_audio(audio_path, pre_filters=build_enhancement_filters(settings, duration_s))
+
+
+def batch_enhance_story(story_id: str, settings: dict, scene_ids: list = None,
+                        scene_settings: dict = None, target_lufs: float = NORMALIZE_TARGET_LUFS,
+                        peak_ceiling: float = -1.5, max_workers: int = BATCH_MAX_WORKERS) -> dict:
+    """
+    Enhance every scene of a story to one consistent loudness in two passes.
+
+    Pass 1 measures, in a process pool, the integrated loudness each scene's
+    enhancement chain would produce. Pass 2 renders each scene once with its
+    chain plus the makeup gain to ``target_lufs`` and a true peak limiter, through
+    the enhancement cache. Per-scene outputs are enhanced_<scene_id>.mp3, and
+    a summary report is written next to them.
+    """
+    audio_dir = Path(os.getenv("DATA_DIR", "/story")) / story_id / "audios"
+    if not audio_dir.exists():
+        raise FileNotFoundError(f"No audio directory for story {story_id}")
+    scene_ids = scene_ids or discover_scene_ids(audio_dir)
+    scene_settings = scene_settings or {}
+
+    scenes = []
+    for scene_id in scene_ids:
+        audio_path = audio_dir / f"{scene_id}.mp3"
+        if not audio_path.exists():
+            raise FileNotFoundError(f"Audio file not found for scene {scene_id}")
+        scenes.append({
+            "scene_id": scene_id,
+            "path": mezzanine_source(audio_path),
+            "settings": _measure_settings({**settings, **scene_settings.get(scene_id, {})}),
+        })
+
+    started = time.time()
+    print(f"Batch enhancement of {len(scenes)} scenes in story {story_id}: measuring loudness")
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        measurements = list(pool.map(
+            measure_scene_loudness,
+            [scene["path"] for scene in scenes],
+            [scene["settings"] for scene in scenes]
+        ))
+    measured_at = time.time()
+
+    cache = get_enhancement_cache()
+
+    def render_scene(scene, measurement):
+        lufs = measurement.get("integrated_lufs")
+        # Silent scenes get no gain instead of an unbounded boost
+        gain = 0.0 if lufs is None else max(min(target_lufs - lufs, MAX_GAIN_DB), -MAX_GAIN_DB)
+        final_settings = {
+            **scene["settings"],
+            "outputGain": round(gain, 2),
+            "limitPeaks": True,
+            "peakCeiling": peak_ceiling,
+        }
+        filename = f"enhanced_{scene['scene_id']}.mp3"
+        key, cached = cache.get_or_create(
+            scene["path"],
+            str(audio_dir / filename),
+            final_settings,
+            lambda source, target: enhance_audio(source, target, final_settings),
+            story_id=story_id,
+            scene_id=scene["scene_id"]
+        )
+        try_generate_waveform(audio_dir / filename)
+        return {
+            "scene_id": scene["scene_id"],
+            "filename": filename,
+            "measured_lufs": lufs,
+            "true_peak_dbtp": measurement.get("true_peak_dbtp"),
+            "gain_db": round(gain, 2),
+            "variant_key": key,
+            "cached": cached,
+        }
+
+    # ffmpeg does the work in pass 2, so threads are enough to keep the cores busy
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        results = list(pool.map(render_scene, scenes, measurements))
+    finished = time.time()
+
+    audible = [r["measured_lufs"] for r in results if r["measured_lufs"] is not None]
+    report = {
+        "story_id": story_id,
+        "target_lufs": target_lufs,
+        "peak_ceiling_dbtp": peak_ceiling,
+        "scene_count": len(results),
+        "measured_spread_lu": round(max(audible) - min(audible), 2) if audible else 0.0,
+        "measure_seconds": round(measured_at - started, 2),
+        "render_seconds": round(finished - measured_at, 2),
+        "scenes": results,
+        "created_at": finished,
+    }
+    with open(audio_dir / REPORT_FILE, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Batch enhancement finished in {finished - started:.1f}s "
+          f"(spread before: {report['measured_spread_lu']} LU)")
+    return report
@@ -0,0 +1,240 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from module.analysis import get_analysis_cache
+from module.tts_cache import link_or_copy
+
+CACHE_NAME = "_enhance_cache"
+AUDIO_DIR = "audios"  # Served by /files/{CACHE_NAME}/audios/{key}.mp3
+META_DIR = "meta"
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024  # 512 MB
+
+# Setting values that leave the audio untouched; dropped so equivalent configurations share a key
+_NEUTRAL = {
+    "volume": 0, "normalize": False, "compress": False, "fadeIn": 0, "fadeOut": 0,
+    "bassBoost": 0, "midBoost": 0, "trebleBoost": 0, "noiseReduction": False,
+    "noiseGate": False, "reverb": False, "echo": False, "stereoWiden": False,
+    "outputGain": 0, "limitPeaks": False,
+}
+# Parameters that only matter while their effect is switched on
+_DEPENDENT = {
+    "normalize": ["normalizeTarget"],
+    "noiseGate": ["gateThreshold"],
+    "reverb": ["reverbAmount"],
+    "echo": ["echoDelay", "echoDecay"],
+    "limitPeaks": ["peakCeiling"],
+}
+
+
+def canonicalize_settings(settings: dict) -> dict:
+    """
+    Reduce an enhancement settings dict to the options that change the output:
+    neutral values and parameters of disabled effects are removed, and numbers
+    are normalized so that 3 and 3.0 compare equal.
+    """
+    canonical = {}
+    for key, value in settings.items():
+        if value is None or _NEUTRAL.get(key, object()) == value:
+            continue
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            value = float(value)
+        canonical[key] = value
+    for toggle, params in _DEPENDENT.items():
+        if not canonical.get(toggle):
+            for param in params:
+                canonical.pop(param, None)
+    return dict(sorted(canonical.items()))
+
+
+def enhancement_key(input_hash: str, settings: dict, bitrate: str) -> str:
+    payload = json.dumps([input_hash, canonicalize_settings(settings), bitrate], sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class EnhancementCache:
+    """
+    Size-bounded store of enhanced audio keyed by (input content hash,
+    canonical settings, bitrate).
+
+    Each entry is an MP3 plus a JSON sidecar recording its settings and the
+    scenes it was produced for. Hits refresh the entry's mtime; eviction drops
+    least recently used entries until the cache fits in ``max_bytes``.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def audio_path(self, key: str) -> Path:
+        return self.cache_dir / AUDIO_DIR / f"{key}.mp3"
+
+    def _meta_path(self, key: str) -> Path:
+        return self.cache_dir / META_DIR / f"{key}.json"
+
+    def _read_meta(self, key: str) -> dict:
+        path = self._meta_path(key)
+        if not path.exists():
+            return {}
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _write_meta(self, key: str, meta: dict):
+        path = self._meta_path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{path.name}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2)
+        os.replace(tmp_path, path)
+
+    def _record_scene(self, key: str, meta: dict, story_id: str, scene_id: str, audio_filename: str):
+        scene = {"story_id": story_id, "scene_id": scene_id, "audio_filename": audio_filename}
+        scenes = meta.setdefault("scenes", [])
+        if scene not in scenes:
+            scenes.append(scene)
+        meta["last_used"] = time.time()
+        self._write_meta(key, meta)
+
+    def invalidate(self, input_path: str, settings: dict, bitrate: str = "192k"):
+        """Drop the cached variant of ``input_path`` for these settings, if any."""
+        key = enhancement_key(get_analysis_cache().content_hash(input_path), settings, bitrate)
+        with self._lock:
+            for path in (self.audio_path(key), self._meta_path(key)):
+                if path.exists():
+                    path.unlink()
+
+    def get_or_create(self, input_path: str, destination: str, settings: dict, render,
+                      story_id: str, scene_id: str, bitrate: str = "192k"):
+        """
+        Link the enhanced variant of ``input_path`` to ``destination``, calling
+        ``render(input_path, output_path)`` only on a miss. Rendering goes to a
+        temp file that is renamed into the cache, so the hardlinked scene file
+        and the cache entry are never written in place.
+
+        Returns (key, cached).
+        """
+        input_hash = get_analysis_cache().content_hash(input_path)
+        key = enhancement_key(input_hash, settings, bitrate)
+        path = self.audio_path(key)
+        audio_filename = Path(input_path).name
+
+        with self._lock:
+            cached = path.exists()
+            if cached:
+                self.hits += 1
+                os.utime(path)
+            else:
+                self.misses += 1
+
+        if cached:
+            print(f"Enhancement cache hit {key[:12]} -> {destination}")
+        else:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=".render_", suffix=".mp3")
+            os.close(fd)
+            try:
+                render(input_path, tmp_path)
+                os.chmod(tmp_path, 0o644)  # mkstemp creates 0600
+                os.replace(tmp_path, path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+        link_or_copy(path, destination)
+        with self._lock:
+            meta = self._read_meta(key) or {
+                "key": key,
+                "input_hash": input_hash,
+                "settings": canonicalize_settings(settings),
+                "bitrate": bitrate,
+                "created_at": time.time(),
+            }
+            self._record_scene(key, meta, story_id, scene_id, audio_filename)
+        if not cached:
+            self._evict()
+        return key, cached
+
+    def list_variants(self, story_id: str, scene_id: str) -> list:
+        """Cached variants produced for a scene, most recently used first."""
+        meta_dir = self.cache_dir / META_DIR
+        if not meta_dir.exists():
+            return []
+        variants = []
+        for entry in os.scandir(meta_dir):
+            if not entry.name.endswith(".json") or entry.name.startswith("."):
+                continue
+            key = entry.name[:-len(".json")]
+            meta = self._read_meta(key)
+            scenes = [s for s in meta.get("scenes", [])
+                      if s["story_id"] == story_id and s["scene_id"] == scene_id]
+            if scenes and self.audio_path(key).exists():
+                variants.append({**meta, "scenes": scenes})
+        return sorted(variants, key=lambda v: v.get("last_used", 0), reverse=True)
+
+    def _entries(self):
+        audio_dir = self.cache_dir / AUDIO_DIR
+        if not audio_dir.exists():
+            return []
+        entries = []
+        for entry in os.scandir(audio_dir):
+            if entry.is_file() and not entry.name.startswith("."):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.name[:-len(".mp3")]))
+        return entries
+
+    def _evict(self):
+        with self._lock:
+            entries = self._entries()
+            total = sum(size for _, size, _ in entries)
+            if total <= self.max_bytes:
+                return
+            for _, size, key in sorted(entries):
+                try:
+                    os.remove(self.audio_path(key))
+                except OSError:
+                    continue
+                meta_path = self._meta_path(key)
+                if meta_path.exists():
+                    meta_path.unlink()
+                self.evictions += 1
+                total -= size
+                if total <= self.max_bytes:
+                    break
+            print(f"Enhancement cache evicted down to {total} bytes")
+
+    def stats(self) -> dict:
+        entries = self._entries()
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(entries),
+            "bytes": sum(size for _, size, _ in entries),
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_enhancement_cache() -> EnhancementCache:
+    """Return the process-wide enhancement cache (ENHANCE_CACHE_MAX_BYTES)."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                cache_dir = Path(os.getenv("DATA_DIR", "/story")) / CACHE_NAME
+                max_bytes = int(os.getenv("ENHANCE_CACHE_MAX_BYTES", str(DEFAULT_MAX_BYTES)))
+                _cache = EnhancementCache(str(cache_dir), max_bytes)
+    return _cache
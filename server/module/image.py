@@ -14,6 +14,8 @@ from io import BytesIO
 
 from tenacity import retry, stop_after_attempt, wait_exponential, RetryError
 
+from module.prompt_index import get_prompt_index
+
 # Initialize Gemini client with your API key
 client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
 
@@ -163,7 +165,7 @@ def generate_scene_image(
     """Generate a scene image with retry logic and fallback to placeholder"""
     try:
         # Try the retry-enabled function first
-        return _generate_scene_image_with_retry(
+        image_base64 = _generate_scene_image_with_retry(
             story_id=story_id,
             scene_id=scene_id,
             visual_prompt=visual_prompt,
@@ -173,6 +175,18 @@ def generate_scene_image(
             negative_prompt=negative_prompt,
             reference_scene_id=reference_scene_id
         )
+        # Only real generations are indexed for near-duplicate reuse, never placeholders
+        try:
+            get_prompt_index().add(visual_prompt, negative_prompt, image_base64, metadata={
+                "story_id": story_id,
+                "scene_id": scene_id,
+                "width": width,
+                "height": height,
+                "reference_scene_id": reference_scene_id
+            })
+        except Exception as index_error:
+            print(f"Could not index generated image: {index_error}")
+        return image_base64
         
     except RetryError as retry_error:
         print(f"Retry exhausted after multiple attempts: {retry_error}")
@@ -0,0 +1,168 @@
+import glob
+import json
+import os
+from io import BytesIO
+from pathlib import Path
+
+from PIL import Image, ImageOps
+
+from module.manifest import record_file, IMAGE
+
+STORY_SETTINGS_FILE = "story.json"
+ORIGINALS_DIR = "originals"
+FIT_MODES = ("letterbox", "cover", "stretch")
+
+# PNG decode cost is dominated by zlib inflate; a low compression level keeps
+# files reasonable while making both the ingest encode and ffmpeg's decode cheap.
+PNG_COMPRESS_LEVEL = 1
+
+
+def load_story_settings(story_id: str) -> dict:
+    """Load the per-story settings written by /init (render size, fit mode, ...)."""
+    settings_path = Path(os.getenv("DATA_DIR", "/story")) / story_id / STORY_SETTINGS_FILE
+    if not settings_path.exists():
+        return {}
+    try:
+        with open(settings_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"Could not read story settings {settings_path}: {e}")
+        return {}
+
+
+def save_story_settings(story_id: str, settings: dict) -> dict:
+    """Merge settings into the story's settings file and return the result."""
+    data_dir = Path(os.getenv("DATA_DIR", "/story")) / story_id
+    data_dir.mkdir(parents=True, exist_ok=True)
+    merged = load_story_settings(story_id)
+    merged.update({k: v for k, v in settings.items() if v is not None})
+    with open(data_dir / STORY_SETTINGS_FILE, "w", encoding="utf-8") as f:
+        json.dump(merged, f, indent=2)
+    return merged
+
+
+def get_render_size(story_id: str, width: int = None, height: int = None):
+    """Resolve the canonical render size for a story, request values taking precedence."""
+    settings = load_story_settings(story_id)
+    width = width or settings.get("width")
+    height = height or settings.get("height")
+    if not width or not height:
+        return None
+    # libx264 with yuv420p requires even dimensions
+    return int(width) // 2 * 2, int(height) // 2 * 2
+
+
+def detect_image_extension(image_bytes: bytes) -> str:
+    """Guess a file extension for the original upload from its magic bytes."""
+    if image_bytes.startswith(b"\x89PNG"):
+        return ".png"
+    if image_bytes.startswith(b"\xff\xd8"):
+        return ".jpg"
+    if image_bytes[:4] == b"RIFF" and image_bytes[8:12] == b"WEBP":
+        return ".webp"
+    if image_bytes[:6] in (b"GIF87a", b"GIF89a"):
+        return ".gif"
+    return ".bin"
+
+
+def normalize_image(image_bytes: bytes, output_path: str, size=None, fit: str = "letterbox") -> dict:
+    """
+    Decode an uploaded image once and store it ready for rendering.
+
+    JPEGs are decoded through Pillow's draft mode so the decoder downscales by a
+    power of two on the fly instead of materializing full-resolution pixels.
+    The result is resized to ``size`` (if given) using ``fit``, converted to RGB,
+    stripped of all metadata and written as a fast-decoding PNG.
+
+    Args:
+        image_bytes: Raw uploaded image bytes
+        output_path: Path of the normalized PNG
+        size: (width, height) canonical render size, or None to keep dimensions
+        fit: "letterbox" (pad), "cover" (crop) or "stretch"
+
+    Returns:
+        Dictionary describing the source and normalized images
+    """
+    if fit not in FIT_MODES:
+        raise ValueError(f"Unsupported fit mode: {fit}. Expected one of {FIT_MODES}")
+
+    img = Image.open(BytesIO(image_bytes))
+    source_format = img.format
+    source_size = img.size
+
+    if size and img.format == "JPEG":
+        # draft() only ever scales down and keeps the image >= the requested size
+        img.draft("RGB", size)
+
+    # Honour the camera orientation before the EXIF block is dropped
+    img = ImageOps.exif_transpose(img)
+
+    if img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info):
+        rgba = img.convert("RGBA")
+        background = Image.new("RGB", rgba.size, (0, 0, 0))
+        background.paste(rgba, mask=rgba.split()[-1])
+        img = background
+    elif img.mode != "RGB":
+        img = img.convert("RGB")
+
+    if size and img.size != tuple(size):
+        if fit == "letterbox":
+            img = ImageOps.pad(img, size, method=Image.LANCZOS, color=(0, 0, 0))
+        elif fit == "cover":
+            img = ImageOps.fit(img, size, method=Image.LANCZOS)
+        else:
+            img = img.resize(size, Image.LANCZOS)
+    elif img.width % 2 or img.height % 2:
+        # Keep dimensions encoder-friendly even when no render size is configured
+        img = img.crop((0, 0, img.width // 2 * 2, img.height // 2 * 2))
+
+    # A fresh image carries no info/exif/icc, so nothing leaks into the PNG
+    clean = Image.new("RGB", img.size)
+    clean.paste(img)
+    clean.save(output_path, format="PNG", compress_level=PNG_COMPRESS_LEVEL)
+
+    return {
+        "source_format": source_format,
+        "source_size": list(source_size),
+        "size": list(clean.size),
+        "fit": fit,
+    }
+
+
+def ingest_image(story_id: str, scene_id: str, image_bytes: bytes, width: int = None,
+                 height: int = None, fit: str = None) -> dict:
+    """
+    Store the original upload under ``originals/`` and a normalized render-ready
+    copy under ``images/{scene_id}.png``.
+    """
+    data_dir = Path(os.getenv("DATA_DIR", "/story")) / story_id
+    image_dir = data_dir / "images"
+    originals_dir = data_dir / ORIGINALS_DIR
+    image_dir.mkdir(parents=True, exist_ok=True)
+    originals_dir.mkdir(parents=True, exist_ok=True)
+
+    size = get_render_size(story_id, width, height)
+    fit = fit or load_story_settings(story_id).get("fit", "letterbox")
+    if fit not in FIT_MODES:
+        raise ValueError(f"Unsupported fit mode: {fit}. Expected one of {FIT_MODES}")
+
+    # Normalize before touching the stored files, so a bad upload leaves the scene as it was
+    image_path = image_dir / f"{scene_id}.png"
+    tmp_path = image_dir / f".{scene_id}.ingest.png"
+    try:
+        info = normalize_image(image_bytes, str(tmp_path), size=size, fit=fit)
+    except Exception:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+    for stale in originals_dir.glob(f"{glob.escape(scene_id)}.*"):
+        stale.unlink()
+    original_path = originals_dir / f"{scene_id}{detect_image_extension(image_bytes)}"
+    with open(original_path, "wb") as f:
+        f.write(image_bytes)
+    os.replace(tmp_path, image_path)
+    record_file(image_path, IMAGE, [original_path], {"size": list(size) if size else None, "fit": fit}, scene_id)
+
+    info["original"] = original_path.name
+    print(f"Ingested image for scene {scene_id}: {info}")
+    return info
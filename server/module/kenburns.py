@@ -0,0 +1,182 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from module.media import get_media_backend
+from module.mixer import probe_audio
+from module.previews import render_previews
+
+KENBURNS_FPS = 25
+KENBURNS_CHUNK_FRAMES = 12  # Frames rendered per worker task
+KENBURNS_MAX_WORKERS = int(os.getenv("KENBURNS_MAX_WORKERS", str(os.cpu_count() or 2)))
+PAN_ONLY_ZOOM = 0.2  # Headroom a pan without zoom needs to move at all, as in the UI
+DIRECTIONS = ("zoom-in", "zoom-out", "pan-left", "pan-right", "pan-up", "pan-down")
+
+
+def kenburns_path(settings: dict, frame_count: int) -> np.ndarray:
+    """
+    Per-frame (zoom, x, y) of the visible window, with x and y its top-left
+    corner as a fraction of the image size.
+
+    ``settings`` uses the UI's Ken Burns fields: startScale, endScale,
+    direction (one or a list of DIRECTIONS) and intensity (0-10). Zoom
+    interpolates linearly and never drops below 1, as in zoompan. A pan travels
+    ``intensity / 10`` of the slack the zoom leaves, centred on the middle of
+    the image. Positions are kept fractional, so motion has no pixel jitter.
+    """
+    directions = settings.get("direction") or []
+    if isinstance(directions, str):
+        directions = [directions]
+    directions = [d for d in directions if d in DIRECTIONS]
+    start = float(settings.get("startScale") or 1.0)
+    end = float(settings.get("endScale") or start + 0.1)
+    intensity = min(max(float(settings.get("intensity") or 1) / 10, 0.0), 1.0)
+
+    progress = np.linspace(0.0, 1.0, frame_count) if frame_count > 1 else np.zeros(frame_count)
+    if "zoom-in" in directions or "zoom-out" in directions:
+        zoom = start + (end - start) * progress
+    elif directions:
+        zoom = np.full(frame_count, 1 + (end - start if end > start else PAN_ONLY_ZOOM))
+    else:
+        zoom = np.full(frame_count, start)
+    zoom = np.maximum(zoom, 1.0)
+
+    slack = 1 - 1 / zoom
+    travel = (progress - 0.5) * intensity * slack
+    x = slack / 2 + travel * (("pan-left" in directions) - ("pan-right" in directions))
+    y = slack / 2 + travel * (("pan-up" in directions) - ("pan-down" in directions))
+    return np.stack([zoom, x, y], axis=1)
+
+
+def _rgb_to_yuv420(rgb: np.ndarray):
+    """BT.601 limited range planes, the conversion ffmpeg applies to RGB stills."""
+    rgb = rgb.astype(np.float32)
+    r, g, b = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+    y = 16 + 0.256788 * r + 0.504129 * g + 0.097906 * b
+    u = 128 - 0.148223 * r - 0.290993 * g + 0.439216 * b
+    v = 128 + 0.439216 * r - 0.367788 * g - 0.071427 * b
+    h, w = y.shape
+    # 2x2 box average for the half-resolution chroma planes
+    u = u[:h // 2 * 2, :w // 2 * 2].reshape(h // 2, 2, w // 2, 2).mean(axis=(1, 3))
+    v = v[:h // 2 * 2, :w // 2 * 2].reshape(h // 2, 2, w // 2, 2).mean(axis=(1, 3))
+    return y, u, v
+
+
+def _axis(coords: np.ndarray, size: int):
+    coords = np.clip(coords, 0, size - 1)
+    lower = np.minimum(np.floor(coords).astype(np.intp), size - 2)
+    return lower, (coords - lower).astype(np.float32)
+
+
+def _resample(plane: np.ndarray, left: float, top: float, step: float, width: int, height: int) -> np.ndarray:
+    """Bilinear, axis-aligned resample of a window of ``plane``: rows first, then columns."""
+    ys = top + (np.arange(height) + 0.5) * step - 0.5
+    xs = left + (np.arange(width) + 0.5) * step - 0.5
+    y0, fy = _axis(ys, plane.shape[0])
+    x0, fx = _axis(xs, plane.shape[1])
+    first, last = x0[0], x0[-1] + 2  # Only the columns the window covers
+    rows = plane[y0, first:last]
+    rows += (plane[y0 + 1, first:last] - rows) * fy[:, None]
+    x0 -= first
+    out = rows[:, x0]
+    out += (rows[:, x0 + 1] - out) * fx
+    return (out + 0.5).astype(np.uint8)
+
+
+class KenBurnsRenderer:
+    """
+    Renders yuv420p frames of a Ken Burns move over one still image.
+
+    The image is decoded, cropped to the output aspect (centred, like the
+    "cover" fit) and scaled once (Lanczos) to the output size times the
+    largest zoom, so every frame is a downscale of at most that factor.
+    Each frame is then an affine window into the precomputed planes.
+    """
+
+    def __init__(self, image_path: str, width: int, height: int, path: np.ndarray):
+        self.width, self.height = width, height
+        self.path = path
+        self.scale = float(path[:, 0].max()) if len(path) else 1.0
+        source_size = (int(round(width * self.scale)), int(round(height * self.scale)))
+        with Image.open(image_path) as image:
+            # An image not normalized to the render aspect is cropped rather than stretched
+            rgb = np.asarray(ImageOps.fit(image.convert("RGB"), source_size, method=Image.LANCZOS))
+        self.planes = _rgb_to_yuv420(rgb)
+
+    def frame(self, index: int) -> bytes:
+        zoom, x, y = self.path[index]
+        out = []
+        for plane, divisor in zip(self.planes, (1, 2, 2)):
+            plane_h, plane_w = plane.shape
+            out.append(_resample(
+                plane,
+                left=x * plane_w,
+                top=y * plane_h,
+                step=self.scale / zoom,
+                width=self.width // divisor,
+                height=self.height // divisor
+            ).tobytes())
+        return b"".join(out)
+
+    def frames(self, start: int, stop: int) -> bytes:
+        return b"".join(self.frame(i) for i in range(start, stop))
+
+
+_worker_renderer = None
+
+
+def _init_worker(image_path: str, width: int, height: int, path: np.ndarray):
+    global _worker_renderer
+    _worker_renderer = KenBurnsRenderer(image_path, width, height, path)
+
+
+def _render_chunk(start: int, stop: int) -> bytes:
+    return _worker_renderer.frames(start, stop)
+
+
+def create_kenburns_video(image_path, audio_path, settings: dict, output_path,
+                          width: int = None, height: int = None, max_workers: int = KENBURNS_MAX_WORKERS):
+    """
+    Render a Ken Burns scene video without zoompan.
+
+    Frames are computed in a process pool, KENBURNS_CHUNK_FRAMES at a time,
+    and handed in order as raw yuv420p to the media backend, which encodes
+    them with the narration. At most two chunks per worker are in flight, so
+    memory stays bounded whatever the scene length.
+    """
+    if not os.path.exists(image_path):
+        raise FileNotFoundError(f"Image file not found: {image_path}")
+    if not os.path.exists(audio_path):
+        raise FileNotFoundError(f"Audio file not found: {audio_path}")
+    if not width or not height:
+        with Image.open(image_path) as image:
+            width, height = image.size
+    width, height = width // 2 * 2, height // 2 * 2  # yuv420p needs even dimensions
+    fps = int(settings.get("fps") or KENBURNS_FPS)
+    frame_count = max(int(np.ceil(probe_audio(str(audio_path))["duration"] * fps)), 1)
+    path = kenburns_path(settings, frame_count)
+
+    print(f"Rendering {frame_count} Ken Burns frames at {width}x{height} with {max_workers} workers")
+    chunks = [(start, min(start + KENBURNS_CHUNK_FRAMES, frame_count))
+              for start in range(0, frame_count, KENBURNS_CHUNK_FRAMES)]
+    in_flight = max_workers * 2
+
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                             initargs=(str(image_path), width, height, path)) as pool:
+        # Submitting before the encoder starts forks the workers first, so they
+        # can't inherit (and hold open) an encoder pipe
+        pending = [pool.submit(_render_chunk, *chunk) for chunk in chunks[:in_flight]]
+
+        def rendered():
+            for chunk in chunks[in_flight:]:
+                pending.append(pool.submit(_render_chunk, *chunk))
+                yield pending.pop(0).result()
+            while pending:
+                yield pending.pop(0).result()
+
+        get_media_backend().encode_video(rendered(), width, height, fps, str(audio_path), str(output_path))
+    print(f"Ken Burns video saved to {output_path}")
+    # Frames never pass through an ffmpeg graph here, so previews are one extra decode of the result
+    render_previews(output_path)
@@ -0,0 +1,280 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+from PIL import Image
+
+from module.util import content_hash
+
+MANIFEST_FILE = "manifest.json"
+IMAGE = "image"
+NARRATION = "narration"
+WAVEFORM = "waveform"
+SCENE_VIDEO = "scene_video"
+STORY_VIDEO = "story_video"
+# story_status field of each per-scene artifact kind
+SCENE_STATUS_FIELDS = (("image", IMAGE), ("audio", NARRATION), ("waveform", WAVEFORM), ("video", SCENE_VIDEO))
+
+_locks = {}
+_locks_guard = threading.Lock()
+
+
+def _story_dir(story_id: str) -> Path:
+    return Path(os.getenv("DATA_DIR", "/story")) / story_id
+
+
+def _story_lock(story_id: str) -> threading.Lock:
+    with _locks_guard:
+        return _locks.setdefault(story_id, threading.Lock())
+
+
+def load_manifest(story_id: str) -> dict:
+    path = _story_dir(story_id) / MANIFEST_FILE
+    if not path.exists():
+        return {"artifacts": {}}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _save_manifest(story_id: str, manifest: dict):
+    story_dir = _story_dir(story_id)
+    story_dir.mkdir(parents=True, exist_ok=True)
+    tmp_path = story_dir / f".{MANIFEST_FILE}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, story_dir / MANIFEST_FILE)
+
+
+def hash_inputs(story_id: str, inputs: list) -> dict:
+    """Content hashes of input files given relative to the story dir (None if missing)."""
+    story_dir = _story_dir(story_id)
+    hashes = {}
+    for name in inputs:
+        path = story_dir / name
+        hashes[name] = content_hash(path) if path.exists() else None
+    return hashes
+
+
+def params_hash(params: dict) -> str:
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _output_stamp(path: Path):
+    if not path.exists():
+        return None
+    stat = path.stat()
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def artifact_state(story_id: str, artifact: str, entry: dict, params: dict = None) -> dict:
+    """
+    Compare a manifest entry with the files on disk.
+
+    Returns {"status": "fresh" | "stale" | "missing" | "untracked", "reasons": [...]}.
+    ``params`` is compared only when given; without it, only input content counts.
+    """
+    output = _story_dir(story_id) / artifact
+    if not output.exists():
+        return {"status": "missing", "reasons": []}
+    if not entry:
+        return {"status": "untracked", "reasons": ["no render recorded"]}
+    reasons = []
+    current = hash_inputs(story_id, list(entry["inputs"]))
+    for name, recorded in entry["inputs"].items():
+        if current[name] is None:
+            reasons.append(f"{name} missing")
+        elif current[name] != recorded:
+            reasons.append(f"{name} changed")
+    if params is not None and params_hash(params) != entry.get("params_hash"):
+        reasons.append("render parameters changed")
+    if _output_stamp(output) != entry.get("output"):
+        reasons.append(f"{artifact} modified outside the renderer")
+    return {"status": "stale" if reasons else "fresh", "reasons": reasons}
+
+
+def record_artifact(story_id: str, artifact: str, kind: str, inputs: list, params: dict,
+                    scene_id: str = None):
+    """Record the input hashes and parameters an artifact was just rendered from."""
+    entry = {
+        "kind": kind,
+        "scene_id": scene_id,
+        "inputs": hash_inputs(story_id, inputs),
+        "params": params,
+        "params_hash": params_hash(params),
+        "output": _output_stamp(_story_dir(story_id) / artifact),
+        "rendered_at": time.time(),
+    }
+    with _story_lock(story_id):
+        manifest = load_manifest(story_id)
+        manifest["artifacts"][artifact] = entry
+        _save_manifest(story_id, manifest)
+    return entry
+
+
+def _story_relative(path):
+    """(story_id, name relative to the story dir) of a path under DATA_DIR, or None."""
+    try:
+        relative = Path(path).resolve().relative_to(Path(os.getenv("DATA_DIR", "/story")).resolve())
+    except ValueError:
+        return None
+    if len(relative.parts) < 2:
+        return None
+    return relative.parts[0], Path(*relative.parts[1:]).as_posix()
+
+
+def record_file(path, kind: str, inputs: list = (), params: dict = None, scene_id: str = None):
+    """
+    record_artifact for modules that only see file paths: ``path`` and
+    ``inputs`` are resolved against their story dir. Files outside DATA_DIR
+    (caches, temp files) are not tracked.
+    """
+    located = _story_relative(path)
+    if located is None:
+        return None
+    story_id, artifact = located
+    names = []
+    for input_path in inputs:
+        input_located = _story_relative(input_path)
+        if input_located and input_located[0] == story_id:
+            names.append(input_located[1])
+    return record_artifact(story_id, artifact, kind, names, params or {}, scene_id)
+
+
+def changed_inputs(story_id: str, artifact: str, inputs: list, params: dict):
+    """
+    Inputs whose content changed since ``artifact`` was rendered, in ``inputs``
+    order. Returns None when nothing short of a full render will do: the
+    artifact is missing, untracked, rendered from other inputs or parameters,
+    or modified outside the renderer.
+    """
+    entry = load_manifest(story_id)["artifacts"].get(artifact)
+    output = _story_dir(story_id) / artifact
+    if not entry or set(entry["inputs"]) != set(inputs) or not output.exists():
+        return None
+    if params_hash(params) != entry.get("params_hash") or _output_stamp(output) != entry.get("output"):
+        return None
+    current = hash_inputs(story_id, inputs)
+    return [name for name in inputs if current[name] != entry["inputs"][name]]
+
+
+def render_if_stale(story_id: str, artifact: str, kind: str, inputs: list, params: dict, render,
+                    scene_id: str = None, force: bool = False, partial: dict = None) -> bool:
+    """
+    Call ``render()`` unless the artifact exists and was rendered from exactly
+    these input contents and parameters. Returns True when the render was skipped.
+
+    ``partial`` maps an input name to a cheaper update of the existing artifact,
+    used instead of ``render()`` when that input is the only one that changed.
+    If the update fails, the artifact is rendered from scratch.
+    """
+    if not force:
+        changed = changed_inputs(story_id, artifact, inputs, params)
+        if changed == []:
+            print(f"{artifact} is up to date, skipping render")
+            return True
+        if changed and len(changed) == 1 and changed[0] in (partial or {}):
+            print(f"Only {changed[0]} changed, updating {artifact} in place")
+            try:
+                partial[changed[0]]()
+                record_artifact(story_id, artifact, kind, inputs, params, scene_id)
+                return False
+            except Exception as e:
+                print(f"In-place update of {artifact} failed, rendering from scratch: {e}")
+    render()
+    record_artifact(story_id, artifact, kind, inputs, params, scene_id)
+    return False
+
+
+def scene_video_inputs(scene_id: str) -> list:
+    return [f"images/{scene_id}.png", f"audios/{scene_id}.mp3"]
+
+
+def scene_video_params(story_id: str, scene_id: str, params: dict) -> dict:
+    """Scene video parameters plus the render size, which a scene video takes from its image."""
+    image_path = _story_dir(story_id) / "images" / f"{scene_id}.png"
+    width = height = None
+    if image_path.exists():
+        with Image.open(image_path) as image:
+            width, height = image.size
+    return {**params, "width": width, "height": height}
+
+
+def story_video_inputs(scene_ids: list) -> list:
+    return [f"videos/{scene_id}.mp4" for scene_id in scene_ids]
+
+
+def scene_artifacts(scene_id: str) -> dict:
+    """The files derived for a scene, by kind."""
+    return {
+        IMAGE: f"images/{scene_id}.png",
+        NARRATION: f"audios/{scene_id}.mp3",
+        WAVEFORM: f"waveforms/{scene_id}.mp3.peaks",
+        SCENE_VIDEO: f"videos/{scene_id}.mp4",
+    }
+
+
+def stale_artifacts(story_id: str, scene_id: str = None) -> list:
+    """Artifacts (optionally only those depending on a scene) whose inputs changed."""
+    manifest = load_manifest(story_id)
+    stale = []
+    for artifact, entry in manifest["artifacts"].items():
+        scene_files = list(scene_artifacts(scene_id).values()) if scene_id else []
+        if scene_id is not None and entry.get("scene_id") != scene_id and \
+                not any(name in entry["inputs"] for name in scene_files):
+            continue
+        state = artifact_state(story_id, artifact, entry)
+        if state["status"] == "stale":
+            stale.append({"artifact": artifact, **state})
+    return stale
+
+
+def story_status(story_id: str) -> dict:
+    """
+    Per-scene view of a story's files and whether each image, narration,
+    waveform and scene video (and story.mp4) is fresh, stale, missing or
+    untracked, from the manifest.
+    """
+    story_dir = _story_dir(story_id)
+    manifest = load_manifest(story_id)
+    artifacts = manifest["artifacts"]
+
+    scene_ids = set()
+    for sub, suffix in (("images", ".png"), ("audios", ".mp3"), ("videos", ".mp4")):
+        folder = story_dir / sub
+        if folder.exists():
+            for path in folder.glob(f"*{suffix}"):
+                if not path.name.startswith((".", "enhanced_", "preview_")) and \
+                        not path.stem.endswith("_mixed"):
+                    scene_ids.add(path.stem)
+    scene_ids.update(e["scene_id"] for e in artifacts.values() if e.get("scene_id"))
+
+    scenes = {}
+    stale = []
+    for scene_id in sorted(scene_ids):
+        scenes[scene_id] = {}
+        for field, kind in SCENE_STATUS_FIELDS:
+            artifact = scene_artifacts(scene_id)[kind]
+            scenes[scene_id][field] = artifact_state(story_id, artifact, artifacts.get(artifact))
+            if scenes[scene_id][field]["status"] == "stale":
+                stale.append(artifact)
+
+    story = artifact_state(story_id, "story.mp4", artifacts.get("story.mp4"))
+    if story["status"] == "fresh":
+        # A stale scene video makes the merged story stale too, even before it is re-rendered.
+        # Timeline renders read images and audio directly, so only their video inputs count here.
+        merged = [name[len("videos/"):-len(".mp4")] for name in artifacts["story.mp4"]["inputs"]
+                  if name.startswith("videos/")]
+        stale_scenes = [s for s in merged if scenes.get(s, {}).get("video", {}).get("status") != "fresh"]
+        if stale_scenes:
+            story = {"status": "stale", "reasons": [f"scene {s} video is not fresh" for s in stale_scenes]}
+
+    return {
+        "story_id": story_id,
+        "scenes": scenes,
+        "story": story,
+        "stale_scenes": [s for s, info in scenes.items() if info["video"]["status"] == "stale"],
+        "stale_artifacts": stale + (["story.mp4"] if story["status"] == "stale" else []),
+    }
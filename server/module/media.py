@@ -0,0 +1,267 @@
+import json
+import os
+import subprocess
+import threading
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+# "subprocess" runs the ffmpeg/ffprobe CLIs, "pyav" decodes and encodes in-process through libav
+MEDIA_BACKEND = os.getenv("MEDIA_BACKEND", "subprocess")
+
+VIDEO_ENCODER_OPTIONS = {"preset": "veryfast", "profile": "high", "level": "4.0"}
+VIDEO_AUDIO_BITRATE = "192k"
+VIDEO_AUDIO_RATE = 48000  # Scene videos carry 48 kHz stereo AAC, what merge_videos expects
+VIDEO_AUDIO_CHANNELS = 2
+PREVIEW_BITRATE = "96k"  # Windowed mix and enhancement previews, rendered while a slider is tuned
+
+
+class MediaBackend(ABC):
+    """
+    The media operations the pipeline runs many times per story: probes, PCM
+    decodes, filtered audio transcodes and encodes of generated frames.
+
+    Every method takes and returns plain paths, dicts and NumPy arrays, so
+    callers do not depend on how the work is done. Errors are raised as
+    RuntimeError (or ValueError when a stream is missing).
+    """
+
+    name = None
+
+    @abstractmethod
+    def probe_audio(self, path: str) -> dict:
+        """sample_rate, channels, codec_name of the first audio stream and the container duration."""
+
+    @abstractmethod
+    def probe_video(self, path: str) -> dict:
+        """
+        codec_name, profile, level, width, height, pix_fmt, frame_rate ("num/den")
+        and duration of the first video stream.
+        """
+
+    @abstractmethod
+    def stream_durations(self, path: str) -> dict:
+        """video_duration and audio_duration in seconds, 0 for a missing stream."""
+
+    @abstractmethod
+    def format_duration(self, path: str) -> float:
+        """Container duration in seconds."""
+
+    @abstractmethod
+    def iter_audio_blocks(self, path: str, sample_rate: int, channels: int, block_frames: int,
+                          start: float = None, duration: float = None, filters: list = None):
+        """
+        Yield float32 blocks of shape (block_frames, channels) of (a window of)
+        ``path``. ``filters`` (ffmpeg filter strings) run on the decoded audio
+        before it is converted to ``sample_rate`` and ``channels``.
+        """
+
+    def decode_audio(self, path: str, sample_rate: int, channels: int, start: float = None,
+                     duration: float = None) -> np.ndarray:
+        blocks = list(self.iter_audio_blocks(path, sample_rate, channels, sample_rate * 10, start, duration))
+        if not blocks:
+            return np.zeros((0, channels), dtype=np.float32)
+        return np.concatenate(blocks)
+
+    @abstractmethod
+    def transcode_audio(self, input_path: str, output_path: str, output_format: str = None, codec: str = None,
+                        bitrate: str = None, sample_rate: int = None, channels: int = None,
+                        sample_fmt: str = None, filters: list = None, start: float = None,
+                        duration: float = None, raw_input: tuple = None):
+        """
+        Decode ``input_path``, run it through the ``filters`` chain (ffmpeg
+        filter strings) and encode it to ``output_path``. ``raw_input`` is
+        (sample_rate, channels) when the input is headerless float32 PCM.
+        """
+
+    @abstractmethod
+    def encode_video(self, frames, width: int, height: int, fps: int, audio_path: str, output_path: str):
+        """
+        Encode raw yuv420p ``frames`` (an iterable of byte strings holding
+        whole frames) to H.264 with ``audio_path`` as 48 kHz stereo AAC, cut
+        to the shorter of the two.
+        """
+
+
+class SubprocessBackend(MediaBackend):
+    """One ffmpeg or ffprobe process per operation, data exchanged over pipes."""
+
+    name = "subprocess"
+
+    def _probe(self, path: str, selector: str = None, entries: str = "") -> dict:
+        cmd = ["ffprobe", "-v", "error"]
+        if selector:
+            cmd += ["-select_streams", selector]
+        cmd += ["-show_entries", entries, "-of", "json", str(path)]
+        result = subprocess.run(cmd, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"ffprobe failed on {path}: {result.stderr.strip()}")
+        return json.loads(result.stdout)
+
+    def probe_audio(self, path):
+        info = self._probe(path, "a:0", "stream=sample_rate,channels,codec_name:format=duration")
+        if not info.get("streams"):
+            raise ValueError(f"No audio stream found in {path}")
+        stream = info["streams"][0]
+        return {
+            "sample_rate": int(stream["sample_rate"]),
+            "channels": int(stream["channels"]),
+            "codec_name": stream.get("codec_name", ""),
+            "duration": float(info.get("format", {}).get("duration") or 0),
+        }
+
+    def probe_video(self, path):
+        info = self._probe(path, "v:0", "stream=codec_name,profile,level,width,height,pix_fmt,r_frame_rate,duration")
+        if not info.get("streams"):
+            raise ValueError(f"No video stream found in {path}")
+        stream = info["streams"][0]
+        return {
+            "codec_name": stream.get("codec_name", ""),
+            "profile": stream.get("profile", ""),
+            "level": int(stream.get("level", 0)),
+            "width": int(stream.get("width", 0)),
+            "height": int(stream.get("height", 0)),
+            "pix_fmt": stream.get("pix_fmt", ""),
+            "frame_rate": stream.get("r_frame_rate", "25/1"),
+            "duration": float(stream.get("duration") or 0),
+        }
+
+    def stream_durations(self, path):
+        durations = {}
+        for key, selector in (("video_duration", "v:0"), ("audio_duration", "a:0")):
+            streams = self._probe(path, selector, "stream=duration").get("streams") or [{}]
+            durations[key] = float(streams[0].get("duration") or 0)
+        return durations
+
+    def format_duration(self, path):
+        return float(self._probe(path, entries="format=duration")["format"]["duration"])
+
+    @staticmethod
+    def _decode_command(path, sample_rate, channels, start=None, duration=None, filters=None):
+        cmd = ["ffmpeg", "-v", "error", "-nostdin"]
+        if start:
+            cmd += ["-ss", f"{start:.3f}"]  # input seeking: only the window is decoded
+        if duration:
+            cmd += ["-t", f"{duration:.3f}"]
+        cmd += ["-i", str(path)]
+        if filters:
+            cmd += ["-af", ",".join(filters)]
+        return cmd + ["-f", "f32le", "-acodec", "pcm_f32le", "-ac", str(channels), "-ar", str(sample_rate), "-"]
+
+    def iter_audio_blocks(self, path, sample_rate, channels, block_frames, start=None, duration=None, filters=None):
+        return iter_pcm_blocks(
+            self._decode_command(path, sample_rate, channels, start, duration, filters), channels, block_frames, path)
+
+    def decode_audio(self, path, sample_rate, channels, start=None, duration=None):
+        result = subprocess.run(self._decode_command(path, sample_rate, channels, start, duration),
+                                capture_output=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"ffmpeg failed to decode {path}: {result.stderr.decode(errors='replace')}")
+        return np.frombuffer(result.stdout, dtype=np.float32).reshape(-1, channels)
+
+    def transcode_audio(self, input_path, output_path, output_format=None, codec=None, bitrate=None,
+                        sample_rate=None, channels=None, sample_fmt=None, filters=None, start=None,
+                        duration=None, raw_input=None):
+        cmd = ["ffmpeg", "-v", "error", "-nostdin", "-y"]
+        if raw_input:
+            cmd += ["-f", "f32le", "-ar", str(raw_input[0]), "-ac", str(raw_input[1])]
+        if start:
+            cmd += ["-ss", f"{start:.3f}"]
+        if duration:
+            cmd += ["-t", f"{duration:.3f}"]
+        cmd += ["-i", str(input_path)]
+        if filters:
+            cmd += ["-af", ",".join(filters)]
+        for flag, value in (("-acodec", codec), ("-sample_fmt", sample_fmt), ("-b:a", bitrate),
+                            ("-ar", sample_rate), ("-ac", channels), ("-f", output_format)):
+            if value:
+                cmd += [flag, str(value)]
+        cmd.append(str(output_path))
+        result = subprocess.run(cmd, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"ffmpeg failed to transcode {input_path}: {result.stderr.strip()}")
+
+    def encode_video(self, frames, width, height, fps, audio_path, output_path):
+        command = [
+            "ffmpeg", "-y", "-v", "error",
+            "-f", "rawvideo", "-pix_fmt", "yuv420p", "-s", f"{width}x{height}", "-r", str(fps),
+            "-i", "-",
+            "-i", str(audio_path),
+            "-c:v", "libx264",
+            "-preset", VIDEO_ENCODER_OPTIONS["preset"],
+            "-profile:v", VIDEO_ENCODER_OPTIONS["profile"],
+            "-level", VIDEO_ENCODER_OPTIONS["level"],
+            "-pix_fmt", "yuv420p",
+            "-c:a", "aac",
+            "-b:a", VIDEO_AUDIO_BITRATE,
+            "-ar", str(VIDEO_AUDIO_RATE),
+            "-ac", str(VIDEO_AUDIO_CHANNELS),
+            "-shortest",
+            "-movflags", "+faststart",
+            str(output_path)
+        ]
+        proc = subprocess.Popen(command, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+        # Drain stderr so a chatty encoder can never block on a full pipe
+        stderr = []
+        drain = threading.Thread(target=lambda: stderr.append(proc.stderr.read()), daemon=True)
+        drain.start()
+        try:
+            for data in frames:
+                proc.stdin.write(data)
+            proc.stdin.close()
+        except BrokenPipeError:
+            pass  # ffmpeg exited early; its error is reported below
+        except BaseException:
+            proc.kill()
+            raise
+        finally:
+            drain.join()
+        if proc.wait() != 0:
+            raise RuntimeError(f"ffmpeg failed to encode frames: {b''.join(stderr).decode(errors='replace')}")
+
+
+def iter_pcm_blocks(cmd: list, channels: int, block_frames: int, label: str = "audio"):
+    """Run an ffmpeg command writing f32le to stdout and yield (frames, channels) blocks."""
+    frame_bytes = 4 * channels
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    finished = False
+    try:
+        while True:
+            data = proc.stdout.read(block_frames * frame_bytes)
+            if not data:
+                break
+            usable = len(data) - len(data) % frame_bytes
+            yield np.frombuffer(data[:usable], dtype=np.float32).reshape(-1, channels)
+        finished = True
+    finally:
+        proc.stdout.close()
+        if not finished:
+            proc.kill()  # consumer stopped early
+        stderr = proc.stderr.read()
+        proc.stderr.close()
+        if proc.wait() != 0 and finished:
+            raise RuntimeError(f"ffmpeg failed to decode {label}: {stderr.decode(errors='replace')}")
+
+
+_backend = None
+
+
+def get_media_backend() -> MediaBackend:
+    """The deployment's backend, chosen once from MEDIA_BACKEND."""
+    global _backend
+    if _backend is None:
+        _backend = create_media_backend(MEDIA_BACKEND)
+        print(f"Using {_backend.name} media backend")
+    return _backend
+
+
+def create_media_backend(name: str) -> MediaBackend:
+    if name == "subprocess":
+        return SubprocessBackend()
+    if name == "pyav":
+        try:
+            from module.media_pyav import PyAVBackend
+        except ImportError as e:
+            raise RuntimeError("MEDIA_BACKEND=pyav needs the optional 'av' package (pip install av)") from e
+        return PyAVBackend()
+    raise ValueError(f"Unknown MEDIA_BACKEND {name!r}, expected 'subprocess' or 'pyav'")
@@ -0,0 +1,236 @@
+from fractions import Fraction
+
+import av
+import numpy as np
+
+from module.media import (
+    MediaBackend, VIDEO_AUDIO_BITRATE, VIDEO_AUDIO_CHANNELS, VIDEO_AUDIO_RATE, VIDEO_ENCODER_OPTIONS
+)
+
+
+def _layout(channels: int) -> str:
+    return {1: "mono", 2: "stereo"}.get(channels, f"{channels}c")
+
+
+def _bitrate_bits(bitrate) -> int:
+    bitrate = str(bitrate).lower()
+    return int(float(bitrate[:-1]) * 1000) if bitrate.endswith("k") else int(bitrate)
+
+
+def _open_input(path, raw_input=None):
+    if raw_input:
+        sample_rate, channels = raw_input
+        return av.open(str(path), format="f32le",
+                       options={"sample_rate": str(sample_rate), "ch_layout": _layout(channels)})
+    return av.open(str(path))
+
+
+def _audio_stream(container, path):
+    if not container.streams.audio:
+        raise ValueError(f"No audio stream found in {path}")
+    return container.streams.audio[0]
+
+
+def _drain(graph):
+    """Frames the graph can produce now; None once it has been flushed to the end."""
+    frames = []
+    while True:
+        try:
+            frames.append(graph.pull())
+        except BlockingIOError:
+            return frames
+        except EOFError:
+            frames.append(None)
+            return frames
+
+
+class _AudioChain:
+    """
+    abuffer -> [atrim window] -> filters -> abuffersink, built from the first
+    decoded frame so it matches what the decoder actually outputs.
+    """
+
+    def __init__(self, filters: list, start: float = None, duration: float = None):
+        self.filters = list(filters or [])
+        if start or duration:
+            # Frames keep their source timestamps after a seek, so atrim cuts the exact window
+            trim = [f"start={start:.6f}"] if start else []
+            trim += [f"duration={duration:.6f}"] if duration else []
+            self.filters = [f"atrim={':'.join(trim)}", "asetpts=PTS-STARTPTS"] + self.filters
+        self.graph = None
+
+    def _configure(self, frame):
+        self.graph = av.filter.Graph()
+        node = self.graph.add_abuffer(format=frame.format.name, sample_rate=frame.sample_rate,
+                                      layout=frame.layout.name, time_base=frame.time_base)
+        for spec in self.filters or ["anull"]:
+            name, _, args = spec.partition("=")
+            nxt = self.graph.add(name, args or None)
+            node.link_to(nxt)
+            node = nxt
+        node.link_to(self.graph.add("abuffersink"))
+        self.graph.configure()
+
+    def push(self, frame):
+        if self.graph is None:
+            if frame is None:
+                return [None]
+            self._configure(frame)
+        self.graph.push(frame)
+        return _drain(self.graph)
+
+
+def _filtered_frames(path, filters=None, start=None, duration=None, raw_input=None):
+    """Decode ``path`` through an audio filter chain and yield the output frames."""
+    with _open_input(path, raw_input) as container:
+        stream = _audio_stream(container, path)
+        if start:
+            # Like ffmpeg's -ss, ``start`` counts from the stream start (e.g. after an MP3 encoder delay)
+            start += float(stream.start_time * stream.time_base) if stream.start_time else 0.0
+            container.seek(int(start * av.time_base))
+        chain = _AudioChain(filters, start, duration)
+        for frame in container.decode(stream):
+            for out in chain.push(frame):
+                if out is None:
+                    return  # atrim reached the end of the window
+                yield out
+        for out in chain.push(None):
+            if out is not None:
+                yield out
+
+
+class PyAVBackend(MediaBackend):
+    """
+    In-process libav through PyAV: no process start-up, no pipe copies, and
+    decoded frames go straight from decoder to filter graph to encoder.
+    """
+
+    name = "pyav"
+
+    def probe_audio(self, path):
+        with av.open(str(path)) as container:
+            stream = _audio_stream(container, path)
+            codec = stream.codec_context
+            return {
+                "sample_rate": int(codec.sample_rate),
+                "channels": int(codec.channels),
+                "codec_name": codec.codec.canonical_name,
+                "duration": (container.duration or 0) / av.time_base,
+            }
+
+    def probe_video(self, path):
+        with av.open(str(path)) as container:
+            if not container.streams.video:
+                raise ValueError(f"No video stream found in {path}")
+            stream = container.streams.video[0]
+            codec = stream.codec_context
+            duration = stream.duration * stream.time_base if stream.duration else 0
+            return {
+                "codec_name": codec.codec.canonical_name,
+                "profile": codec.profile or "",
+                "level": codec.level,
+                "width": codec.width,
+                "height": codec.height,
+                "pix_fmt": codec.pix_fmt or "",
+                "frame_rate": str(stream.base_rate or stream.average_rate or "25/1"),
+                "duration": float(duration),
+            }
+
+    def stream_durations(self, path):
+        with av.open(str(path)) as container:
+            durations = {}
+            for key, streams in (("video_duration", container.streams.video),
+                                 ("audio_duration", container.streams.audio)):
+                stream = streams[0] if streams else None
+                duration = stream.duration * stream.time_base if stream is not None and stream.duration else 0
+                durations[key] = float(duration)
+            return durations
+
+    def format_duration(self, path):
+        with av.open(str(path)) as container:
+            if container.duration is None:
+                raise ValueError(f"No duration in {path}")
+            return container.duration / av.time_base
+
+    def iter_audio_blocks(self, path, sample_rate, channels, block_frames, start=None, duration=None, filters=None):
+        to_pcm = f"aformat=sample_fmts=flt:sample_rates={sample_rate}:channel_layouts={_layout(channels)}"
+        pending, size = [], 0
+        try:
+            for frame in _filtered_frames(path, [*(filters or []), to_pcm], start, duration):
+                pending.append(frame.to_ndarray().reshape(-1, channels))
+                size += frame.samples
+                if size >= block_frames:
+                    data = np.concatenate(pending)
+                    yield data[:block_frames]
+                    pending, size = [data[block_frames:]], size - block_frames
+        except av.FFmpegError as e:
+            raise RuntimeError(f"libav failed to decode {path}: {e}") from e
+        if size:
+            yield np.concatenate(pending)
+
+    def transcode_audio(self, input_path, output_path, output_format=None, codec=None, bitrate=None,
+                        sample_rate=None, channels=None, sample_fmt=None, filters=None, start=None,
+                        duration=None, raw_input=None):
+        chain = list(filters or [])
+        if sample_rate or channels:
+            target = [f"sample_rates={sample_rate}"] if sample_rate else []
+            target += [f"channel_layouts={_layout(channels)}"] if channels else []
+            chain.append(f"aformat={':'.join(target)}")
+        try:
+            with av.open(str(output_path), "w", format=output_format) as output:
+                stream = None
+                for frame in _filtered_frames(input_path, chain, start, duration, raw_input):
+                    if stream is None:
+                        # Like the CLI, the output takes the rate and layout the filter chain ends with;
+                        # the encoder converts sample format and frame size itself
+                        stream = output.add_stream(codec or output.default_audio_codec, rate=frame.sample_rate)
+                        stream.codec_context.layout = frame.layout.name
+                        if sample_fmt:
+                            stream.codec_context.format = sample_fmt
+                        if bitrate:
+                            stream.codec_context.bit_rate = _bitrate_bits(bitrate)
+                    frame.pts = None
+                    output.mux(stream.encode(frame))
+                if stream is None:
+                    raise ValueError(f"No audio decoded from {input_path}")
+                output.mux(stream.encode(None))
+        except av.FFmpegError as e:
+            raise RuntimeError(f"libav failed to transcode {input_path}: {e}") from e
+
+    def encode_video(self, frames, width, height, fps, audio_path, output_path):
+        try:
+            with av.open(str(output_path), "w", format="mp4", options={"movflags": "+faststart"}) as output:
+                video = output.add_stream("libx264", rate=fps, options=dict(VIDEO_ENCODER_OPTIONS))
+                video.width, video.height, video.pix_fmt = width, height, "yuv420p"
+                audio = output.add_stream("aac", rate=VIDEO_AUDIO_RATE)
+                audio.codec_context.layout = _layout(VIDEO_AUDIO_CHANNELS)
+                audio.codec_context.bit_rate = _bitrate_bits(VIDEO_AUDIO_BITRATE)
+
+                to_aac = f"aformat=sample_rates={VIDEO_AUDIO_RATE}:channel_layouts={_layout(VIDEO_AUDIO_CHANNELS)}"
+                audio_frames = _filtered_frames(audio_path, [to_aac])
+                audio_samples = 0
+
+                frame_bytes = width * height * 3 // 2
+                index = 0
+                for data in frames:
+                    for offset in range(0, len(data) - frame_bytes + 1, frame_bytes):
+                        # Keep the audio up with the picture so packets reach the muxer interleaved
+                        while audio_frames is not None and audio_samples * fps < (index + 1) * VIDEO_AUDIO_RATE:
+                            frame = next(audio_frames, None)
+                            if frame is None:
+                                audio_frames = None
+                                break
+                            audio_samples += frame.samples
+                            frame.pts = None
+                            output.mux(audio.encode(frame))
+                        if audio_frames is None and index * VIDEO_AUDIO_RATE >= audio_samples * fps:
+                            break  # -shortest: the narration has ended
+                        plane = np.frombuffer(data, np.uint8, frame_bytes, offset).reshape(-1, width)
+                        frame = av.VideoFrame.from_ndarray(plane, format="yuv420p")
+                        frame.pts, frame.time_base = index, Fraction(1, fps)
+                        output.mux(video.encode(frame))
+                        index += 1
+                output.mux(video.encode(None))
+                output.mux(audio.encode(None))
+        except av.FFmpegError as e:
+            raise RuntimeError(f"libav failed to encode frames: {e}") from e
@@ -0,0 +1,98 @@
+import json
+import os
+from pathlib import Path
+
+from module.media import get_media_backend
+from module.util import content_hash
+
+# "mezzanine" keeps a lossless master next to every narration the pipeline writes
+AUDIO_PIPELINE = os.getenv("AUDIO_PIPELINE", "mp3")
+
+MEZZANINE_DIR = "mezzanine"
+MEZZANINE_FORMAT = "flac"
+MEZZANINE_RATE = 48000
+MEZZANINE_CHANNELS = 2
+# Output options of every master write; 48 kHz stereo is also what merge_videos expects
+MEZZANINE_OPTIONS = {
+    "codec": "flac", "sample_fmt": "s16",
+    "sample_rate": MEZZANINE_RATE, "channels": MEZZANINE_CHANNELS,
+}
+PLAYBACK_BITRATE = "192k"  # The MP3 the UI plays, encoded from the master
+
+
+def mezzanine_enabled() -> bool:
+    return AUDIO_PIPELINE == "mezzanine"
+
+
+def mezzanine_path(audio_path) -> Path:
+    """Masters live in the story's mezzanine/ dir, named after the audio file they back."""
+    audio_path = Path(audio_path)
+    return audio_path.parent.parent / MEZZANINE_DIR / f"{audio_path.stem}.{MEZZANINE_FORMAT}"
+
+
+def _pairing_path(audio_path) -> Path:
+    return mezzanine_path(audio_path).with_suffix(".json")
+
+
+def mezzanine_source(audio_path) -> str:
+    """
+    The file a stage should read instead of ``audio_path``: its master if the
+    MP3 was encoded from it, otherwise the file itself. A replaced or uploaded
+    MP3 no longer matches the recorded hash, so an outdated master is never used.
+    """
+    master = mezzanine_path(audio_path)
+    pairing = _pairing_path(audio_path)
+    if master.exists() and pairing.exists() and os.path.exists(audio_path):
+        with open(pairing, "r", encoding="utf-8") as f:
+            if json.load(f).get("preview_hash") == content_hash(audio_path):
+                return str(master)
+    return str(audio_path)
+
+
+def write_master(audio_path, render):
+    """
+    Produce the master of ``audio_path`` with ``render(path)``, which must
+    write FLAC using MEZZANINE_OPTIONS, then encode ``audio_path`` from it as the
+    MP3 the UI plays. That preview is the only lossy encode of the stage.
+    """
+    audio_path = Path(audio_path)
+    master = mezzanine_path(audio_path)
+    master.parent.mkdir(parents=True, exist_ok=True)
+    audio_path.parent.mkdir(parents=True, exist_ok=True)
+    part_path = master.with_name(f".{master.name}.part")
+    try:
+        render(str(part_path))
+        os.replace(part_path, master)
+    finally:
+        if part_path.exists():
+            part_path.unlink()
+
+    preview_part = audio_path.with_name(f".{audio_path.name}.part")
+    get_media_backend().transcode_audio(master, preview_part, "mp3", codec="libmp3lame", bitrate=PLAYBACK_BITRATE)
+    os.replace(preview_part, audio_path)
+
+    with open(_pairing_path(audio_path), "w", encoding="utf-8") as f:
+        json.dump({
+            "preview_hash": content_hash(audio_path),
+            "sample_rate": MEZZANINE_RATE,
+            "channels": MEZZANINE_CHANNELS,
+            "format": MEZZANINE_FORMAT,
+        }, f, indent=2)
+    print(f"Audio master saved to {master}")
+    return master
+
+
+def convert_to_master(source, audio_path):
+    """Write ``source`` (any format ffmpeg reads) as the master of ``audio_path``."""
+    return write_master(audio_path, lambda path: get_media_backend().transcode_audio(
+        source, path, MEZZANINE_FORMAT, **MEZZANINE_OPTIONS))
+
+
+def move_master(src_audio_path, dst_audio_path):
+    """Carry the master along when an audio file is renamed; drop the old one otherwise."""
+    for src, dst in ((mezzanine_path(src_audio_path), mezzanine_path(dst_audio_path)),
+                     (_pairing_path(src_audio_path), _pairing_path(dst_audio_path))):
+        if src.exists():
+            os.replace(src, dst)
+        elif dst.exists():
+            dst.unlink()
@@ -0,0 +1,244 @@
+import json
+import os
+import tempfile
+import threading
+
+import numpy as np
+
+from module.media import get_media_backend
+from module.util import content_hash
+
+MIX_BLOCK_SECONDS = 10  # Base audio is streamed through the mixer in blocks of this size
+NORMALIZE_HEADROOM_DB = 0.1  # Same headroom as pydub.effects.normalize
+
+_mix_peaks = {}
+_mix_peaks_lock = threading.Lock()
+
+
+def probe_audio(path: str) -> dict:
+    """Return sample rate, channel count, codec and duration of the first audio stream."""
+    return get_media_backend().probe_audio(str(path))
+
+
+def decode_audio(path: str, sample_rate: int, channels: int, start: float = None,
+                 duration: float = None) -> np.ndarray:
+    """Decode (a window of) an audio file to a float32 array of shape (frames, channels)."""
+    return get_media_backend().decode_audio(str(path), sample_rate, channels, start, duration)
+
+
+def iter_audio_blocks(path: str, sample_rate: int, channels: int, block_frames: int,
+                      start: float = None, duration: float = None, filters: list = None):
+    """Stream an audio file as float32 blocks of ``block_frames`` frames without decoding it all."""
+    return get_media_backend().iter_audio_blocks(str(path), sample_rate, channels, block_frames, start, duration,
+                                                 filters)
+
+
+class OverlayTrack:
+    """
+    An overlay decoded once into memory and rendered lazily per block.
+
+    Looping is index arithmetic (``position % len``) rather than a materialized
+    repeated copy; gain and fade envelopes are computed only for the frames of
+    the block being mixed. ``samples`` may hold only a window of the source,
+    starting at source frame ``offset``, out of ``source_frames`` in total.
+    """
+
+    def __init__(self, samples: np.ndarray, sample_rate: int, config: dict, base_frames: int,
+                 source_frames: int = None, offset: int = 0):
+        self.samples = samples
+        self.offset = offset
+        self.period = len(samples) if source_frames is None else source_frames
+        self.start = overlay_start(config, sample_rate)
+        self.loop = bool(config.get('loop', False)) and self.period > 0
+        if self.loop:
+            # A looped overlay runs to the end of the base audio
+            self.length = max(base_frames - self.start, 0)
+        else:
+            self.length = self.period
+        volume_db = config.get('volume_db', 0) or config.get('volume', 0) or 0
+        self.gain = np.float32(10 ** (volume_db / 20))
+        self.fade_in = int(config.get('fade_in_ms', 0) * sample_rate / 1000)
+        self.fade_out = int(config.get('fade_out_ms', 0) * sample_rate / 1000)
+
+    def render(self, block_start: int, block_frames: int):
+        """Return (offset_in_block, samples) for the overlap with this block, or None."""
+        begin = max(block_start, self.start)
+        end = min(block_start + block_frames, self.start + self.length)
+        if begin >= end or not len(self.samples):
+            return None
+        rel = np.arange(begin - self.start, end - self.start)
+        src = (rel % self.period if self.loop else rel) - self.offset
+        if self.offset or self.period != len(self.samples):
+            # A windowed decode can end a little short of the probed length; the rest stays silent
+            valid = (src >= 0) & (src < len(self.samples))
+            chunk = np.zeros((len(src), self.samples.shape[1]), dtype=np.float32)
+            chunk[valid] = self.samples[src[valid]]
+        else:
+            chunk = self.samples[src]
+
+        envelope = None
+        if self.fade_in > 0:
+            envelope = np.clip(rel / self.fade_in, 0.0, 1.0)
+        if self.fade_out > 0:
+            fade = np.clip((self.length - rel) / self.fade_out, 0.0, 1.0)
+            envelope = fade if envelope is None else envelope * fade
+        if envelope is not None:
+            chunk = chunk * (envelope.astype(np.float32) * self.gain)[:, None]
+        elif self.gain != 1:
+            chunk = chunk * self.gain
+        return begin - block_start, chunk
+
+
+def overlay_start(config: dict, sample_rate: int) -> int:
+    return int(config.get('start_time_ms', 0) * sample_rate / 1000)
+
+
+def load_overlay(path: str, config: dict, sample_rate: int, channels: int, base_frames: int,
+                 window: tuple = None) -> OverlayTrack:
+    """
+    Decode an overlay, or only the part of it heard in the ``window``
+    (first, end) of base frames.
+
+    A one-shot overlay is decoded from a seek to the window; a looped one only
+    when the window falls inside its first pass, since any later window can
+    wrap around and needs the whole loop.
+    """
+    whole_duration = config['duration_ms'] / 1000 if config.get('duration_ms') else None
+    if window is None:
+        return OverlayTrack(decode_audio(path, sample_rate, channels, duration=whole_duration),
+                            sample_rate, config, base_frames)
+
+    source_frames = int(round(probe_audio(path)["duration"] * sample_rate))
+    if whole_duration:
+        source_frames = min(source_frames, int(whole_duration * sample_rate))
+    start = overlay_start(config, sample_rate)
+    first, last = max(window[0] - start, 0), window[1] - start
+    if not config.get('loop', False):
+        last = min(last, source_frames)
+    if last <= first:
+        # Not heard in the window at all
+        return OverlayTrack(np.zeros((0, channels), dtype=np.float32), sample_rate, config, base_frames,
+                            source_frames)
+    if last > source_frames or (first == 0 and last == source_frames):
+        # The whole clip, decoded to its exact length so a loop repeats seamlessly
+        return OverlayTrack(decode_audio(path, sample_rate, channels, duration=whole_duration),
+                            sample_rate, config, base_frames)
+    samples = decode_audio(path, sample_rate, channels, first / sample_rate or None, (last - first) / sample_rate)
+    return OverlayTrack(samples, sample_rate, config, base_frames, source_frames, first)
+
+
+def encode_audio(raw_path: str, sample_rate: int, channels: int, output_file: str,
+                 export_format: str, gain: float = 1.0, bitrate: str = None, output_options: dict = None):
+    """Encode a raw float32 file once into the requested container/codec (plus any extra output options)."""
+    filters = [f"volume={gain:.6f}"] if abs(gain - 1.0) > 1e-6 else []
+    get_media_backend().transcode_audio(
+        raw_path, output_file, export_format, bitrate=bitrate, filters=filters,
+        raw_input=(sample_rate, channels), **(output_options or {})
+    )
+
+
+def _load_overlays(processed_tracks: list, sample_rate: int, channels: int, base_frames: int,
+                   window: tuple = None) -> list:
+    overlays = []
+    for track in processed_tracks:
+        overlay = load_overlay(track['file_path'], track['config'], sample_rate, channels, base_frames, window)
+        overlays.append(overlay)
+        print(f"Decoded overlay {track['file_path']}: {len(overlay.samples) / sample_rate:.2f}s")
+    return overlays
+
+
+def _mixed_blocks(base_audio: str, overlays: list, sample_rate: int, channels: int, position: int,
+                  start: float = None, duration: float = None):
+    """Yield the base in MIX_BLOCK_SECONDS blocks with the overlays added, from base frame ``position``."""
+    for block in iter_audio_blocks(base_audio, sample_rate, channels, MIX_BLOCK_SECONDS * sample_rate,
+                                   start, duration):
+        block = block.copy()
+        for overlay in overlays:
+            rendered = overlay.render(position, len(block))
+            if rendered is not None:
+                offset, chunk = rendered
+                block[offset:offset + len(chunk)] += chunk
+        yield block
+        position += len(block)
+
+
+def mix_peak(base_audio: str, processed_tracks: list) -> float:
+    """
+    Peak of the whole mix, which a windowed render normalizes to so it
+    matches the final mix. Measured without encoding and cached per base,
+    overlay contents and track configs.
+    """
+    key = (content_hash(base_audio), tuple(
+        (content_hash(track['file_path']), json.dumps(track['config'], sort_keys=True))
+        for track in processed_tracks
+    ))
+    peak = _mix_peaks.get(key)
+    if peak is None:
+        info = probe_audio(base_audio)
+        sample_rate, channels = info["sample_rate"], info["channels"]
+        base_frames = int(round(info["duration"] * sample_rate))
+        overlays = _load_overlays(processed_tracks, sample_rate, channels, base_frames)
+        peak = 0.0
+        for block in _mixed_blocks(base_audio, overlays, sample_rate, channels, 0):
+            peak = max(peak, float(np.abs(block).max(initial=0.0)))
+        with _mix_peaks_lock:
+            _mix_peaks[key] = peak
+    return peak
+
+
+def mix_tracks(base_audio: str, processed_tracks: list, output_file: str, normalize: bool = True,
+               export_format: str = "mp3", bitrate: str = None, start: float = None,
+               duration: float = None, output_options: dict = None, peak: float = None) -> dict:
+    """
+    Mix overlay tracks under a base track with bounded memory.
+
+    Overlays are decoded once to float32 at the base's sample rate and layout,
+    only as far as the rendered window needs them.
+    The base is streamed in MIX_BLOCK_SECONDS blocks; every block gets the
+    overlay contributions added in place and is appended to a raw float32 temp
+    file while the running peak is tracked. Peak normalization is then folded
+    into the single final encode as a gain.
+
+    ``start``/``duration`` (seconds) render only a window of the mix: the base
+    is decoded from a seek to ``start`` and overlay positions, loops and fades
+    stay measured from the start of the base. ``peak`` normalizes to a known
+    peak instead of the rendered one; a window given the whole mix's peak
+    (see mix_peak) has the loudness of the final mix.
+    """
+    info = probe_audio(base_audio)
+    sample_rate, channels = info["sample_rate"], info["channels"]
+    base_frames = int(round(info["duration"] * sample_rate))
+    window_start = int(round((start or 0) * sample_rate))
+
+    window = None
+    if start or duration:
+        window_end = window_start + int(round(duration * sample_rate)) if duration else base_frames
+        window = (window_start, window_end)
+
+    overlays = _load_overlays(processed_tracks, sample_rate, channels, base_frames, window)
+
+    rendered_peak = 0.0
+    position = window_start
+    fd, raw_path = tempfile.mkstemp(suffix=".f32")
+    try:
+        with os.fdopen(fd, "wb") as raw:
+            for block in _mixed_blocks(base_audio, overlays, sample_rate, channels, window_start, start, duration):
+                rendered_peak = max(rendered_peak, float(np.abs(block).max(initial=0.0)))
+                raw.write(block.tobytes())
+                position += len(block)
+
+        gain = 1.0
+        normalize_peak = rendered_peak if peak is None else peak
+        if normalize and normalize_peak > 0:
+            gain = 10 ** (-NORMALIZE_HEADROOM_DB / 20) / normalize_peak
+            print(f"Normalizing mix: peak {normalize_peak:.4f}, gain {gain:.4f}")
+        encode_audio(raw_path, sample_rate, channels, output_file, export_format, gain, bitrate, output_options)
+    finally:
+        os.remove(raw_path)
+
+    return {
+        "duration_seconds": (position - window_start) / sample_rate,
+        "sample_rate": sample_rate,
+        "channels": channels,
+        "peak": rendered_peak,
+    }
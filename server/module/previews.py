@@ -0,0 +1,184 @@
+import os
+import shutil
+import subprocess
+from pathlib import Path
+
+from PIL import Image
+
+from module.media import get_media_backend
+
+PREVIEWS_DIR = "previews"
+PREVIEW_KINDS = ("proxy", "poster", "sprite")
+PROXY_HEIGHT = int(os.getenv("PROXY_HEIGHT", "360"))
+PROXY_CRF = 30
+PROXY_AUDIO_BITRATE = "64k"
+THUMB_WIDTH = 160
+SPRITE_INTERVAL = float(os.getenv("SPRITE_INTERVAL", "2"))  # Seconds of video per thumbnail
+SPRITE_COLUMNS = 10
+SPRITE_ROWS = 10
+PREVIEW_MEDIA_TYPES = {".mp4": "video/mp4", ".jpg": "image/jpeg", ".vtt": "text/vtt"}
+
+
+def preview_dir(video_path) -> Path:
+    """Previews live in the story's previews/ dir; scene videos sit in videos/, story.mp4 at the story root."""
+    video_path = Path(video_path)
+    story_dir = video_path.parent.parent if video_path.parent.name == "videos" else video_path.parent
+    return story_dir / PREVIEWS_DIR
+
+
+def preview_paths(video_path) -> dict:
+    """
+    Files rendered alongside ``video_path``. ``sprite`` is an image2 pattern:
+    a long video gets one sheet per SPRITE_COLUMNS x SPRITE_ROWS thumbnails.
+    """
+    directory, stem = preview_dir(video_path), Path(video_path).stem
+    return {
+        "proxy": directory / f"{stem}_proxy.mp4",
+        "poster": directory / f"{stem}_poster.jpg",
+        "sprite": directory / f"{stem}_sprite_%03d.jpg",
+        "thumbnails": directory / f"{stem}_thumbnails.vtt",
+    }
+
+
+def preview_urls(story_id: str, video_path) -> dict:
+    """URLs of the previews of ``video_path`` that exist, keyed like the response fields."""
+    urls = {}
+    for kind, field in (("proxy", "proxy_url"), ("poster", "poster_url"), ("thumbnails", "thumbnails_url")):
+        path = preview_paths(video_path)[kind]
+        if path.exists():
+            urls[field] = f"http://localhost:8000/files/{story_id}/{PREVIEWS_DIR}/{path.name}"
+    return urls
+
+
+def _thumbs_dir(video_path) -> Path:
+    # Single thumbnails written by the sprite branch, until write_sprites tiles them into sheets
+    return preview_dir(video_path) / f".{Path(video_path).stem}_thumbs"
+
+
+def _sheet_path(video_path, number: int) -> Path:
+    pattern = preview_paths(video_path)["sprite"]
+    return pattern.with_name(pattern.name % number)
+
+
+def preview_graph(source: str, video_path, main_label: str = None, kinds=PREVIEW_KINDS) -> str:
+    """
+    Filtergraph that splits the decoded picture of ``source`` (a graph
+    segment such as ``[0:v]zoompan=...``) into the preview branches, plus
+    ``[main_label]`` for the full-res output when given. Every branch reads
+    the same decoded frames, so nothing is decoded twice.
+    """
+    branches = ([main_label] if main_label else []) + list(kinds)
+    # Converted once before the split, rather than per branch from the (often RGB) source
+    graph = [f"{source},format=yuv420p,split={len(branches)}{''.join(f'[{b}]' for b in branches)}"]
+    if "proxy" in kinds:
+        graph.append(f"[proxy]scale=-2:'min({PROXY_HEIGHT},ih)'[proxy_out]")
+    if "poster" in kinds:
+        graph.append("[poster]trim=end_frame=1[poster_out]")
+    if "sprite" in kinds:
+        graph.append(
+            f"[sprite]select='isnan(prev_selected_t)+gte(t-prev_selected_t,{SPRITE_INTERVAL:g})',"
+            f"scale={THUMB_WIDTH}:-2[sprite_out]"
+        )
+    return ";".join(graph)
+
+
+def preview_outputs(video_path, audio_map: str = None, shortest: bool = False, kinds=PREVIEW_KINDS) -> list:
+    """ffmpeg output options writing the branches of preview_graph, to append after the main output."""
+    paths = preview_paths(video_path)
+    paths["proxy"].parent.mkdir(parents=True, exist_ok=True)
+    args = []
+    if "proxy" in kinds:
+        args += ["-map", "[proxy_out]"]
+        if audio_map:
+            args += ["-map", audio_map, "-c:a", "aac", "-b:a", PROXY_AUDIO_BITRATE, "-ar", "48000", "-ac", "2"]
+        # Same profile and level as the full render, so a remux can extend it the same way
+        args += ["-c:v", "libx264", "-preset", "veryfast", "-profile:v", "high", "-level", "4.0",
+                 "-crf", str(PROXY_CRF)]
+        if shortest:
+            args.append("-shortest")
+        args += ["-movflags", "+faststart", str(paths["proxy"])]
+    if "poster" in kinds:
+        args += ["-map", "[poster_out]", "-frames:v", "1", "-update", "1", "-q:v", "3", str(paths["poster"])]
+    if "sprite" in kinds:
+        # Thumbnails are written one by one as they are selected; a tile filter would hold
+        # every decoded frame of the other branches until it had a whole sheet
+        thumbs_dir = _thumbs_dir(video_path)
+        shutil.rmtree(thumbs_dir, ignore_errors=True)
+        thumbs_dir.mkdir()
+        args += ["-map", "[sprite_out]", "-fps_mode", "passthrough", "-q:v", "5", str(thumbs_dir / "thumb_%04d.jpg")]
+    return args
+
+
+def write_sprites(video_path):
+    """
+    Tile the thumbnails of the sprite branch into sheets of SPRITE_COLUMNS x
+    SPRITE_ROWS and index them in WebVTT: one cue per thumbnail, pointing at
+    its cell with a ``#xywh=`` media fragment.
+    """
+    thumbs_dir = _thumbs_dir(video_path)
+    thumbs = sorted(thumbs_dir.glob("thumb_*.jpg"))
+    per_sheet = SPRITE_COLUMNS * SPRITE_ROWS
+    try:
+        duration = get_media_backend().probe_video(str(video_path))["duration"]
+        if not thumbs or not duration:
+            return None
+        for old in preview_dir(video_path).glob(f"{Path(video_path).stem}_sprite_*.jpg"):
+            old.unlink()
+        with Image.open(thumbs[0]) as thumb:
+            width, height = thumb.size
+        for number, first in enumerate(range(0, len(thumbs), per_sheet), start=1):
+            cells = thumbs[first:first + per_sheet]
+            rows = -(-len(cells) // SPRITE_COLUMNS)
+            sheet = Image.new("RGB", (SPRITE_COLUMNS * width, rows * height))
+            for cell, path in enumerate(cells):
+                row, column = divmod(cell, SPRITE_COLUMNS)
+                with Image.open(path) as thumb:
+                    sheet.paste(thumb, (column * width, row * height))
+            sheet.save(_sheet_path(video_path, number), format="JPEG", quality=80)
+    finally:
+        shutil.rmtree(thumbs_dir, ignore_errors=True)
+
+    def timestamp(seconds: float) -> str:
+        hours, rest = divmod(seconds, 3600)
+        minutes, seconds = divmod(rest, 60)
+        return f"{int(hours):02d}:{int(minutes):02d}:{seconds:06.3f}"
+
+    # select keeps the first frame and then one every SPRITE_INTERVAL
+    lines = ["WEBVTT", ""]
+    for index in range(len(thumbs)):
+        sheet, cell = divmod(index, per_sheet)
+        row, column = divmod(cell, SPRITE_COLUMNS)
+        start, end = index * SPRITE_INTERVAL, min((index + 1) * SPRITE_INTERVAL, duration)
+        lines += [
+            f"{timestamp(start)} --> {timestamp(end)}",
+            f"{_sheet_path(video_path, sheet + 1).name}#xywh={column * width},{row * height},{width},{height}",
+            "",
+        ]
+    vtt_path = preview_paths(video_path)["thumbnails"]
+    vtt_path.write_text("\n".join(lines), encoding="utf-8")
+    return vtt_path
+
+
+def render_previews(video_path, source=None, kinds=PREVIEW_KINDS):
+    """
+    Render previews of an existing video in one decode, for renders that
+    cannot carry the preview branches themselves. ``source`` reads another
+    file with the same picture instead (e.g. the proxy, for new sprites).
+    """
+    command = [
+        "ffmpeg", "-y", "-v", "error",
+        "-i", str(source or video_path),
+        "-filter_complex", preview_graph("[0:v]null", video_path, kinds=kinds),
+        *preview_outputs(video_path, audio_map="0:a?", kinds=kinds)
+    ]
+    subprocess.run(command, check=True)
+    if "sprite" in kinds:
+        write_sprites(video_path)
+    print(f"Previews of {video_path} saved to {preview_dir(video_path)}")
+
+
+def ensure_previews(video_path):
+    """Render the previews of a video rendered before they existed (e.g. a cached scene)."""
+    paths = preview_paths(video_path)
+    if not all(paths[kind].exists() for kind in ("proxy", "poster", "thumbnails")):
+        render_previews(video_path)
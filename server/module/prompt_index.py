@@ -0,0 +1,229 @@
+import base64
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from pathlib import Path
+
+# Entries live under DATA_DIR like a story so images are reachable through
+# /files/_prompt_index/images/{entry_id}.png
+INDEX_NAME = "_prompt_index"
+
+NUM_BINS = 64
+BANDS = 16
+ROWS_PER_BAND = NUM_BINS // BANDS  # LSH threshold ~ (1/16)^(1/4) ~= 0.5
+MAX_CANDIDATES = 64
+# Metadata an image is only reusable under: the same story, size and reference scene
+SCOPE_FIELDS = ("story_id", "width", "height", "reference_scene_id")
+_EMPTY = 1 << 64
+
+_TOKEN_RE = re.compile(r"[a-z0-9']+")
+
+
+def _hash64(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), "little")
+
+
+def shingle_prompt(visual_prompt: str, negative_prompt: str = None) -> set:
+    """
+    Turn a (visual, negative) prompt pair into a set of hashed word shingles.
+    Unigrams and bigrams are used so "same hallway, now darker" still shares
+    most of its shingles with the original hallway prompt.
+    """
+    shingles = set()
+    for prefix, text in (("v", visual_prompt), ("n", negative_prompt)):
+        tokens = _TOKEN_RE.findall((text or "").lower())
+        for i, token in enumerate(tokens):
+            shingles.add(_hash64(f"{prefix}:{token}"))
+            if i + 1 < len(tokens):
+                shingles.add(_hash64(f"{prefix}:{token} {tokens[i + 1]}"))
+    return shingles
+
+
+def minhash_signature(shingles: set) -> list:
+    """
+    One-permutation MinHash: every shingle is hashed once, the low bits pick a
+    bin and each bin keeps its minimum.  Empty bins borrow from the next filled
+    bin (rotation densification), so a signature costs O(shingles) instead of
+    O(shingles * permutations).
+    """
+    signature = [_EMPTY] * NUM_BINS
+    for x in shingles:
+        b = x % NUM_BINS
+        v = x // NUM_BINS
+        if v < signature[b]:
+            signature[b] = v
+    if all(v == _EMPTY for v in signature):
+        return signature
+    for b in range(NUM_BINS):
+        if signature[b] != _EMPTY:
+            continue
+        offset = 1
+        while signature[(b + offset) % NUM_BINS] == _EMPTY:
+            offset += 1
+        signature[b] = signature[(b + offset) % NUM_BINS] + offset * _EMPTY
+    return signature
+
+
+def jaccard(a: set, b: set) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def _band_keys(signature: list):
+    for band in range(BANDS):
+        start = band * ROWS_PER_BAND
+        yield (band, *signature[start:start + ROWS_PER_BAND])
+
+
+class PromptIndex:
+    """
+    Local near-duplicate index over previously generated (prompt, image) pairs.
+
+    MinHash signatures are bucketed with LSH banding, so a lookup only touches
+    entries that share at least one band with the query; candidates are then
+    ranked by exact Jaccard similarity of their shingle sets.
+    """
+
+    def __init__(self, index_dir: str):
+        self.index_dir = Path(index_dir)
+        self.images_dir = self.index_dir / "images"
+        self.log_path = self.index_dir / "index.jsonl"
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._shingles = {}
+        self._buckets = {}
+        self._exact = {}
+        self._load()
+
+    def _load(self):
+        if not self.log_path.exists():
+            return
+        with open(self.log_path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                self._insert(entry)
+        print(f"Loaded {len(self._entries)} prompts into the prompt index")
+
+    def _insert(self, entry: dict):
+        old_id = self._exact.get(entry["key"])
+        if old_id:
+            self._remove(old_id)
+        entry_id = entry["id"]
+        self._entries[entry_id] = entry
+        self._shingles[entry_id] = shingle_prompt(entry["visual_prompt"], entry.get("negative_prompt"))
+        self._exact[entry["key"]] = entry_id
+        for key in _band_keys(entry["signature"]):
+            self._buckets.setdefault(key, set()).add(entry_id)
+
+    def _remove(self, entry_id: str):
+        entry = self._entries.pop(entry_id, None)
+        self._shingles.pop(entry_id, None)
+        if not entry:
+            return
+        for key in _band_keys(entry["signature"]):
+            bucket = self._buckets.get(key)
+            if bucket:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._buckets[key]
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, visual_prompt: str, negative_prompt: str, image_base64: str, metadata: dict = None) -> str:
+        """Store a generated image and index its prompt pair. Returns the entry id."""
+        shingles = shingle_prompt(visual_prompt, negative_prompt)
+        metadata = metadata or {}
+        # Same prompt in another scope is a different image, so the scope is part of the exact key
+        scope = json.dumps([metadata.get(field) for field in SCOPE_FIELDS])
+        key = hashlib.sha256(f"{visual_prompt}\x00{negative_prompt or ''}\x00{scope}".encode()).hexdigest()
+        entry_id = key[:16]
+        entry = {
+            "id": entry_id,
+            "key": key,
+            "visual_prompt": visual_prompt,
+            "negative_prompt": negative_prompt,
+            "signature": minhash_signature(shingles),
+            "image": f"{entry_id}.png",
+            "created_at": time.time(),
+            "metadata": metadata,
+        }
+        with self._lock:
+            self.images_dir.mkdir(parents=True, exist_ok=True)
+            with open(self.images_dir / entry["image"], "wb") as f:
+                f.write(base64.b64decode(image_base64))
+            with open(self.log_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+            self._insert(entry)
+        return entry_id
+
+    def query(self, visual_prompt: str, negative_prompt: str = None, threshold: float = 0.5,
+              limit: int = 3, where: dict = None) -> list:
+        """
+        Return up to ``limit`` stored entries whose prompt similarity is at least
+        ``threshold``, best match first. ``where`` keeps only entries whose
+        metadata has exactly those values.
+        """
+        shingles = shingle_prompt(visual_prompt, negative_prompt)
+        signature = minhash_signature(shingles)
+        with self._lock:
+            hits = {}
+            for key in _band_keys(signature):
+                for entry_id in self._buckets.get(key, ()):
+                    hits[entry_id] = hits.get(entry_id, 0) + 1
+            if where:
+                # Filtered before the cut, so near-duplicates outside the scope cannot crowd out a match
+                hits = {
+                    entry_id: count for entry_id, count in hits.items()
+                    if all(self._entries[entry_id].get("metadata", {}).get(field) == value
+                           for field, value in where.items())
+                }
+            # Shared bands approximate similarity; only the best candidates get
+            # an exact Jaccard comparison
+            candidates = sorted(hits, key=hits.get, reverse=True)[:MAX_CANDIDATES]
+            scored = []
+            for entry_id in candidates:
+                similarity = jaccard(shingles, self._shingles[entry_id])
+                if similarity >= threshold:
+                    scored.append((similarity, entry_id))
+            scored.sort(reverse=True)
+            return [
+                {
+                    "id": entry_id,
+                    "similarity": round(similarity, 4),
+                    "visual_prompt": self._entries[entry_id]["visual_prompt"],
+                    "negative_prompt": self._entries[entry_id].get("negative_prompt"),
+                    "image": self._entries[entry_id]["image"],
+                    "metadata": self._entries[entry_id].get("metadata", {}),
+                }
+                for similarity, entry_id in scored[:limit]
+            ]
+
+    def load_image_base64(self, entry_id: str) -> str:
+        with open(self.images_dir / f"{entry_id}.png", "rb") as f:
+            return base64.b64encode(f.read()).decode("utf-8")
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_prompt_index() -> PromptIndex:
+    """Return the process-wide prompt index, loading it on first use."""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                index_dir = os.getenv("PROMPT_INDEX_DIR") or \
+                    str(Path(os.getenv("DATA_DIR", "/story")) / INDEX_NAME)
+                _index = PromptIndex(index_dir)
+    return _index
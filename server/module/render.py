@@ -0,0 +1,417 @@
+import base64
+import json
+import os
+import threading
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+
+from module.image import generate_scene_image
+from module.kenburns import create_kenburns_video
+from module.ingest import get_render_size, ingest_image
+from module.manifest import (
+    params_hash, record_file, render_if_stale, scene_video_inputs, scene_video_params, story_video_inputs,
+    NARRATION, SCENE_VIDEO, STORY_VIDEO
+)
+from module.mezzanine import mezzanine_source
+from module.text import generate_text
+from module.timeline import build_timeline, render_timeline, timeline_inputs
+from module.video import create_video_with_ffmpeg, merge_videos, replace_video_audio
+from module.voice import generate_tts, generate_tts_chunked, narration_params
+from module.waveform import try_generate_waveform
+
+RENDER_DIR = "render"
+STATE_FILE = "state.json"
+
+# Concurrency per resource: provider quotas for the APIs, cores for ffmpeg
+RESOURCE_LIMITS = {
+    "llm": int(os.getenv("RENDER_LLM_CONCURRENCY", "4")),
+    "image": int(os.getenv("RENDER_IMAGE_CONCURRENCY", "2")),
+    "tts": int(os.getenv("RENDER_TTS_CONCURRENCY", "4")),
+    "cpu": int(os.getenv("RENDER_CPU_CONCURRENCY", str(max((os.cpu_count() or 2) // 2, 1)))),
+}
+
+PENDING, RUNNING, DONE, FAILED, BLOCKED = "pending", "running", "done", "failed", "blocked"
+
+
+class RenderNode:
+    def __init__(self, node_id: str, resource: str, run, deps=(), scene_id: str = None, inputs: dict = None):
+        self.id = node_id
+        self.resource = resource
+        self.run = run  # callable(outputs of deps by node id) -> dict of outputs
+        self.deps = list(deps)
+        self.scene_id = scene_id
+        # Everything the node reads besides its dependencies' outputs; a change means it must run again
+        self.inputs_hash = params_hash(inputs or {})
+
+
+class StoryRender:
+    """
+    Dependency graph of every step needed to turn a story into story.mp4.
+
+    Per scene: visual prompt -> image, narration (independent of the image),
+    then the scene video once both exist; the merge waits for all scene videos.
+    With the "timeline" renderer there are no scene videos and story.mp4 is
+    encoded in one pass once every image and narration exists.
+    Ready nodes are submitted to one thread pool per resource, whose size is
+    that resource's concurrency limit, so image generation, TTS and encodes
+    overlap and wall time tends toward the critical path.
+
+    A generated visual prompt is conditioned on the previous scene's text, as
+    in the editor, so prompt nodes are independent and run in parallel up to
+    the "llm" limit. Only a scene with continue_prompt set is conditioned on
+    the previous scene's prompt, and waits for it when that one is generated.
+
+    Node status and outputs are written to render/state.json after every
+    transition. A new run of the same story resumes: completed nodes whose
+    inputs are unchanged, whose dependencies resumed too and whose output
+    files still exist are not executed again.
+    """
+
+    def __init__(self, story_id: str, scenes: list, options: dict):
+        self.story_id = story_id
+        self.scenes = scenes
+        self.options = options
+        self.data_dir = Path(os.getenv("DATA_DIR", "/story")) / story_id
+        self.state_path = self.data_dir / RENDER_DIR / STATE_FILE
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self.nodes = {}
+        self._build_graph()
+        self.state = self._load_state()
+
+    # Graph
+
+    def _add(self, node: RenderNode):
+        self.nodes[node.id] = node
+
+    def _build_graph(self):
+        size = get_render_size(self.story_id, self.options.get("width"), self.options.get("height"))
+        width, height = size or (1280, 720)
+        self.width, self.height = width, height
+
+        genre = self.options.get("genre")
+        renderer = self.options.get("renderer")
+        previous_scene, previous_prompt_id = None, None
+        for scene in self.scenes:
+            sid = scene["scene_id"]
+            image_path = self.data_dir / "images" / f"{sid}.png"
+            audio_path = self.data_dir / "audios" / f"{sid}.mp3"
+            video_path = self.data_dir / "videos" / f"{sid}.mp4"
+
+            image_deps = []
+            if scene.get("visual_prompt"):
+                prompt_id = None
+            else:
+                prompt_id = f"prompt:{sid}"
+                prompt_reference, reference_id = (previous_scene or {}).get("text", ""), None
+                if scene.get("continue_prompt") and previous_scene:
+                    prompt_reference, reference_id = previous_scene.get("visual_prompt"), previous_prompt_id
+                self._add(RenderNode(prompt_id, "llm", self._prompt_task(scene, prompt_reference, reference_id),
+                                     [reference_id] if reference_id else [], sid,
+                                     {"text": scene["text"], "reference": prompt_reference, "genre": genre}))
+                image_deps.append(prompt_id)
+            reference = scene.get("reference_scene_id")
+            if reference and f"image:{reference}" in self.nodes:
+                # Image-to-image references need the referenced image to exist first
+                image_deps.append(f"image:{reference}")
+            self._add(RenderNode(f"image:{sid}", "image",
+                                 self._image_task(scene, prompt_id, image_path), image_deps, sid, {
+                                     "visual_prompt": scene.get("visual_prompt"),
+                                     "negative_prompt": scene.get("negative_prompt"),
+                                     "reference_scene_id": reference,
+                                     "width": self.width,
+                                     "height": self.height,
+                                 }))
+            self._add(RenderNode(f"tts:{sid}", "tts", self._tts_task(scene, audio_path), scene_id=sid, inputs={
+                "text": scene.get("narration") or scene["text"],
+                "voice_settings": self._voice_settings(scene),
+            }))
+            if renderer != "timeline":
+                self._add(RenderNode(f"video:{sid}", "cpu",
+                                     self._video_task(scene, image_path, audio_path, video_path),
+                                     [f"image:{sid}", f"tts:{sid}"], sid,
+                                     {"animation": scene.get("animation"), "kenburns": scene.get("kenburns"),
+                                      "width": self.width, "height": self.height}))
+            previous_scene, previous_prompt_id = scene, prompt_id
+
+        if self.options.get("renderer") == "timeline":
+            # One encode straight from every image and narration, without scene videos
+            deps = [f"{kind}:{scene['scene_id']}" for scene in self.scenes for kind in ("image", "tts")]
+            self._add(RenderNode("merge", "cpu", self._timeline_task(), deps, inputs={
+                "renderer": renderer, "width": self.width, "height": self.height,
+                "animations": [scene.get("animation") for scene in self.scenes],
+            }))
+        else:
+            video_ids = [f"video:{scene['scene_id']}" for scene in self.scenes]
+            self._add(RenderNode("merge", "cpu", self._merge_task(), video_ids, inputs={
+                "renderer": renderer, "width": self.width, "height": self.height,
+            }))
+
+    def _voice_settings(self, scene) -> dict:
+        return {**self.options.get("voice_settings", {}), **scene.get("voice_settings", {})}
+
+    def _prompt_task(self, scene, reference, reference_id):
+        def run(dep_outputs):
+            # With reference_id the scene continues the previous scene's generated prompt
+            text_reference = dep_outputs[reference_id]["visual_prompt"] if reference_id else reference
+            prompt = generate_text(scene["text"], text_reference, genre=self.options.get("genre"))
+            return {"visual_prompt": prompt}
+        return run
+
+    def _image_task(self, scene, prompt_id, image_path):
+        def run(dep_outputs):
+            prompt = scene.get("visual_prompt") or dep_outputs[prompt_id]["visual_prompt"]
+            image_base64 = generate_scene_image(
+                story_id=self.story_id,
+                scene_id=scene["scene_id"],
+                visual_prompt=prompt,
+                width=self.width,
+                height=self.height,
+                negative_prompt=scene.get("negative_prompt"),
+                reference_scene_id=scene.get("reference_scene_id")
+            )
+            ingest_image(self.story_id, scene["scene_id"], base64.b64decode(image_base64),
+                         width=self.width, height=self.height)
+            return {"file": str(image_path)}
+        return run
+
+    def _tts_task(self, scene, audio_path):
+        def run(_):
+            audio_path.parent.mkdir(parents=True, exist_ok=True)
+            voice_settings = self._voice_settings(scene)
+            tts = generate_tts_chunked if voice_settings.get("chunked", False) else generate_tts
+            text = scene.get("narration") or scene["text"]
+            _, duration = tts(
+                text,
+                audio_path,
+                voice=voice_settings.get("voice", "coral"),
+                instruction=voice_settings.get("instruction", ""),
+                use_cache=not voice_settings.get("force_regenerate", False)
+            )
+            record_file(audio_path, NARRATION, params=narration_params(text, voice_settings), scene_id=scene["scene_id"])
+            try_generate_waveform(audio_path)
+            return {"file": str(audio_path), "duration": duration}
+        return run
+
+    def _video_task(self, scene, image_path, audio_path, video_path):
+        def run(_):
+            video_path.parent.mkdir(parents=True, exist_ok=True)
+            # Same parameters /generate/video records for a single-frame or kenburns render
+            params = {"animation_type": "single-frame", "animation": scene.get("animation"), "ffmpeg_command": None}
+            if scene.get("kenburns"):
+                params.update(animation_type="kenburns", animation=None, kenburns=scene["kenburns"])
+                render = lambda: create_kenburns_video(
+                    image_path=str(image_path),
+                    audio_path=mezzanine_source(audio_path),
+                    settings=scene["kenburns"],
+                    output_path=str(video_path)
+                )
+            else:
+                render = lambda: create_video_with_ffmpeg(
+                    image_path=str(image_path),
+                    audio_path=mezzanine_source(audio_path),
+                    animation_str=scene.get("animation"),
+                    output_path=str(video_path)
+                )
+            cached = render_if_stale(
+                self.story_id,
+                f"videos/{scene['scene_id']}.mp4",
+                SCENE_VIDEO,
+                scene_video_inputs(scene["scene_id"]),
+                scene_video_params(self.story_id, scene["scene_id"], params),
+                render,
+                scene_id=scene["scene_id"],
+                partial={
+                    f"audios/{scene['scene_id']}.mp3": lambda: replace_video_audio(str(video_path), mezzanine_source(audio_path))
+                }
+            )
+            return {"file": str(video_path), "cached": cached}
+        return run
+
+    def _merge_task(self):
+        def run(_):
+            output_path = self.data_dir / "story.mp4"
+            scene_ids = [s["scene_id"] for s in self.scenes]
+            video_paths = [str(self.data_dir / "videos" / f"{scene_id}.mp4") for scene_id in scene_ids]
+            cached = render_if_stale(
+                self.story_id,
+                "story.mp4",
+                STORY_VIDEO,
+                story_video_inputs(scene_ids),
+                {"scenes": scene_ids, "width": self.width, "height": self.height},
+                lambda: merge_videos(video_paths, str(output_path), width=self.width, height=self.height)
+            )
+            return {"file": str(output_path), "cached": cached}
+        return run
+
+    def _timeline_task(self):
+        def run(_):
+            output_path = self.data_dir / "story.mp4"
+            scene_ids = [s["scene_id"] for s in self.scenes]
+            timeline = build_timeline(self.story_id, scene_ids,
+                                      {s["scene_id"]: s.get("animation") for s in self.scenes})
+            cached = render_if_stale(
+                self.story_id,
+                "story.mp4",
+                STORY_VIDEO,
+                timeline_inputs(timeline),
+                # Same parameters /accumulate records for a timeline render
+                {"renderer": "timeline", "timeline": timeline, "width": self.width, "height": self.height},
+                lambda: render_timeline(self.story_id, timeline, output_path, self.width, self.height)
+            )
+            return {"file": str(output_path), "cached": cached}
+        return run
+
+    # State
+
+    def _load_state(self) -> dict:
+        previous = {}
+        if self.options.get("resume", True) and self.state_path.exists():
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                previous = json.load(f).get("nodes", {})
+        nodes = {}
+        for node_id, node in self.nodes.items():
+            entry = previous.get(node_id, {})
+            output_file = entry.get("outputs", {}).get("file")
+            # Insertion order is topological, so dependencies were decided already
+            resumable = entry.get("status") == DONE and entry.get("deps") == node.deps and \
+                entry.get("inputs_hash") == node.inputs_hash and \
+                (not output_file or os.path.exists(output_file)) and \
+                all(nodes[dep]["resumed"] for dep in node.deps)
+            nodes[node_id] = {
+                "status": DONE if resumable else PENDING,
+                "resource": node.resource,
+                "scene_id": node.scene_id,
+                "deps": node.deps,
+                "inputs_hash": node.inputs_hash,
+                "outputs": entry.get("outputs", {}) if resumable else {},
+                "resumed": resumable,
+                "error": None,
+                "started_at": entry.get("started_at") if resumable else None,
+                "finished_at": entry.get("finished_at") if resumable else None,
+            }
+        return {
+            "story_id": self.story_id,
+            "status": PENDING,
+            "started_at": None,
+            "finished_at": None,
+            "limits": RESOURCE_LIMITS,
+            "nodes": nodes,
+        }
+
+    def _save_state(self):
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.state_path.with_name(f".{STATE_FILE}.tmp")
+        with self._save_lock:
+            with self._lock:
+                payload = json.dumps(self.state, indent=2)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(payload)
+            os.replace(tmp_path, self.state_path)
+
+    def _set(self, node_id: str, **fields):
+        with self._lock:
+            self.state["nodes"][node_id].update(fields)
+        self._save_state()
+
+    # Execution
+
+    def _execute(self, node: RenderNode):
+        self._set(node.id, status=RUNNING, started_at=time.time(), error=None)
+        dep_outputs = {dep: self.state["nodes"][dep]["outputs"] for dep in node.deps}
+        outputs = node.run(dep_outputs)
+        self._set(node.id, status=DONE, outputs=outputs, finished_at=time.time())
+
+    def _block_dependents(self, failed_id: str):
+        for node in self.nodes.values():
+            if failed_id in node.deps and self.state["nodes"][node.id]["status"] == PENDING:
+                self._set(node.id, status=BLOCKED, error=f"Dependency {failed_id} failed")
+                self._block_dependents(node.id)
+
+    def run(self) -> dict:
+        self.state["status"] = RUNNING
+        self.state["started_at"] = time.time()
+        self._save_state()
+        pools = {resource: ThreadPoolExecutor(max_workers=limit, thread_name_prefix=f"render-{resource}")
+                 for resource, limit in RESOURCE_LIMITS.items()}
+        running = {}
+        try:
+            while True:
+                statuses = {node_id: entry["status"] for node_id, entry in self.state["nodes"].items()}
+                for node in self.nodes.values():
+                    if statuses[node.id] == PENDING and node.id not in running.values() and \
+                            all(statuses[dep] == DONE for dep in node.deps):
+                        running[pools[node.resource].submit(self._execute, node)] = node.id
+                if not running:
+                    break
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    node_id = running.pop(future)
+                    error = future.exception()
+                    if error is not None:
+                        traceback.print_exception(error)
+                        print(f"Render node {node_id} failed: {error}")
+                        self._set(node_id, status=FAILED, error=str(error), finished_at=time.time())
+                        self._block_dependents(node_id)
+        finally:
+            for pool in pools.values():
+                pool.shutdown(wait=True)
+
+        failed = any(entry["status"] in (FAILED, BLOCKED) for entry in self.state["nodes"].values())
+        self.state["status"] = FAILED if failed else DONE
+        self.state["finished_at"] = time.time()
+        self._save_state()
+        print(f"Story {self.story_id} render {self.state['status']} in "
+              f"{self.state['finished_at'] - self.state['started_at']:.1f}s")
+        return self.state
+
+
+_active_renders = {}
+_active_lock = threading.Lock()
+
+
+def start_story_render(story_id: str, scenes: list, options: dict) -> StoryRender:
+    """Start a render in a background thread; raises RuntimeError if one is already running."""
+    with _active_lock:
+        if story_id in _active_renders:
+            raise RuntimeError(f"A render for story {story_id} is already running")
+        render = StoryRender(story_id, scenes, options)
+        _active_renders[story_id] = render
+
+    def run():
+        try:
+            render.run()
+        except Exception as e:
+            traceback.print_exception(e)
+            print(f"Story render for {story_id} crashed: {e}")
+        finally:
+            with _active_lock:
+                _active_renders.pop(story_id, None)
+
+    render._save_state()
+    threading.Thread(target=run, name=f"render-{story_id}", daemon=True).start()
+    return render
+
+
+def get_render_status(story_id: str):
+    """Current state of the story's render: the live one if running, else the last persisted one."""
+    with _active_lock:
+        render = _active_renders.get(story_id)
+    if render is not None:
+        with render._lock:
+            state = json.loads(json.dumps(render.state))
+    else:
+        state_path = Path(os.getenv("DATA_DIR", "/story")) / story_id / RENDER_DIR / STATE_FILE
+        if not state_path.exists():
+            return None
+        with open(state_path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        if state.get("status") == RUNNING:
+            state["status"] = "interrupted"  # The process stopped mid-run; POST again to resume
+    counts = {}
+    for entry in state["nodes"].values():
+        counts[entry["status"]] = counts.get(entry["status"], 0) + 1
+    state["summary"] = counts
+    return state
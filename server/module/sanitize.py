@@ -0,0 +1,192 @@
+import json
+import os
+import re
+import threading
+import time
+from pathlib import Path
+
+DEFAULT_RULES_PATH = Path(__file__).parent / "rules" / "sanitize_rules.json"
+DEFAULT_GENRE = "default"
+RELOAD_CHECK_INTERVAL = 1.0  # seconds between rule file mtime checks
+
+
+_WORD_START = "\\b"
+
+
+def _first_char(expr: str):
+    """Return the literal first character of a regex, or None if it is not a plain letter/digit."""
+    if expr and expr[0].isalnum() and expr[1:2] not in ("?", "*", "{"):
+        return expr[0].lower()
+    return None
+
+
+def _has_top_level_alternation(expr: str) -> bool:
+    """Whether ``expr`` has a ``|`` outside any group or character class."""
+    depth, in_class, escaped = 0, False, False
+    for char in expr:
+        if escaped:
+            escaped = False
+        elif char == "\\":
+            escaped = True
+        elif in_class:
+            in_class = char != "]"
+        elif char == "[":
+            in_class = True
+        elif char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif char == "|" and depth == 0:
+            return True
+    return False
+
+
+class CompiledRules:
+    """
+    A rule list compiled into a single alternation.
+
+    Every rule becomes one named group, so one ``re.sub`` pass finds the
+    leftmost match of any rule and looks its replacement up by group name.
+    Replaced text is never rescanned by later rules.
+
+    Python's ``re`` tries every branch at every position, so when all rules
+    start at a word boundary the ``\\b`` is hoisted out of the alternation and
+    guarded by a lookahead on the possible first characters; positions that
+    cannot start any rule are rejected after a single character test. A rule
+    with a top-level ``|`` (``\\bblood|gore\\b``) only has the ``\\b`` on its
+    first branch, so its presence keeps the plain alternation.
+    """
+
+    def __init__(self, rules: list):
+        self._replacements = {}
+        # Literal terms are tried longest first so "heavy atmosphere" wins over "heavy"
+        literals = sorted((r for r in rules if "term" in r), key=lambda r: -len(r["term"]))
+        patterns = [r for r in rules if "pattern" in r]
+        expressions = []
+        for idx, rule in enumerate(patterns + literals):
+            name = f"r{idx}"
+            if "term" in rule:
+                expr = rf"\b{re.escape(rule['term'])}\b"
+            else:
+                expr = rule["pattern"]
+            expressions.append((name, expr))
+            self._replacements[name] = rule["replacement"]
+
+        if not expressions:
+            self.pattern = None
+            return
+
+        if all(expr.startswith(_WORD_START) and not _has_top_level_alternation(expr) for _, expr in expressions):
+            bodies = [(name, expr[len(_WORD_START):]) for name, expr in expressions]
+            first_chars = {_first_char(body) for _, body in bodies}
+            guard = _WORD_START
+            if None not in first_chars:
+                guard += f"(?=[{''.join(sorted(first_chars))}])"
+            alternation = "|".join(f"(?P<{name}>{body})" for name, body in bodies)
+            source = f"{guard}(?:{alternation})"
+        else:
+            source = "|".join(f"(?P<{name}>{expr})" for name, expr in expressions)
+        self.pattern = re.compile(source, re.IGNORECASE)
+
+    def _replace(self, match) -> str:
+        replacement = self._replacements[match.lastgroup]
+        text = match.group(0)
+        if text[:1].isupper() and replacement[:1].islower():
+            return replacement[:1].upper() + replacement[1:]
+        return replacement
+
+    def apply(self, text: str) -> str:
+        if not self.pattern or not text:
+            return text
+        return self.pattern.sub(self._replace, text)
+
+
+def _merge_rules(base: list, overrides: list) -> list:
+    """Overlay genre rules on a base list; rules with the same pattern/term replace the base rule."""
+    merged = {r.get("pattern", r.get("term")): r for r in base}
+    for rule in overrides:
+        merged[rule.get("pattern", rule.get("term"))] = rule
+    return [r for r in merged.values() if r.get("replacement") is not None]
+
+
+class SanitizationEngine:
+    """
+    Loads prompt rewrite rules from a JSON file and applies them in one pass.
+
+    The file maps genre names to rule groups ("sanitize", "visual", ...). A genre
+    is overlaid on "default" unless it names another base with "extends". The
+    file is re-read when its mtime changes, so rules can be edited live.
+    """
+
+    def __init__(self, rules_path: str = None):
+        self.rules_path = Path(rules_path or os.getenv("SANITIZE_RULES_PATH") or DEFAULT_RULES_PATH)
+        self._lock = threading.Lock()
+        self._raw = {}
+        self._compiled = {}
+        self._mtime = None
+        self._last_check = 0.0
+        self.reload()
+
+    def reload(self):
+        with open(self.rules_path, "r", encoding="utf-8") as f:
+            raw = json.load(f)
+        mtime = self.rules_path.stat().st_mtime
+        with self._lock:
+            self._raw = raw
+            self._compiled = {}
+            self._mtime = mtime
+        print(f"Loaded sanitization rules from {self.rules_path} (genres: {', '.join(raw)})")
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now - self._last_check < RELOAD_CHECK_INTERVAL:
+            return
+        self._last_check = now
+        try:
+            if self.rules_path.stat().st_mtime != self._mtime:
+                self.reload()
+        except Exception as e:
+            # Keep serving the last good rule set if the file is mid-edit or invalid
+            print(f"Could not reload sanitization rules: {e}")
+
+    def _resolve(self, genre: str, kind: str, seen=None) -> list:
+        seen = seen or set()
+        config = self._raw.get(genre) or {}
+        base = config.get("extends", DEFAULT_GENRE if genre != DEFAULT_GENRE else None)
+        if base and base not in seen:
+            seen.add(genre)
+            return _merge_rules(self._resolve(base, kind, seen), config.get(kind, []))
+        return _merge_rules([], config.get(kind, []))
+
+    def rules(self, kind: str, genre: str = None) -> CompiledRules:
+        self._maybe_reload()
+        genre = genre if genre in self._raw else DEFAULT_GENRE
+        key = (genre, kind)
+        compiled = self._compiled.get(key)
+        if compiled is None:
+            with self._lock:
+                compiled = self._compiled.get(key)
+                if compiled is None:
+                    compiled = CompiledRules(self._resolve(genre, kind))
+                    self._compiled[key] = compiled
+        return compiled
+
+    def apply(self, text: str, kind: str, genre: str = None) -> str:
+        return self.rules(kind, genre).apply(text)
+
+    def genres(self) -> list:
+        return list(self._raw)
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_sanitization_engine() -> SanitizationEngine:
+    """Return the process-wide sanitization engine, loading rules on first use."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = SanitizationEngine()
+    return _engine
@@ -1,75 +1,142 @@
+import hashlib
+import json
+import os
+import threading
+
+import httpx
 import openai
-import re
-
-# List of words/phrases that Gemini often flags
-SENSITIVE_TERMS = {
-    r"\btragic\b": "dramatic",
-    r"\bpoverty\b": "urban setting",
-    r"\blonely\b": "quiet",
-    r"\bisolated?\b": "peaceful",
-    r"\bsolitude\b": "serenity",
-    r"\bmelancholic\b": "moody",
-    r"\bgrief\b": "intense atmosphere",
-    r"\bsad(ness)?\b": "moody tone",
-    r"\babandon(ed|ment)?\b": "aged",
-    r"\bdecay\b": "weathered",
-    r"\bpoignant\b": "notable",
-    r"\bweary\b": "slow-spinning",
-    r"\bheavy atmosphere\b": "atmospheric lighting",
-    r"\bmemory|memories\b": "visual details",
-}
-
-def generate_text(prompt: str, reference: str) -> str:
-    """Generate a visual prompt from a story snippet, utilizing previous reference if present."""
-    client = openai.OpenAI()
-    response = client.chat.completions.create(
-        model="gpt-3.5-turbo",
+
+from module.cache import TTLCache
+from module.sanitize import get_sanitization_engine
+
+VISUAL_PROMPT_MODEL = os.getenv("VISUAL_PROMPT_MODEL", "gpt-3.5-turbo")
+VISUAL_PROMPT_TEMPERATURE = 0.7
+SYSTEM_PROMPT = "You generate visual prompts for image generation from story snippets."
+
+_client = None
+_client_lock = threading.Lock()
+
+# Visual prompts for the same snippet/reference are reused across undo, retries
+# and repeated requests instead of paying the full LLM latency again
+_response_cache = TTLCache(
+    maxsize=int(os.getenv("LLM_CACHE_SIZE", "512")),
+    ttl=float(os.getenv("LLM_CACHE_TTL", "3600"))
+)
+
+
+def get_openai_client() -> openai.OpenAI:
+    """
+    Return a process-wide OpenAI client backed by a keep-alive connection pool,
+    so consecutive requests reuse the TLS session instead of reconnecting.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = openai.OpenAI(
+                    http_client=httpx.Client(
+                        limits=httpx.Limits(
+                            max_connections=int(os.getenv("LLM_MAX_CONNECTIONS", "20")),
+                            max_keepalive_connections=int(os.getenv("LLM_MAX_KEEPALIVE", "10")),
+                            keepalive_expiry=120
+                        ),
+                        timeout=httpx.Timeout(60.0, connect=10.0)
+                    )
+                )
+    return _client
+
+
+def _cache_key(prompt: str, reference: str, model: str, temperature: float, genre: str) -> str:
+    payload = json.dumps([prompt, reference, model, temperature, genre])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def get_text_cache_stats() -> dict:
+    return _response_cache.stats()
+
+
+def generate_text(prompt: str, reference: str, genre: str = None, force_regenerate: bool = False) -> str:
+    """
+    Generate a visual prompt from a story snippet, utilizing previous reference if present.
+    Responses are cached by (snippet, reference, model, temperature, genre);
+    force_regenerate skips the cache lookup and stores the fresh response.
+    """
+    key = _cache_key(prompt, reference, VISUAL_PROMPT_MODEL, VISUAL_PROMPT_TEMPERATURE, genre)
+    if not force_regenerate:
+        cached = _response_cache.get(key)
+        if cached is not None:
+            print("Visual prompt served from cache")
+            return cached
+
+    response = get_openai_client().chat.completions.create(
+        model=VISUAL_PROMPT_MODEL,
         messages=[
-            {"role": "system", "content": "You generate visual prompts for image generation from story snippets."},
-            {"role": "user", "content": build_visual_prompt(prompt, reference)}
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": build_visual_prompt(prompt, reference, genre)}
         ],
-        temperature=0.7,
+        temperature=VISUAL_PROMPT_TEMPERATURE,
         n=1,
         stop=None,
     )
-    return response.choices[0].message.content.strip()
+    visual_prompt = sanitize_prompt(response.choices[0].message.content, genre)
+    _response_cache.set(key, visual_prompt)
+    return visual_prompt
+
+
+def stream_text(prompt: str, reference: str, genre: str = None, force_regenerate: bool = False):
+    """
+    Streaming variant of generate_text.
 
+    Yields ("token", text) for every content delta as it arrives and finally
+    ("done", visual_prompt) with the sanitized full prompt, which is also what
+    gets cached. A cache hit yields the cached prompt as a single token.
+    """
+    key = _cache_key(prompt, reference, VISUAL_PROMPT_MODEL, VISUAL_PROMPT_TEMPERATURE, genre)
+    if not force_regenerate:
+        cached = _response_cache.get(key)
+        if cached is not None:
+            print("Visual prompt served from cache")
+            yield "token", cached
+            yield "done", cached
+            return
+
+    stream = get_openai_client().chat.completions.create(
+        model=VISUAL_PROMPT_MODEL,
+        messages=[
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": build_visual_prompt(prompt, reference, genre)}
+        ],
+        temperature=VISUAL_PROMPT_TEMPERATURE,
+        n=1,
+        stream=True,
+    )
+    parts = []
+    for chunk in stream:
+        if not chunk.choices:
+            continue
+        token = chunk.choices[0].delta.content
+        if token:
+            parts.append(token)
+            yield "token", token
+    # Tokens are forwarded raw; the rule set needs whole words, so it runs once on the full text
+    visual_prompt = sanitize_prompt("".join(parts), genre)
+    _response_cache.set(key, visual_prompt)
+    yield "done", visual_prompt
 
 
-def sanitize_prompt(prompt: str) -> str:
+def sanitize_prompt(prompt: str, genre: str = None) -> str:
     """Replace sensitive or policy-flagging words with neutral alternatives."""
-    clean_prompt = prompt
-    for pattern, replacement in SENSITIVE_TERMS.items():
-        clean_prompt = re.sub(pattern, replacement, clean_prompt, flags=re.IGNORECASE)
-    return clean_prompt.strip()
+    return get_sanitization_engine().apply(prompt, "sanitize", genre).strip()
 
 
-def build_visual_prompt(prompt: str, reference: str = None) -> str:
+def build_visual_prompt(prompt: str, reference: str = None, genre: str = None) -> str:
     """
     Build a safe but atmospheric visual prompt for horror-style YouTube stories.
     Preserves named characters (like Arjun) while avoiding flagged sensitive terms.
+    Replacements come from the "visual" rules of the story genre (see module/rules).
     """
 
-    # Horror-friendly replacements
-    replacements = {
-        "sad": "ominous",
-        "lonely": "eerie",
-        "tragic": "mysterious",
-        "abandoned": "forgotten",
-        "solitude": "quiet stillness",
-        "decay": "aged and weathered",
-        "death": "dark presence",
-        "blood": "crimson glow",
-        "haunted": "shadowed",
-        "grief": "uneasy silence",
-        "melancholic": "moody",
-        "poverty": "old, atmospheric setting",
-        "corpse": "statue-like figure",
-    }
-
-    safe_prompt = prompt
-    for bad, good in replacements.items():
-        safe_prompt = safe_prompt.replace(bad, good)
+    safe_prompt = get_sanitization_engine().apply(prompt, "visual", genre)
 
     if reference:
         full_prompt = (
@@ -89,3 +156,102 @@ def build_visual_prompt(prompt: str, reference: str = None) -> str:
 
     return full_prompt
 
+
+
+def build_story_visual_prompt(scenes: list, reference: str = None, genre: str = None) -> str:
+    """
+    Build one instruction covering several consecutive scenes. The model answers
+    in JSON Lines (one object per scene) so each prompt can be parsed as soon as
+    its line is complete.
+    """
+    engine = get_sanitization_engine()
+    snippets = [
+        {"scene_id": scene["scene_id"], "snippet": engine.apply(scene["text"], "visual", genre)}
+        for scene in scenes
+    ]
+    continuity = (
+        f"The scene right before these ended with the visual prompt: '{reference}'. "
+        if reference else ""
+    )
+    return (
+        "You are an expert at creating cinematic visual prompts for image generation models. "
+        "Below are consecutive story scenes as JSON. For each scene generate a concise visual "
+        "description emphasizing eerie atmosphere, lighting, and detail. "
+        "Each prompt must build upon the previous scene's prompt so characters, setting and "
+        "lighting stay consistent; keep named characters clearly visible and describe their "
+        "presence, posture, or silhouette. Focus on visual detail, not emotions. "
+        f"{continuity}"
+        "Respond in JSON Lines: exactly one JSON object per line, in scene order, of the form "
+        '{"scene_id": "<scene_id>", "visual_prompt": "<prompt>"}. Output nothing else.\n'
+        f"Scenes: {json.dumps(snippets)}"
+    )
+
+
+def _parse_prompt_line(line: str):
+    line = line.strip().rstrip(",")
+    if not line.startswith("{"):
+        return None  # code fences, array brackets or chatter
+    try:
+        item = json.loads(line)
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(item, dict) or not item.get("visual_prompt"):
+        return None
+    return item
+
+
+def generate_story_visual_prompts(scenes: list, reference: str = None, genre: str = None,
+                                  batch_size: int = 10):
+    """
+    Generate continuity-aware visual prompts for a whole story.
+
+    Scenes ({"scene_id", "text"}) are sent in batches of ``batch_size`` per
+    streamed chat completion; a dict is yielded for each scene as soon as its
+    line has been parsed. The last prompt of a batch is the reference for the
+    next one. Scenes the model skipped fall back to a single-scene request.
+    Scene ids must be unique, since the model's answers are matched by id.
+    """
+    scene_ids = [scene["scene_id"] for scene in scenes]
+    if len(set(scene_ids)) != len(scene_ids):
+        raise ValueError("scene_id values must be unique")
+    client = get_openai_client()
+    for start in range(0, len(scenes), batch_size):
+        batch = scenes[start:start + batch_size]
+        pending = {scene["scene_id"]: start + i for i, scene in enumerate(batch)}
+        stream = client.chat.completions.create(
+            model=VISUAL_PROMPT_MODEL,
+            messages=[
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": build_story_visual_prompt(batch, reference, genre)}
+            ],
+            temperature=VISUAL_PROMPT_TEMPERATURE,
+            stream=True,
+        )
+        buffer = ""
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            buffer += chunk.choices[0].delta.content or ""
+            while "\n" in buffer:
+                line, buffer = buffer.split("\n", 1)
+                item = _parse_prompt_line(line)
+                scene_id = str(item.get("scene_id")) if item else None
+                if scene_id in pending:
+                    reference = sanitize_prompt(item["visual_prompt"], genre)
+                    yield {"scene_id": scene_id, "index": pending.pop(scene_id), "visual_prompt": reference}
+        item = _parse_prompt_line(buffer)
+        scene_id = str(item.get("scene_id")) if item else None
+        if scene_id in pending:
+            reference = sanitize_prompt(item["visual_prompt"], genre)
+            yield {"scene_id": scene_id, "index": pending.pop(scene_id), "visual_prompt": reference}
+
+        for scene in batch:
+            if scene["scene_id"] not in pending:
+                continue
+            print(f"Scene {scene['scene_id']} missing from batch response, generating individually")
+            reference = generate_text(scene["text"], reference, genre)
+            yield {
+                "scene_id": scene["scene_id"],
+                "index": pending.pop(scene["scene_id"]),
+                "visual_prompt": reference
+            }
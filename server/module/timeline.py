@@ -0,0 +1,137 @@
+import os
+import subprocess
+from pathlib import Path
+
+from module.manifest import load_manifest
+from module.mezzanine import mezzanine_source
+from module.mixer import probe_audio
+from module.previews import preview_graph, preview_outputs, write_sprites
+from module.video import FIRST_PAUSE_DURATION, PAUSE_DURATION, get_video_audio_duration
+
+TIMELINE_FPS = 25  # Frame rate of -loop 1 image inputs, as in create_video_with_ffmpeg
+
+
+def build_timeline(story_id: str, scene_ids: list, animations: dict = None) -> list:
+    """
+    Describe a story as an ordered list of scene entries to render in one pass.
+
+    A scene is its image, narration and animation (-vf string). The animation
+    comes from ``animations`` or else from the last /generate/video render
+    recorded in the manifest. Scenes last rendered with a custom multi-frame
+    ffmpeg command or the Ken Burns frame generator cannot be expressed as a
+    filter chain, so their existing scene video is used as the source instead.
+    """
+    data_dir = Path(os.getenv("DATA_DIR", "/story")) / story_id
+    artifacts = load_manifest(story_id)["artifacts"]
+    animations = animations or {}
+    timeline = []
+    for scene_id in scene_ids:
+        recorded = artifacts.get(f"videos/{scene_id}.mp4", {}).get("params", {})
+        entry = {"scene_id": scene_id}
+        if scene_id not in animations and recorded.get("animation_type") in ("multi-frame", "kenburns"):
+            entry["video"] = f"videos/{scene_id}.mp4"
+        else:
+            entry["image"] = f"images/{scene_id}.png"
+            entry["audio"] = f"audios/{scene_id}.mp3"
+            entry["animation"] = animations.get(scene_id, recorded.get("animation"))
+        for key in ("image", "audio", "video"):
+            if key in entry and not (data_dir / entry[key]).exists():
+                raise FileNotFoundError(f"{entry[key]} not found for scene {scene_id}")
+        timeline.append(entry)
+    return timeline
+
+
+def timeline_inputs(timeline: list) -> list:
+    """Story-relative files a timeline render reads, for the manifest."""
+    return [entry[key] for entry in timeline for key in ("image", "audio", "video") if key in entry]
+
+
+def _scene_filters(index: int, video_label: str, audio_label: str, entry: dict, duration: float,
+                   width: int, height: int, first: bool, last: bool) -> list:
+    video = [entry["animation"]] if entry.get("animation") else []
+    video += [
+        f"scale={width}:{height}:force_original_aspect_ratio=decrease",
+        f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2",
+        "setsar=1",
+        f"fps={TIMELINE_FPS}",
+        "format=yuv420p",
+        f"trim=duration={duration:.3f}",
+        "setpts=PTS-STARTPTS",
+    ]
+    audio = [
+        "aresample=48000",
+        "aformat=sample_fmts=fltp:channel_layouts=stereo",
+        "apad",
+        f"atrim=duration={duration:.3f}",
+        "asetpts=PTS-STARTPTS",
+    ]
+    # The same pauses merge_videos inserts: a hold on the first frame, then the last frame of each scene
+    if first:
+        video.append(f"tpad=start_duration={FIRST_PAUSE_DURATION}:start_mode=clone")
+        audio.append(f"adelay={FIRST_PAUSE_DURATION * 1000}:all=1")
+    if not last:
+        video.append(f"tpad=stop_duration={PAUSE_DURATION}:stop_mode=clone")
+        audio.append(f"apad=pad_dur={PAUSE_DURATION}")
+    return [
+        f"[{video_label}]{','.join(video)}[v{index}]",
+        f"[{audio_label}]{','.join(audio)}[a{index}]",
+    ]
+
+
+def render_timeline(story_id: str, timeline: list, output_path, width: int, height: int):
+    """
+    Encode a whole story to ``output_path`` in a single ffmpeg run.
+
+    Every scene image is looped, animated, scaled and trimmed to its
+    narration, pauses are added with tpad/apad, and the scenes are joined by
+    the concat filter, so there is one video and one audio encode and no
+    per-scene intermediate files.
+    """
+    data_dir = Path(os.getenv("DATA_DIR", "/story")) / story_id
+    command = ["ffmpeg", "-y"]
+    graph = []
+    input_index = 0
+    for index, entry in enumerate(timeline):
+        first, last = index == 0, index == len(timeline) - 1
+        if "video" in entry:
+            video_path = str(data_dir / entry["video"])
+            durations = get_video_audio_duration(video_path)
+            duration = max(durations["video_duration"], durations["audio_duration"])
+            command += ["-i", video_path]
+            labels = (f"{input_index}:v", f"{input_index}:a")
+            input_index += 1
+        else:
+            audio_path = mezzanine_source(data_dir / entry["audio"])
+            duration = probe_audio(audio_path)["duration"]
+            command += ["-loop", "1", "-framerate", str(TIMELINE_FPS), "-i", str(data_dir / entry["image"]),
+                        "-i", audio_path]
+            labels = (f"{input_index}:v", f"{input_index + 1}:a")
+            input_index += 2
+        graph += _scene_filters(index, *labels, entry, duration, width, height, first, last)
+
+    streams = "".join(f"[v{i}][a{i}]" for i in range(len(timeline)))
+    graph.append(f"{streams}concat=n={len(timeline)}:v=1:a=1[vcat][acat]")
+    # The joined story also feeds the preview branches; the proxy gets its own copy of the audio
+    graph.append(preview_graph("[vcat]null", output_path, main_label="v"))
+    graph.append("[acat]asplit=2[a][proxy_a]")
+    command += [
+        "-filter_complex", ";".join(graph),
+        "-map", "[v]",
+        "-map", "[a]",
+        "-c:v", "libx264",
+        "-preset", "veryfast",
+        "-profile:v", "high",
+        "-level", "4.0",
+        "-pix_fmt", "yuv420p",
+        "-c:a", "aac",
+        "-b:a", "192k",
+        "-ar", "48000",
+        "-ac", "2",
+        "-movflags", "+faststart",
+        str(output_path),
+        *preview_outputs(output_path, audio_map="[proxy_a]")
+    ]
+    print(f"Rendering {len(timeline)} scenes of story {story_id} in one pass")
+    subprocess.run(command, check=True)
+    write_sprites(output_path)
+    print(f"Story timeline rendered to {output_path}")
@@ -0,0 +1,134 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+from pathlib import Path
+
+CACHE_NAME = "_tts_cache"
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024  # 1 GB
+
+
+def narration_key(text: str, voice: str, instruction: str, model: str, output_format: str) -> str:
+    """Content address of a narration: identical inputs always map to the same audio."""
+    payload = json.dumps([text, voice, instruction or "", model, output_format])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def link_or_copy(source, destination):
+    """
+    Hardlink ``source`` to ``destination`` (replacing it), copying when the two
+    paths are on different filesystems. Writers must replace files (write + rename)
+    rather than modify them in place, since a hardlinked scene file shares its
+    bytes with the cache entry.
+    """
+    destination = Path(destination)
+    tmp = destination.with_name(f".{destination.name}.link")
+    if tmp.exists():
+        tmp.unlink()
+    try:
+        os.link(source, tmp)
+    except OSError:
+        shutil.copyfile(source, tmp)
+    os.replace(tmp, destination)
+
+
+class NarrationCache:
+    """
+    Size-bounded, content-addressed store of synthesized narrations.
+
+    Entries are files named by their narration key. A hit refreshes the entry's
+    mtime, and eviction removes least recently used entries until the cache fits
+    in ``max_bytes``.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _path(self, key: str, output_format: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.{output_format}"
+
+    def fetch(self, key: str, output_format: str, destination) -> bool:
+        """Link a cached narration to ``destination``. Returns False on a miss."""
+        path = self._path(key, output_format)
+        with self._lock:
+            if not path.exists():
+                self.misses += 1
+                return False
+            self.hits += 1
+            os.utime(path)
+        link_or_copy(path, destination)
+        print(f"Narration cache hit {key[:12]} -> {destination}")
+        return True
+
+    def store(self, key: str, output_format: str, source):
+        """Add a freshly synthesized narration to the cache and enforce the size bound."""
+        path = self._path(key, output_format)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        link_or_copy(source, path)
+        self._evict()
+
+    def _entries(self):
+        if not self.cache_dir.exists():
+            return []
+        entries = []
+        for shard in os.scandir(self.cache_dir):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.is_file() and not entry.name.startswith("."):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def _evict(self):
+        with self._lock:
+            entries = self._entries()
+            total = sum(size for _, size, _ in entries)
+            if total <= self.max_bytes:
+                return
+            for _, size, path in sorted(entries):
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                self.evictions += 1
+                total -= size
+                if total <= self.max_bytes:
+                    break
+            print(f"Narration cache evicted down to {total} bytes")
+
+    def stats(self) -> dict:
+        entries = self._entries()
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(entries),
+            "bytes": sum(size for _, size, _ in entries),
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_narration_cache() -> NarrationCache:
+    """Return the process-wide narration cache (TTS_CACHE_DIR, TTS_CACHE_MAX_BYTES)."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                cache_dir = os.getenv("TTS_CACHE_DIR") or \
+                    str(Path(os.getenv("DATA_DIR", "/story")) / CACHE_NAME)
+                max_bytes = int(os.getenv("TTS_CACHE_MAX_BYTES", str(DEFAULT_MAX_BYTES)))
+                _cache = NarrationCache(cache_dir, max_bytes)
+    return _cache
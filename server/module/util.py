@@ -1,4 +1,8 @@
+import hashlib
+import json
+import os
 import re
+import threading
 
 def extract_base64_from_data_url(data_url):
     """
@@ -19,4 +23,36 @@ def extract_base64_from_data_url(data_url):
         return base64_data
     
     # If it's already just base64 (no data URL prefix)
-    return data_url
\ No newline at end of file
+    return data_url
+
+
+def format_sse(event: str, data) -> str:
+    """Format a Server-Sent Events message with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def file_sha256(path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(1024 * 1024):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+_content_hashes = {}
+_content_hash_lock = threading.Lock()
+
+
+def content_hash(path) -> str:
+    """
+    sha256 of a file's content, memoized per (path, size, mtime) so an unchanged
+    file is only read once per process.
+    """
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    digest = _content_hashes.get(key)
+    if digest is None:
+        digest = file_sha256(path)
+        with _content_hash_lock:
+            _content_hashes[key] = digest
+    return digest
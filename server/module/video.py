@@ -3,12 +3,20 @@ import base64
 import shutil
 import tempfile
 import subprocess
-import json
+import math
+import re
 
+from module.media import get_media_backend
+from module.previews import preview_graph, preview_outputs, preview_paths, render_previews, write_sprites
 from module.util import extract_base64_from_data_url
 
 FIRST_PAUSE_DURATION = 1  # seconds
 PAUSE_DURATION = 1  # seconds
+TAIL_SEGMENT_DURATION = 1  # seconds of still frame encoded when extending a video
+# Stream parameters the encoded tail must share with the copied picture for the concat to decode
+STREAM_COPY_KEYS = ("codec_name", "profile", "level", "width", "height", "pix_fmt", "frame_rate")
+LOOP_FPS = 25  # Frame rate of -loop 1 image inputs (the image2 default)
+ZOOMPAN_DEFAULTS = {"d": 90, "fps": 25}
 
 
 def create_video_with_ffmpeg_multi_frame(scene_id: str, image_path, frame_images: list[str], audio_path, ffmpeg_command, output_path):
@@ -27,84 +35,199 @@ def create_video_with_ffmpeg_multi_frame(scene_id: str, image_path, frame_images
         if os.path.exists(multiframe_path):
             os.rename(multiframe_path, os.path.join(tmpdir, f"{scene_id}.mp4"))
             shutil.move(os.path.join(tmpdir, f"{scene_id}.mp4"), output_path)
+            # The command is the UI's own, so previews come from a decode of its result
+            render_previews(output_path)
         else:
             raise FileNotFoundError(
                 f"Expected output file {multiframe_path} was not created by ffmpeg")
 
 
+def _looped_input_seconds(animation_str, duration: float) -> float:
+    """
+    Length of the looped image input an animation needs to cover ``duration``.
+    zoompan makes ``d`` output frames of every input frame, so a UI string
+    with ``d=<frames>`` needs one input frame, not one per output frame.
+    """
+    match = re.search(r"zoompan=((?:'[^']*'|[^,;'])*)", animation_str or "")
+    if not match:
+        return duration
+    options = dict(ZOOMPAN_DEFAULTS)
+    for option in re.findall(r"(?:^|:)(d|fps)=(\d+(?:\.\d+)?)", match.group(1)):
+        options[option[0]] = float(option[1])
+    input_frames = math.ceil(duration * options["fps"] / max(options["d"], 1))
+    return input_frames / LOOP_FPS
+
+
 def create_video_with_ffmpeg(image_path, audio_path, animation_str, output_path):
+    """
+    Render a scene from its image and narration, optionally animated by the
+    ``animation_str`` filter chain. The same decode also feeds the proxy,
+    poster and thumbnail sprite branches (see module.previews).
+    """
     if not os.path.exists(image_path):
         raise FileNotFoundError(f"Image file not found: {image_path}")
     if not os.path.exists(audio_path):
         raise FileNotFoundError(f"Audio file not found: {audio_path}")
+    # The picture must end by itself: the preview branches have no audio to stop them
+    duration = get_media_backend().probe_audio(audio_path)["duration"]
     if animation_str:
-        # If an animation string is provided, use it in the ffmpeg command
-        command = [
-            "ffmpeg",
-            "-y",
-            "-loop", "1",
-            "-i", image_path,
-            "-i", audio_path,
-            "-vf", animation_str,
-            "-c:v", "libx264",
-            "-preset", "veryfast",        # replaces -tune stillimage
-            "-profile:v", "high",
-            "-level", "4.0",
-            "-pix_fmt", "yuv420p",
-            "-c:a", "aac",
-            "-b:a", "192k",
-            "-shortest",
-            "-movflags", "+faststart",    # crucial for browser playback
-            output_path
-        ]
-
+        source = f"[0:v]{animation_str},trim=duration={duration:.3f}"
     else:
-        # Default command without animation
+        source = "[0:v]null"
+    command = [
+        "ffmpeg",
+        "-y",
+        "-loop", "1",
+        "-framerate", str(LOOP_FPS),
+        "-t", f"{_looped_input_seconds(animation_str, duration):.3f}",
+        "-i", image_path,
+        "-i", audio_path,
+        "-filter_complex", preview_graph(source, output_path, main_label="full"),
+        "-map", "[full]",
+        "-map", "1:a",
+        "-c:v", "libx264",
+        "-preset", "veryfast",        # replaces -tune stillimage
+        "-profile:v", "high",
+        "-level", "4.0",
+        "-pix_fmt", "yuv420p",
+        "-c:a", "aac",
+        "-b:a", "192k",
+        "-ar", "48000",              # the layout merge_videos expects, so it skips normalization
+        "-ac", "2",
+        "-shortest",
+        "-movflags", "+faststart",    # crucial for browser playback
+        output_path,
+        *preview_outputs(output_path, audio_map="1:a", shortest=True)
+    ]
+
+    print(f"Running ffmpeg command: {' '.join(command)}")
+    subprocess.run(command, check=True)
+    write_sprites(output_path)
+
+
+def replace_video_audio(video_path, audio_path, previews: bool = True):
+    """
+    Swap the audio of a rendered scene video without re-encoding its picture.
+
+    The H.264 stream is copied as is. When the new audio runs longer than the
+    video, a short still of the last frame is encoded once and repeated after
+    it, so extending costs the same whatever the added duration. If that tail
+    does not match the picture's profile, level, size and frame rate a
+    ValueError is raised, which callers answer with a full render. The proxy is
+    remuxed the same way and the thumbnails are redrawn from it; the poster
+    (the first frame) cannot change.
+    """
+    if not os.path.exists(audio_path):
+        raise FileNotFoundError(f"Audio file not found: {audio_path}")
+    backend = get_media_backend()
+    video = backend.probe_video(video_path)
+    if video.get("codec_name") != "h264" or video.get("pix_fmt") != "yuv420p":
+        # The tail could not be encoded to match; callers fall back to a full render
+        raise ValueError(f"Cannot stream-copy {video.get('codec_name')}/{video.get('pix_fmt')} video")
+    audio_duration = backend.probe_audio(audio_path)["duration"]
+    video_duration = video["duration"]
+    frame_rate = video["frame_rate"]
+    num, _, den = frame_rate.partition("/")
+    frame_duration = float(den or 1) / float(num)
+
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(video_path))) as tmpdir:
+        picture_path = video_path
+        tail_duration = audio_duration - video_duration
+        if tail_duration > frame_duration:
+            last_frame_path = os.path.join(tmpdir, "last_frame.png")
+            subprocess.run([
+                "ffmpeg", "-y",
+                "-sseof", "-1",
+                "-i", video_path,
+                "-update", "1",
+                "-q:v", "1",
+                last_frame_path
+            ], check=True)
+            # Same encoder settings as create_video_with_ffmpeg, so the streams concat without re-encoding
+            tail_path = os.path.join(tmpdir, "tail.mp4")
+            tail_segment = min(tail_duration, TAIL_SEGMENT_DURATION)
+            subprocess.run([
+                "ffmpeg", "-y",
+                "-loop", "1",
+                "-framerate", frame_rate,
+                "-i", last_frame_path,
+                "-t", str(tail_segment),
+                "-c:v", "libx264",
+                "-preset", "veryfast",
+                "-profile:v", "high",
+                "-level", "4.0",
+                "-pix_fmt", "yuv420p",
+                "-r", frame_rate,
+                "-an",
+                tail_path
+            ], check=True)
+            tail = backend.probe_video(tail_path)
+            mismatched = [key for key in STREAM_COPY_KEYS if tail.get(key) != video.get(key)]
+            if mismatched:
+                details = ", ".join(f"{key} {video.get(key)} != {tail.get(key)}" for key in mismatched)
+                raise ValueError(f"Cannot stream-copy {video_path}, the extension would differ in {details}")
+            head_path = os.path.join(tmpdir, "head.mp4")
+            subprocess.run([
+                "ffmpeg", "-y", "-i", video_path, "-map", "0:v:0", "-c", "copy", head_path
+            ], check=True)
+            concat_list_path = os.path.join(tmpdir, "video_list.txt")
+            with open(concat_list_path, "w", encoding="utf-8") as f:
+                f.write(f"file '{head_path.replace(os.sep, '/')}'\n")
+                # Every frame of the tail is identical, so repeating one segment covers any length
+                for _ in range(math.ceil(tail_duration / tail_segment)):
+                    f.write(f"file '{tail_path.replace(os.sep, '/')}'\n")
+            picture_path = os.path.join(tmpdir, "extended.mp4")
+            subprocess.run([
+                "ffmpeg", "-y",
+                "-f", "concat", "-safe", "0",
+                "-i", concat_list_path,
+                "-c", "copy",
+                picture_path
+            ], check=True)
+            print(f"Extended {video_path} by {tail_duration:.2f}s of its last frame")
+
+        output_path = os.path.join(tmpdir, "remuxed.mp4")
         command = [
-            "ffmpeg",
-            "-y",
-            "-loop", "1",
-            "-i", image_path,
+            "ffmpeg", "-y",
+            "-i", picture_path,
             "-i", audio_path,
-            "-c:v", "libx264",
-            "-preset", "veryfast",     # safer than -tune stillimage
-            "-profile:v", "high",
-            "-level", "4.0",
-            "-pix_fmt", "yuv420p",
+            "-map", "0:v:0",
+            "-map", "1:a:0",
+            "-c:v", "copy",
             "-c:a", "aac",
             "-b:a", "192k",
+            "-ar", "48000",
+            "-ac", "2",
             "-shortest",
-            "-movflags", "+faststart",  # enables streaming in browsers
+            "-movflags", "+faststart",
             output_path
         ]
-
-    print(f"Running ffmpeg command: {' '.join(command)}")
-    subprocess.run(command, check=True)
+        print(f"Running ffmpeg command: {' '.join(command)}")
+        subprocess.run(command, check=True)
+        os.replace(output_path, video_path)
+
+    if previews:
+        proxy = preview_paths(video_path)["proxy"]
+        if proxy.exists():
+            try:
+                replace_video_audio(str(proxy), audio_path, previews=False)
+                render_previews(video_path, source=str(proxy), kinds=("sprite",))
+                return
+            except ValueError as e:
+                print(f"Rendering previews of {video_path} again: {e}")
+        render_previews(video_path)
 
 
 def needs_normalization(video_path):
     """Check if the video has mismatched audio/video settings."""
-    cmd = [
-        "ffprobe", "-v", "error",
-        "-select_streams", "a:0",
-        "-show_entries", "stream=codec_name,channels,sample_rate",
-        "-of", "json",
-        video_path
-    ]
-    result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-    info = json.loads(result.stdout)
-
-    # Default: assume needs normalization if no audio stream
-    if not info.get("streams"):
+    try:
+        stream = get_media_backend().probe_audio(video_path)
+    except ValueError:
+        # Default: assume needs normalization if no audio stream
         return True
 
-    stream = info["streams"][0]
-    codec = stream.get("codec_name", "")
-    channels = int(stream.get("channels", 0))
-    sample_rate = int(stream.get("sample_rate", 0))
-
     # Must be AAC, stereo, 48kHz
-    if codec != "aac" or channels != 2 or sample_rate != 48000:
+    if stream["codec_name"] != "aac" or stream["channels"] != 2 or stream["sample_rate"] != 48000:
         return True
 
     return False
@@ -121,34 +244,7 @@ def normalize_video(input_path, output_path):
 
 def get_video_audio_duration(video_path):
     """Get the duration of video and audio streams in a video file."""
-    # Get video duration
-    cmd_video = [
-        "ffprobe", "-v", "error",
-        "-select_streams", "v:0",
-        "-show_entries", "stream=duration",
-        "-of", "json",
-        video_path
-    ]
-    result_video = subprocess.run(cmd_video, capture_output=True, text=True, check=True)
-    video_info = json.loads(result_video.stdout)
-    video_duration = float(video_info.get("streams", [{"duration": "0"}])[0].get("duration", 0))
-
-    # Get audio duration
-    cmd_audio = [
-        "ffprobe", "-v", "error",
-        "-select_streams", "a:0",
-        "-show_entries", "stream=duration",
-        "-of", "json",
-        video_path
-    ]
-    result_audio = subprocess.run(cmd_audio, capture_output=True, text=True, check=True)
-    audio_info = json.loads(result_audio.stdout)
-    audio_duration = float(audio_info.get("streams", [{"duration": "0"}])[0].get("duration", 0))
-
-    return {
-        "video_duration": video_duration,
-        "audio_duration": audio_duration
-    }
+    return get_media_backend().stream_durations(video_path)
 
 
 # Generate a pause clip using the first frame of a video
@@ -310,16 +406,20 @@ def merge_videos(video_paths, output_path, width, height):
                     
                     f.write(f"file '{pause_clip.replace(os.sep, '/')}'\n")
 
-        # Final concat command
+        # Final concat command; the decoded story also feeds the preview branches
         subprocess.run([
             "ffmpeg", "-y",
             "-f", "concat", "-safe", "0",
             "-i", concat_list_path,
+            "-filter_complex", preview_graph("[0:v]null", output_path, main_label="full"),
+            "-map", "[full]", "-map", "0:a",
             "-c:v", "libx264", "-preset", "fast",
             "-c:a", "aac", "-b:a", "192k",
             "-movflags", "+faststart",
-            output_path
+            output_path,
+            *preview_outputs(output_path, audio_map="0:a")
         ], check=True)
+        write_sprites(output_path)
 
         print(f"🎉 Merged video with pauses saved to {output_path}")
 
@@ -1,23 +1,93 @@
 from openai import OpenAI
+import os
+import re
+import shutil
+import tempfile
 import traceback
-import json
-import subprocess
+from concurrent.futures import ThreadPoolExecutor
 from pydub import AudioSegment
+from tenacity import retry, stop_after_attempt, wait_exponential
+from mutagen import File as MutagenFile
+
+from module.media import get_media_backend
+from module.mezzanine import convert_to_master, mezzanine_enabled
+from module.mixer import mix_tracks
+from module.tts_cache import get_narration_cache, narration_key
 
 client = OpenAI()
 
-def generate_tts(text: str, filename: str, voice: str = 'coral', instruction: str = "") -> dict:
+TTS_MODEL = "gpt-4o-mini-tts"
+TTS_FORMAT = "mp3"
+TTS_LOSSLESS_FORMAT = "flac"  # Requested instead of MP3 when the audio pipeline keeps masters
+TTS_CHUNK_SIZE = 16 * 1024  # Small chunks so playback can start on the first frames
+
+# Chunked synthesis for long narrations
+TTS_MAX_CHUNK_CHARS = 600
+TTS_MAX_CONCURRENCY = int(os.getenv("TTS_MAX_CONCURRENCY", "4"))
+TTS_CROSSFADE_MS = 40
+
+# Split on whitespace after sentence punctuation, keeping any closing quote/bracket
+_SENTENCE_END = re.compile(r"(?:(?<=[.!?\u2026])|(?<=[.!?\u2026][\"'\u201d\u2019)\]]))\s+")
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+
+
+def stream_tts(text: str, filename: str, voice: str = 'coral', instruction: str = "",
+               chunk_size: int = TTS_CHUNK_SIZE, use_cache: bool = True,
+               response_format: str = TTS_FORMAT):
+    """
+    Stream narration audio from OpenAI TTS.
+
+    Chunks are yielded as they arrive and written straight to disk, so memory
+    stays bounded by ``chunk_size`` regardless of narration length. The file is
+    written to a ``.part`` sibling and only renamed into place once complete.
+
+    Narrations are content-addressed by (text, voice, instruction, model,
+    format): a cache hit is hardlinked to ``filename`` and streamed from disk
+    without calling the API.
+    """
+    cache = get_narration_cache()
+    key = narration_key(text, voice, instruction, TTS_MODEL, response_format)
+    if use_cache and cache.fetch(key, response_format, filename):
+        with open(filename, "rb") as f:
+            while chunk := f.read(chunk_size):
+                yield chunk
+        return
+
+    part_path = f"{filename}.part"
     try:
-        """Generate narration audio from text using OpenAI TTS and return file path and duration."""
-        speech = client.audio.speech.create(
-            model="gpt-4o-mini-tts",
+        with client.audio.speech.with_streaming_response.create(
+            model=TTS_MODEL,
             voice=voice,
             input=text,
-            instructions=instruction
-        )
-        with open(filename, "wb") as f:
-            f.write(speech.read())
+            instructions=instruction,
+            response_format=response_format
+        ) as response:
+            with open(part_path, "wb") as f:
+                for chunk in response.iter_bytes(chunk_size):
+                    f.write(chunk)
+                    yield chunk
+        os.replace(part_path, filename)
         print(f"TTS audio saved to {filename}")
+        try:
+            cache.store(key, response_format, filename)
+        except Exception as e:
+            print(f"Could not cache narration: {e}")
+    except BaseException:
+        # Also covers the client disconnecting mid-stream (GeneratorExit)
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        raise
+
+
+def generate_tts(text: str, filename: str, voice: str = 'coral', instruction: str = "",
+                 use_cache: bool = True) -> dict:
+    try:
+        """Generate narration audio from text using OpenAI TTS and return file path and duration."""
+        if mezzanine_enabled():
+            _synthesize_master(text, filename, voice, instruction, use_cache)
+        else:
+            for _ in stream_tts(text, filename, voice=voice, instruction=instruction, use_cache=use_cache):
+                pass
         duration = get_audio_duration(filename)
         print(f"Audio duration: {duration} seconds")
     except Exception as e:
@@ -28,82 +98,181 @@ def generate_tts(text: str, filename: str, voice: str = 'coral', instruction: st
     return filename, duration
 
 
+def _synthesize_master(text: str, filename: str, voice: str, instruction: str, use_cache: bool):
+    # Lossless from the API into the master; the MP3 at ``filename`` is encoded from it once
+    fd, lossless_path = tempfile.mkstemp(suffix=f".{TTS_LOSSLESS_FORMAT}")
+    os.close(fd)
+    try:
+        for _ in stream_tts(text, lossless_path, voice=voice, instruction=instruction,
+                            use_cache=use_cache, response_format=TTS_LOSSLESS_FORMAT):
+            pass
+        convert_to_master(lossless_path, filename)
+    finally:
+        os.remove(lossless_path)
+
+
+def split_narration(text: str, max_chars: int = TTS_MAX_CHUNK_CHARS) -> list:
+    """
+    Split narration text into chunks at paragraph and sentence boundaries.
+    Sentences are grouped up to ``max_chars``; a single longer sentence is kept
+    whole rather than cut mid-sentence.
+    """
+    chunks = []
+    for paragraph in _PARAGRAPH_BREAK.split(text):
+        current = ""
+        for sentence in _SENTENCE_END.split(paragraph.strip()):
+            sentence = sentence.strip()
+            if not sentence:
+                continue
+            if current and len(current) + 1 + len(sentence) > max_chars:
+                chunks.append(current)
+                current = sentence
+            else:
+                current = f"{current} {sentence}" if current else sentence
+        if current:
+            chunks.append(current)
+    return chunks
+
+
+@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=1, max=10), reraise=True)
+def _synthesize_chunk(text: str, filename: str, voice: str, instruction: str, use_cache: bool,
+                      response_format: str = TTS_FORMAT):
+    # Each chunk is retried on its own, so one failure doesn't redo the whole narration
+    for _ in stream_tts(text, filename, voice=voice, instruction=instruction, use_cache=use_cache,
+                        response_format=response_format):
+        pass
+    return filename
+
+
+def stitch_narration(chunk_files: list, output_file: str, crossfade_ms: int = TTS_CROSSFADE_MS,
+                     export_format: str = TTS_FORMAT):
+    """
+    Join synthesized chunks with short crossfades after matching every chunk to
+    the average loudness, so the seams are neither audible clicks nor level jumps.
+    """
+    segments = [AudioSegment.from_file(path) for path in chunk_files]
+    audible = [seg.dBFS for seg in segments if seg.dBFS != float("-inf")]
+    target_dbfs = sum(audible) / len(audible) if audible else None
+
+    narration = None
+    for seg in segments:
+        if target_dbfs is not None and seg.dBFS != float("-inf"):
+            seg = seg.apply_gain(target_dbfs - seg.dBFS)
+        if narration is None:
+            narration = seg
+        else:
+            fade = min(crossfade_ms, len(narration), len(seg))
+            narration = narration.append(seg, crossfade=fade)
+
+    part_path = f"{output_file}.part"
+    if export_format == TTS_FORMAT:
+        narration.export(part_path, format=export_format, bitrate="128k")
+    else:
+        narration.export(part_path, format=export_format)
+    os.replace(part_path, output_file)
+
+
+def generate_tts_chunked(text: str, filename: str, voice: str = 'coral', instruction: str = "",
+                         max_chars: int = TTS_MAX_CHUNK_CHARS, max_workers: int = TTS_MAX_CONCURRENCY,
+                         use_cache: bool = True):
+    """
+    Synthesize a long narration as sentence-aligned chunks in parallel.
+
+    At most ``max_workers`` requests are in flight, failed chunks are retried
+    individually, and the results are stitched with loudness-matched
+    crossfades. Chunks and the stitched result both go through the narration
+    cache, so editing one sentence only re-synthesizes that chunk.
+    """
+    chunks = split_narration(text, max_chars)
+    if len(chunks) <= 1:
+        return generate_tts(text, filename, voice=voice, instruction=instruction, use_cache=use_cache)
+
+    # With masters, chunks are fetched and stitched losslessly and only the stitched master is encoded
+    audio_format = TTS_LOSSLESS_FORMAT if mezzanine_enabled() else TTS_FORMAT
+    cache = get_narration_cache()
+    key = narration_key(text, voice, instruction, f"{TTS_MODEL}:chunked:{max_chars}", audio_format)
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        stitched_path = filename if audio_format == TTS_FORMAT else os.path.join(tmpdir, f"narration.{audio_format}")
+        if not (use_cache and cache.fetch(key, audio_format, stitched_path)):
+            chunk_files = [os.path.join(tmpdir, f"chunk_{i}.{audio_format}") for i in range(len(chunks))]
+            print(f"Synthesizing {len(chunks)} narration chunks with {max_workers} workers")
+            with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                futures = [
+                    pool.submit(_synthesize_chunk, chunk, path, voice, instruction, use_cache, audio_format)
+                    for chunk, path in zip(chunks, chunk_files)
+                ]
+                for future in futures:
+                    future.result()
+
+            stitch_narration(chunk_files, stitched_path, export_format=audio_format)
+            cache.store(key, audio_format, stitched_path)
+        if stitched_path != filename:
+            convert_to_master(stitched_path, filename)
+        duration = get_audio_duration(filename)
+        print(f"Chunked TTS audio saved to {filename}, duration: {duration} seconds")
+        return filename, duration
+    except Exception as e:
+        traceback.print_exception(e)
+        print(f"Error generating chunked TTS: {e}")
+        raise e
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+def narration_params(text: str, voice_settings: dict) -> dict:
+    """Manifest parameters of a synthesized narration: everything the TTS request was given."""
+    return {
+        "source": "tts",
+        "model": TTS_MODEL,
+        "text": text,
+        "voice": voice_settings.get("voice", "coral"),
+        "instruction": voice_settings.get("instruction", ""),
+        "chunked": bool(voice_settings.get("chunked", False)),
+    }
+
+
 def get_audio_duration(filename):
     """
-    Returns duration of an audio file in seconds using ffprobe.
-    Requires ffprobe (part of ffmpeg) installed and in PATH.
+    Returns duration of an audio file in seconds.
+    Parses the container/frame headers with mutagen in-process and only falls
+    back to the media backend for formats it can't read.
     """
     try:
-        cmd = [
-            "ffprobe",
-            "-v", "error",
-            "-show_entries", "format=duration",
-            "-of", "json",
-            filename
-        ]
-        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-        info = json.loads(result.stdout)
-        duration = float(info["format"]["duration"])
-        return duration
+        audio = MutagenFile(filename)
+        if audio is not None and audio.info and audio.info.length:
+            return float(audio.info.length)
+    except Exception as e:
+        print(f"mutagen could not read {filename}, falling back to the media backend: {e}")
+    try:
+        return get_media_backend().format_duration(filename)
     except Exception as e:
         print(f"Could not determine duration for {filename}: {e}")
         return None
     
-def mix_audio_tracks(base_audio, processed_tracks, output_file, normalize=True, export_format="mp3"):
+def mix_audio_tracks(base_audio, processed_tracks, output_file, normalize=True, export_format="mp3",
+                     output_options=None):
     """
-    Mix base audio with processed overlay tracks using pydub.
+    Mix base audio with processed overlay tracks.
     processed_tracks is a list of dicts with keys: file_path, config
-    config contains: start_time_ms, volume_db, fade_in_ms, fade_out_ms, loop
+    config contains: start_time_ms, volume_db, fade_in_ms, fade_out_ms, loop, duration_ms
+
+    Mixing runs on float32 NumPy blocks (see module.mixer.mix_tracks) with a
+    single encode at the end; looped overlays run until the end of the base.
     """
     try:
-        main_audio = AudioSegment.from_file(base_audio)
-        print(f"Base audio duration: {main_audio.duration_seconds} seconds")
-        
-        for track in processed_tracks:
-            print(f"Processing overlay track: {track['file_path']} with config: {track['config']}")
-            overlay = AudioSegment.from_file(track['file_path'])
-            config = track['config']
-
-            if config.get('duration_ms'):
-                overlay = overlay[:config['duration_ms']]
-                print(f"Trimmed overlay to duration: {overlay.duration_seconds} seconds")
-            
-            # Loop the overlay if needed
-            if config.get('loop', False):
-                loops = int(main_audio.duration_seconds // overlay.duration_seconds) + 1
-                overlay = overlay * loops
-                print(f"Looped overlay to duration: {overlay.duration_seconds} seconds")
-            
-            # Apply fade effects
-            if config.get('fade_in_ms', 0) > 0:
-                overlay = overlay.fade_in(config['fade_in_ms'])
-                print(f"Applied fade-in to overlay: {overlay.duration_seconds} seconds")
-            if config.get('fade_out_ms', 0) > 0:
-                overlay = overlay.fade_out(config['fade_out_ms'])
-                print(f"Applied fade-out to overlay: {overlay.duration_seconds} seconds")
-            
-            # Adjust volume
-            if config.get('volume_db', 0) != 0:
-                overlay = overlay + config['volume_db']
-                print(f"Adjusted overlay volume by {config['volume_db']} dB")
-            elif config.get('volume', 0) != 0:  # Fallback for 'volume' key
-                overlay = overlay + config['volume']
-                print(f"Adjusted overlay volume by {config['volume']} dB")
-            
-            # Overlay the track
-            start_time = config.get('start_time_ms', 0)
-            main_audio = main_audio.overlay(overlay, position=start_time)
-            print(f"Overlayed track at {start_time} ms")
-        
-        # Normalize audio if requested
-        if normalize:
-            main_audio = main_audio.normalize()
-            print("Applied audio normalization")
-        
-        # Export with proper format
-        main_audio.export(output_file, format=export_format)
-        print(f"Mixed audio saved to {output_file}")
-        
+        result = mix_tracks(
+            base_audio,
+            processed_tracks,
+            output_file,
+            normalize=normalize,
+            export_format=export_format,
+            output_options=output_options
+        )
+        print(f"Mixed audio saved to {output_file}: {result}")
+        return result
+
     except Exception as e:
         print(f"Error mixing audio: {e}")
-        raise e
\ No newline at end of file
+        raise e
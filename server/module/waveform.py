@@ -0,0 +1,136 @@
+import json
+import os
+import struct
+from pathlib import Path
+
+import numpy as np
+
+from module.analysis import get_analysis_cache
+from module.manifest import record_file, WAVEFORM
+from module.mixer import iter_audio_blocks, probe_audio
+
+WAVEFORM_DIR = "waveforms"
+WAVEFORM_EXT = ".peaks"
+MAGIC = b"PKS1"
+VERSION = 1
+
+BASE_SAMPLES_PER_PEAK = 256
+LEVEL_FACTOR = 4
+MAX_LEVELS = 8  # 256 .. 4,194,304 samples per peak
+MIN_LEVEL_PEAKS = 256  # Stop once a level would be coarser than this many peaks
+BLOCK_FRAMES = BASE_SAMPLES_PER_PEAK * 4096  # ~24 s at 44.1 kHz
+
+
+def waveform_path(audio_path) -> Path:
+    """Waveforms live in the story's waveforms/ dir, named after the audio file."""
+    audio_path = Path(audio_path)
+    return audio_path.parent.parent / WAVEFORM_DIR / f"{audio_path.name}{WAVEFORM_EXT}"
+
+
+def waveform_url(story_id: str, audio_filename: str) -> str:
+    return f"http://localhost:8000/files/{story_id}/{WAVEFORM_DIR}/{audio_filename}{WAVEFORM_EXT}"
+
+
+def _base_peaks(audio_path: str, sample_rate: int):
+    """Min/max of every BASE_SAMPLES_PER_PEAK mono samples, streamed block by block."""
+    mins, maxs = [], []
+    for block in iter_audio_blocks(audio_path, sample_rate, 1, BLOCK_FRAMES):
+        samples = block[:, 0]
+        pad = -len(samples) % BASE_SAMPLES_PER_PEAK
+        if pad:
+            # Only the last block is short; edge padding doesn't move its min/max
+            samples = np.pad(samples, (0, pad), mode="edge")
+        windows = samples.reshape(-1, BASE_SAMPLES_PER_PEAK)
+        mins.append(windows.min(axis=1))
+        maxs.append(windows.max(axis=1))
+    if not mins:
+        return np.zeros(0, np.float32), np.zeros(0, np.float32)
+    return np.concatenate(mins), np.concatenate(maxs)
+
+
+def build_pyramid(mins: np.ndarray, maxs: np.ndarray) -> list:
+    """Coarser levels reduce LEVEL_FACTOR neighbouring peaks of the level below."""
+    levels = [(BASE_SAMPLES_PER_PEAK, mins, maxs)]
+    while len(levels) < MAX_LEVELS and len(mins) > MIN_LEVEL_PEAKS * LEVEL_FACTOR:
+        pad = -len(mins) % LEVEL_FACTOR
+        if pad:
+            mins = np.pad(mins, (0, pad), mode="edge")
+            maxs = np.pad(maxs, (0, pad), mode="edge")
+        mins = mins.reshape(-1, LEVEL_FACTOR).min(axis=1)
+        maxs = maxs.reshape(-1, LEVEL_FACTOR).max(axis=1)
+        levels.append((levels[-1][0] * LEVEL_FACTOR, mins, maxs))
+    return levels
+
+
+def _quantize(mins: np.ndarray, maxs: np.ndarray) -> bytes:
+    # Interleaved int8 [min0, max0, min1, max1, ...]; floor/ceil keep the envelope conservative
+    pairs = np.empty(len(mins) * 2, dtype=np.int8)
+    pairs[0::2] = np.clip(np.floor(mins * 127), -127, 127)
+    pairs[1::2] = np.clip(np.ceil(maxs * 127), -127, 127)
+    return pairs.tobytes()
+
+
+def generate_waveform(audio_path, force: bool = False):
+    """
+    Compute the min/max peak pyramid of an audio file and store it under
+    waveforms/<audio filename>.peaks.
+
+    Layout: b"PKS1", a little-endian uint32 header length, a JSON header
+    (sample rate, duration, and per level samples_per_peak/length/offset),
+    then each level as interleaved int8 min/max pairs. The pyramid is skipped
+    if the stored one was built from the same audio content.
+    """
+    audio_path = str(audio_path)
+    output_path = waveform_path(audio_path)
+    source_hash = get_analysis_cache().content_hash(audio_path)
+    if not force and output_path.exists() and read_waveform_header(output_path).get("source_hash") == source_hash:
+        record_file(output_path, WAVEFORM, [audio_path], {"version": VERSION})
+        return output_path
+
+    info = probe_audio(audio_path)
+    levels = build_pyramid(*_base_peaks(audio_path, info["sample_rate"]))
+    payloads = [_quantize(mins, maxs) for _, mins, maxs in levels]
+
+    offset = 0
+    level_headers = []
+    for (samples_per_peak, mins, _), payload in zip(levels, payloads):
+        level_headers.append({"samples_per_peak": samples_per_peak, "length": len(mins), "offset": offset})
+        offset += len(payload)
+    header = json.dumps({
+        "version": VERSION,
+        "sample_rate": info["sample_rate"],
+        "duration": info["duration"],
+        "format": "int8 min/max interleaved",
+        "source_hash": source_hash,
+        "levels": level_headers,
+    }).encode("utf-8")
+
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = output_path.with_name(f".{output_path.name}.tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<I", len(header)))
+        f.write(header)
+        for payload in payloads:
+            f.write(payload)
+    os.replace(tmp_path, output_path)
+    record_file(output_path, WAVEFORM, [audio_path], {"version": VERSION})
+    print(f"Waveform saved to {output_path} ({len(levels)} levels)")
+    return output_path
+
+
+def read_waveform_header(path) -> dict:
+    with open(path, "rb") as f:
+        if f.read(4) != MAGIC:
+            return {}
+        (length,) = struct.unpack("<I", f.read(4))
+        return json.loads(f.read(length))
+
+
+def try_generate_waveform(audio_path):
+    """Generate a waveform without failing the caller; returns the file path or None."""
+    try:
+        return generate_waveform(audio_path)
+    except Exception as e:
+        print(f"Could not generate waveform for {audio_path}: {e}")
+        return None
@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { ImagePlus, Mic, Film, PlayCircle, PlusCircle, Trash2, X, Video, FileVideo, ChevronDown, ChevronUp, Wand2, Eye, Check, Settings, RotateCcw, Upload } from 'lucide-react';
 import './App.css';
 import './AnimationModal.css';
@@ -9,6 +9,7 @@ import SoundMixerModal from './SoundMixerModal';
 import MultiFrameAnimationModal from './MultiFrameAnimationModal';
 import MicrophoneRecorder from './MicrophoneRecorder';
 import AudioEnhancer from './AudioEnhancer';
+import ScrubPreview from './ScrubPreview';
 import { ToastProvider, useToast } from './Toast';
 
 import { kenBurnsFilterExpression, 
@@ -26,6 +27,9 @@ const Scene = ({ scene, index, onUpdate, onRemove, globalVoiceInstructions, sele
     const [showPreview, setShowPreview] = useState(false);
     const [generatedAudioUrl, setGeneratedAudioUrl] = useState(null);
     const [generatedVideoUrl, setGeneratedVideoUrl] = useState(null);
+    // Proxy, poster and thumbnail index the server renders next to each scene video
+    const [videoPreviews, setVideoPreviews] = useState(null);
+    const previewVideoRef = useRef(null);
     const [isGeneratingAudio, setIsGeneratingAudio] = useState(false);
     const [isGeneratingVideo, setIsGeneratingVideo] = useState(false);
     const [isCollapsed, setIsCollapsed] = useState(false);
@@ -94,9 +98,11 @@ const Scene = ({ scene, index, onUpdate, onRemove, globalVoiceInstructions, sele
             console.log(`Scene ${index + 1} - Restoring video state`);
             setVideoGenerated(true);
             setGeneratedVideoUrl(scene.videoUrl);
+            setVideoPreviews(scene.videoPreviews || null);
         } else {
             setVideoGenerated(false);
             setGeneratedVideoUrl(null);
+            setVideoPreviews(null);
         }
 
         // Restore animation settings
@@ -737,12 +743,19 @@ const Scene = ({ scene, index, onUpdate, onRemove, globalVoiceInstructions, sele
                         `http://localhost:8000/files/${storyId}/videos/${result.filename}` :
                         (result.video_url || `data:video/mp4;base64,${result.video_data}`);
                     setGeneratedVideoUrl(videoUrl);
+                    const previews = result.proxy_url ? {
+                        proxyUrl: result.proxy_url,
+                        posterUrl: result.poster_url,
+                        thumbnailsUrl: result.thumbnails_url
+                    } : null;
+                    setVideoPreviews(previews);
 
                     // Store the animation settings for future reference
                     const updatedScene = {
                         ...scene,
                         hasVideo: true,
                         videoUrl: videoUrl,
+                        videoPreviews: previews,
                         videoFilename: result.filename,
                         storyId: storyId,
                         videoDuration: result.duration,
@@ -1306,10 +1319,11 @@ const Scene = ({ scene, index, onUpdate, onRemove, globalVoiceInstructions, sele
                         </div>
                         <div style={{ display: 'flex', flexDirection: 'column', flex: 1 }}>
                             <video
+                                ref={previewVideoRef}
                                 className="video-player"
                                 controls
                                 preload="metadata"
-                                poster={uploadedImage}
+                                poster={videoPreviews?.posterUrl || uploadedImage}
                                 autoPlay={false}
                                 muted={false}
                                 key={generatedVideoUrl}
@@ -1340,9 +1354,11 @@ const Scene = ({ scene, index, onUpdate, onRemove, globalVoiceInstructions, sele
                                     borderRadius: '8px'
                                 }}
                             >
-                                {generatedVideoUrl && <source src={`${generatedVideoUrl}?t=${Date.now()}`} type="video/mp4" />}
+                                {/* The low-bitrate proxy streams and seeks faster; the full render stays the download */}
+                                {generatedVideoUrl && <source src={`${videoPreviews?.proxyUrl || generatedVideoUrl}?t=${Date.now()}`} type="video/mp4" />}
                                 Your browser does not support the video tag.
                             </video>
+                            <ScrubPreview videoRef={previewVideoRef} thumbnailsUrl={videoPreviews?.thumbnailsUrl} />
 
                             {/* Debug Information */}
                             <div style={{
@@ -1475,7 +1491,8 @@ function AppContent() {
                     videoUrl: scene.videoUrl && !scene.videoUrl.startsWith('data:') ? scene.videoUrl : null,
                     image: scene.image && !scene.image.startsWith('data:') ? scene.image : null,
                     audioDuration: scene.audioDuration,
-                    videoDuration: scene.videoDuration
+                    videoDuration: scene.videoDuration,
+                    videoPreviews: scene.videoPreviews || null
                     // No animation settings or other large data to minimize storage
                 }));
                 
@@ -1506,7 +1523,8 @@ function AppContent() {
                             videoUrl: scene.videoUrl && !scene.videoUrl.startsWith('data:') ? scene.videoUrl : null,
                             image: scene.image && !scene.image.startsWith('data:') ? scene.image : null,
                             audioDuration: scene.audioDuration,
-                            videoDuration: scene.videoDuration
+                            videoDuration: scene.videoDuration,
+                            videoPreviews: scene.videoPreviews || null
                             // No animation settings or other large data to minimize storage
                         }));
                         localStorage.setItem(key, JSON.stringify(minimalData));
@@ -1575,6 +1593,7 @@ function AppContent() {
                 hasVideo: hasVideoData,
                 audioUrl: audioUrl,
                 videoUrl: videoUrl,
+                videoPreviews: scene.videoPreviews || null,
                 audioFilename: scene.audioFilename || null,
                 videoFilename: scene.videoFilename || null,
                 audioDuration: scene.audioDuration || null,
@@ -1610,6 +1629,8 @@ function AppContent() {
     });
     const [isAnySceneGenerating, setIsAnySceneGenerating] = useState(false);
     const [isMergingFinalVideo, setIsMergingFinalVideo] = useState(false);
+    const [finalPreview, setFinalPreview] = useState(null);
+    const finalVideoRef = useRef(null);
     const [selectedVoice, setSelectedVoiceState] = useState(() =>
         loadFromLocalStorage('storyline-studio-selected-voice', 'alloy')
     );
@@ -1740,6 +1761,7 @@ function AppContent() {
             hasVideo: false,
             audioUrl: null,
             videoUrl: null,
+            videoPreviews: null,
             audioFilename: null,
             videoFilename: null,
             audioDuration: null,
@@ -1821,6 +1843,15 @@ function AppContent() {
             });
 
             if (response.ok) {
+                // Preview renders of story.mp4 for the player below the controls
+                const proxyUrl = response.headers.get('X-Proxy-Url');
+                setFinalPreview(proxyUrl ? {
+                    proxyUrl,
+                    posterUrl: response.headers.get('X-Poster-Url'),
+                    thumbnailsUrl: response.headers.get('X-Thumbnails-Url'),
+                    renderedAt: Date.now()
+                } : null);
+
                 // Handle file download
                 const blob = await response.blob();
                 const url = window.URL.createObjectURL(blob);
@@ -1865,6 +1896,7 @@ function AppContent() {
 
         if (window.confirm('Are you sure you want to reset all scenes? This action cannot be undone.')) {
             setScenes([]);
+            setFinalPreview(null);
             setVoiceInstructions('🎙️ Narration Instruction (Adaptive Delivery)\n\nAccent: Neutral Indian English, clear and grounded.\n\nTone: Serious, but with subtle shifts — reflective at the start, energetic in the middle, then darker toward the end.\n\nMood: Gloomy undertone throughout, but with sparks of energy that echo his fleeting highs.\n\nDelivery Flow (per story beat):\n\nOpening (reflective, steady pace)\n"Interviews, fan messages, and public appearances filled his days."\n→ Calm, matter-of-fact, almost weary.\n\n"Initially, he responded to fans, humble and grateful."\n→ Gentle, softened voice, slower.\n\nRising Admiration (quicker, more engaged)\n"He felt alive, powerful, adored. He reveled in praise, each view and comment inflating his pride. Even small compliments felt like treasures."\n→ Increase pacing slightly, add a touch of brightness in tone — but not joyous, rather intoxicated.\n\nThe High (confident, energetic rhythm)\n"The world seemed to obey him. Music flowed effortlessly. The feeling was intoxicating."\n→ Crisp delivery, medium-fast pace, a hint of wonder — but with a shadow underneath.\n\nThe Shift (slower, darker again)\n"He started imagining bigger dreams, larger stages, more recognition."\n→ Slight pause between phrases, like ambition swelling.\n\n"For a while, life felt perfect, magical, unstoppable."\n→ Deliver with restrained intensity — the pace slows, voice lowers at "unstoppable," foreshadowing collapse.\n\n⚖️ Overall rhythm: Not monotone slow — instead, it rises with his pride and falls back into gloom, mirroring the story arc.');
             // Generate a new story ID on reset
             const newStoryId = `story_${Date.now()}_${Math.random().toString(36).substr(2, 9)}`;
@@ -2000,6 +2032,30 @@ function AppContent() {
                             </button>
                         </div>
                     )}
+
+                    {finalPreview && (
+                        <div className="final-preview" style={{ marginTop: '1.5rem' }}>
+                            <h3>Final Video Preview</h3>
+                            <video
+                                ref={finalVideoRef}
+                                className="video-player"
+                                controls
+                                preload="metadata"
+                                poster={finalPreview.posterUrl}
+                                key={finalPreview.renderedAt}
+                                style={{
+                                    width: '100%',
+                                    maxHeight: '500px',
+                                    backgroundColor: '#000',
+                                    borderRadius: '8px'
+                                }}
+                            >
+                                <source src={`${finalPreview.proxyUrl}?t=${finalPreview.renderedAt}`} type="video/mp4" />
+                                Your browser does not support the video tag.
+                            </video>
+                            <ScrubPreview videoRef={finalVideoRef} thumbnailsUrl={finalPreview.thumbnailsUrl} />
+                        </div>
+                    )}
                 </div>
             </main>
         </div>
@@ -1,6 +1,10 @@
 import React, { useState, useRef, useEffect } from 'react';
 import { Volume2, VolumeX, Sliders, Settings, Download, Wand2, RotateCcw, Play, Pause } from 'lucide-react';
 import { useToast } from './Toast';
+import Waveform from './Waveform';
+
+const PREVIEW_DEBOUNCE_MS = 400;
+const PREVIEW_WINDOW_SECONDS = 10;
 
 const AudioEnhancer = ({ 
     audioUrl, 
@@ -14,7 +18,10 @@ const AudioEnhancer = ({
     const [isVisible, setIsVisible] = useState(false);
     const [isProcessing, setIsProcessing] = useState(false);
     const [enhancedAudioUrl, setEnhancedAudioUrl] = useState(null);
+    const [enhancedWaveformUrl, setEnhancedWaveformUrl] = useState(null);
     const [isPlaying, setIsPlaying] = useState(false);
+    const [previewUrl, setPreviewUrl] = useState(null);
+    const [isPreviewing, setIsPreviewing] = useState(false);
     const [settings, setSettings] = useState({
         // Volume and Dynamics
         volume: 0,          // dB adjustment (-20 to +20)
@@ -46,6 +53,54 @@ const AudioEnhancer = ({
     
     const audioRef = useRef(null);
     const enhancedAudioRef = useRef(null);
+    const previewAudioRef = useRef(null);
+
+    // Render a short window around the playhead whenever a setting changes
+    useEffect(() => {
+        if (!isVisible || !audioFilename) {
+            return;
+        }
+        const controller = new AbortController();
+        const timer = setTimeout(async () => {
+            setIsPreviewing(true);
+            try {
+                const playhead = audioRef.current ? audioRef.current.currentTime : 0;
+                const response = await fetch('http://localhost:8000/preview/audio/enhance', {
+                    method: 'POST',
+                    headers: {
+                        'Content-Type': 'application/json',
+                    },
+                    body: JSON.stringify({
+                        story_id: storyId,
+                        scene_id: String(sceneId),
+                        audio_filename: audioFilename,
+                        settings: settings,
+                        start: Math.max(playhead - 1, 0),
+                        duration: PREVIEW_WINDOW_SECONDS
+                    }),
+                    signal: controller.signal
+                });
+                const result = await response.json();
+                if (!response.ok || !result.success) {
+                    throw new Error(result.detail || 'Preview failed');
+                }
+                // The preview is rewritten under the same name, so bust the browser cache
+                setPreviewUrl(`${result.preview_url}?t=${Date.now()}`);
+            } catch (error) {
+                if (error.name !== 'AbortError') {
+                    console.error('Error rendering enhancement preview:', error);
+                }
+            } finally {
+                if (!controller.signal.aborted) {
+                    setIsPreviewing(false);
+                }
+            }
+        }, PREVIEW_DEBOUNCE_MS);
+        return () => {
+            clearTimeout(timer);
+            controller.abort();
+        };
+    }, [settings, isVisible, storyId, sceneId, audioFilename]);
 
     const resetSettings = () => {
         setSettings({
@@ -68,6 +123,8 @@ const AudioEnhancer = ({
             fadeOut: 0,
         });
         setEnhancedAudioUrl(null);
+        setEnhancedWaveformUrl(null);
+        setPreviewUrl(null);
     };
 
     const enhanceAudio = async () => {
@@ -97,6 +154,7 @@ const AudioEnhancer = ({
             if (result.success) {
                 const enhancedUrl = `http://localhost:8000/files/${storyId}/audios/${result.filename}`;
                 setEnhancedAudioUrl(enhancedUrl);
+                setEnhancedWaveformUrl(result.waveform_url);
                 toast.success('Audio Enhanced', 'Audio processing completed successfully!');
             } else {
                 throw new Error(result.error || 'Enhancement failed');
@@ -120,7 +178,8 @@ const AudioEnhancer = ({
     };
 
     const playAudio = (isEnhanced = false) => {
-        const audioElement = isEnhanced ? enhancedAudioRef.current : audioRef.current;
+        const audioElement = isEnhanced === 'preview' ? previewAudioRef.current
+            : isEnhanced ? enhancedAudioRef.current : audioRef.current;
         if (audioElement) {
             audioElement.play();
             setIsPlaying(true);
@@ -130,6 +189,7 @@ const AudioEnhancer = ({
     const pauseAudio = () => {
         if (audioRef.current) audioRef.current.pause();
         if (enhancedAudioRef.current) enhancedAudioRef.current.pause();
+        if (previewAudioRef.current) previewAudioRef.current.pause();
         setIsPlaying(false);
     };
 
@@ -176,6 +236,7 @@ const AudioEnhancer = ({
                                 <audio
                                     ref={audioRef}
                                     src={audioUrl}
+                                    preload="none"
                                     onEnded={() => setIsPlaying(false)}
                                 />
                                 <button
@@ -186,6 +247,7 @@ const AudioEnhancer = ({
                                     Play Original
                                 </button>
                             </div>
+                            <Waveform audioUrl={audioUrl} audioRef={audioRef} />
                         </div>
 
                         {/* Enhancement Settings */}
@@ -395,6 +457,27 @@ const AudioEnhancer = ({
                             </div>
                         </div>
 
+                        {/* Windowed preview of the current settings */}
+                        {previewUrl && (
+                            <div className="enhanced-preview-section">
+                                <h4>Settings Preview{isPreviewing ? ' (updating...)' : ''}</h4>
+                                <div className="audio-controls">
+                                    <audio
+                                        ref={previewAudioRef}
+                                        src={previewUrl}
+                                        onEnded={() => setIsPlaying(false)}
+                                    />
+                                    <button
+                                        className="preview-button enhanced"
+                                        onClick={() => playAudio('preview')}
+                                    >
+                                        <Play size={16} />
+                                        Play {PREVIEW_WINDOW_SECONDS}s Preview
+                                    </button>
+                                </div>
+                            </div>
+                        )}
+
                         {/* Enhanced Audio Preview */}
                         {enhancedAudioUrl && (
                             <div className="enhanced-preview-section">
@@ -403,6 +486,7 @@ const AudioEnhancer = ({
                                     <audio
                                         ref={enhancedAudioRef}
                                         src={enhancedAudioUrl}
+                                        preload="none"
                                         onEnded={() => setIsPlaying(false)}
                                     />
                                     <button
@@ -420,6 +504,13 @@ const AudioEnhancer = ({
                                         Download
                                     </button>
                                 </div>
+                                <Waveform
+                                    url={enhancedWaveformUrl}
+                                    audioUrl={enhancedAudioUrl}
+                                    audioRef={enhancedAudioRef}
+                                    color="#10b981"
+                                    playedColor="#047857"
+                                />
                             </div>
                         )}
 
@@ -1,6 +1,7 @@
 import React, { useState, useRef, useEffect } from 'react';
 import { Mic, MicOff, Square, Play, Pause, RotateCcw } from 'lucide-react';
 import { useToast } from './Toast';
+import Waveform from './Waveform';
 
 const MicrophoneRecorder = ({ 
     onAudioRecorded, 
@@ -16,6 +17,7 @@ const MicrophoneRecorder = ({
     const [isPlaying, setIsPlaying] = useState(false);
     const [recordingTime, setRecordingTime] = useState(0);
     const [isUploading, setIsUploading] = useState(false);
+    const [uploadedWaveformUrl, setUploadedWaveformUrl] = useState(null);
     
     const mediaRecorderRef = useRef(null);
     const audioChunksRef = useRef([]);
@@ -225,7 +227,8 @@ const MicrophoneRecorder = ({
                     const audioUrl = `http://localhost:8000/files/${storyId}/audios/${result.filename}`;
                     
                     // Call the callback with the uploaded audio URL
-                    onAudioRecorded(audioUrl, result.filename);
+                    onAudioRecorded(audioUrl, result.filename, result.waveform_url);
+                    setUploadedWaveformUrl(result.waveform_url);
                     
                     toast.success('Upload Complete', 'Recorded audio uploaded successfully!');
                     
@@ -321,6 +324,13 @@ const MicrophoneRecorder = ({
                     </div>
                 )}
 
+                {/* Waveform of the last uploaded take, drawn from the server's peaks file */}
+                {!isRecording && !recordedAudio && uploadedWaveformUrl && (
+                    <div className="uploaded-waveform">
+                        <Waveform url={uploadedWaveformUrl} height={32} />
+                    </div>
+                )}
+
                 {/* Playback and Upload Controls */}
                 {recordedAudio && !isRecording && (
                     <div className="playback-controls">
@@ -0,0 +1,77 @@
+import React, { useState, useEffect } from 'react';
+import { fetchThumbnails, thumbnailAt } from './ThumbnailUtil';
+
+// A seek strip under a video player: hovering shows the sprite thumbnail of
+// that point in time, clicking seeks the player there. Nothing is decoded in
+// the browser; the thumbnails come from the server's WebVTT index.
+const ScrubPreview = ({ videoRef, thumbnailsUrl, height = 10 }) => {
+    const [cues, setCues] = useState([]);
+    const [hover, setHover] = useState(null);
+
+    useEffect(() => {
+        setCues([]);
+        if (!thumbnailsUrl) return;
+        const controller = new AbortController();
+        fetchThumbnails(thumbnailsUrl, controller.signal)
+            .then(setCues)
+            .catch(error => {
+                if (error.name !== 'AbortError') {
+                    console.warn('Could not load thumbnails:', error.message);
+                }
+            });
+        return () => controller.abort();
+    }, [thumbnailsUrl]);
+
+    if (!cues.length) return null;
+
+    const duration = cues[cues.length - 1].end;
+
+    const timeAt = (e) => {
+        const rect = e.currentTarget.getBoundingClientRect();
+        const fraction = Math.min(Math.max((e.clientX - rect.left) / rect.width, 0), 1);
+        return { fraction, time: fraction * duration };
+    };
+
+    const seek = (e) => {
+        if (videoRef.current) videoRef.current.currentTime = timeAt(e).time;
+    };
+
+    const cue = hover && thumbnailAt(cues, hover.time);
+
+    return (
+        <div
+            className="scrub-preview"
+            onMouseMove={(e) => setHover(timeAt(e))}
+            onMouseLeave={() => setHover(null)}
+            onClick={seek}
+            style={{
+                position: 'relative',
+                height: `${height}px`,
+                marginTop: '0.25rem',
+                backgroundColor: '#dfe6e9',
+                borderRadius: '4px',
+                cursor: 'pointer'
+            }}
+        >
+            {cue && (
+                <div style={{
+                    position: 'absolute',
+                    bottom: `${height + 4}px`,
+                    left: `${hover.fraction * 100}%`,
+                    transform: 'translateX(-50%)',
+                    width: `${cue.w}px`,
+                    height: `${cue.h}px`,
+                    backgroundImage: `url(${cue.src})`,
+                    backgroundPosition: `-${cue.x}px -${cue.y}px`,
+                    border: '2px solid #fff',
+                    borderRadius: '4px',
+                    boxShadow: '0 2px 8px rgba(0, 0, 0, 0.3)',
+                    pointerEvents: 'none',
+                    zIndex: 10
+                }} />
+            )}
+        </div>
+    );
+};
+
+export default ScrubPreview;
@@ -1,7 +1,12 @@
-import React, { useState } from 'react';
+import React, { useState, useRef } from 'react';
 import { X, Volume2, VolumeX, Play, Pause, RotateCcw, Settings, RefreshCw, Check } from 'lucide-react';
+import Waveform from './Waveform';
+import { fetchPeaks, waveformUrlFor } from './WaveformUtil';
 import './SoundMixerModal.css';
 
+const PREVIEW_DEBOUNCE_MS = 400;
+const PREVIEW_WINDOW_SECONDS = 10;
+
 const SoundMixerModal = ({ show, onClose, scene, index, storyId, generatedAudioUrl }) => {
     const [audioTracks, setAudioTracks] = useState([]);
     const [isProcessing, setIsProcessing] = useState(false);
@@ -10,19 +15,30 @@ const SoundMixerModal = ({ show, onClose, scene, index, storyId, generatedAudioU
     const [isAccepting, setIsAccepting] = useState(false);
     const [previewUrl, setPreviewUrl] = useState(null);
     const [originalAudioDuration, setOriginalAudioDuration] = useState(30); // Original track duration - default to 30s
+    const [originalPeaks, setOriginalPeaks] = useState(null);
+    const [quickPreviewUrl, setQuickPreviewUrl] = useState(null);
+    const [isPreviewing, setIsPreviewing] = useState(false);
+    const originalAudioRef = useRef(null);
+    // sha256 of every overlay file the server already stores, so tweaks don't re-upload it
+    const assetHashesRef = useRef(new WeakMap());
 
-    // Get original audio duration when component loads
+    // Get original audio duration and waveform from its peaks file when component loads
     React.useEffect(() => {
-        if (generatedAudioUrl) {
-            const audio = new Audio(generatedAudioUrl);
-            audio.addEventListener('loadedmetadata', () => {
-                const duration = Math.max(audio.duration, 30); // Minimum 30 seconds for better visualization
-                setOriginalAudioDuration(duration);
-            });
-            audio.addEventListener('error', () => {
-                // Fallback to 30 seconds if audio fails to load
-                setOriginalAudioDuration(30);
-            });
+        setOriginalPeaks(null);
+        const peaksUrl = waveformUrlFor(generatedAudioUrl);
+        if (peaksUrl) {
+            const controller = new AbortController();
+            fetchPeaks(peaksUrl, controller.signal)
+                .then(peaks => {
+                    setOriginalPeaks(peaks);
+                    setOriginalAudioDuration(Math.max(peaks.duration, 30)); // Minimum 30 seconds for better visualization
+                })
+                .catch(error => {
+                    if (error.name === 'AbortError') return;
+                    // Fallback to 30 seconds if the waveform fails to load
+                    setOriginalAudioDuration(30);
+                });
+            return () => controller.abort();
         } else {
             // Default to 30 seconds if no audio URL
             setOriginalAudioDuration(30);
@@ -180,8 +196,106 @@ const SoundMixerModal = ({ show, onClose, scene, index, storyId, generatedAudioU
     const resetAllSettings = () => {
         setAudioTracks([]);
         setPreviewUrl(null);
+        setQuickPreviewUrl(null);
+    };
+
+    const buildMixFormData = (validTracks, extraMetadata = {}) => {
+        // Create FormData for multipart upload
+        const formData = new FormData();
+        
+        // Add metadata as JSON
+        const metadata = {
+            story_id: storyId,
+            scene_id: String(scene.id),
+            base_audio: {
+                url: generatedAudioUrl,
+                format: "mp3"
+            },
+            output_format: "mp3",
+            normalize: true,
+            export_quality: "high",
+            ...extraMetadata
+        };
+        
+        formData.append('metadata', JSON.stringify(metadata));
+        
+        validTracks.forEach((track, index) => {
+            const assetHash = assetHashesRef.current.get(track.file);
+            // Add the actual audio file, unless the server already has it
+            if (!assetHash) {
+                formData.append(`overlay_file_${index}`, track.file);
+            }
+            
+            // Add track configuration
+            const trackConfig = {
+                id: track.id,
+                name: track.name,
+                start_time_ms: Math.round(track.startTime * 1000),
+                duration_ms: Math.round(track.duration * 1000),
+                volume_db: Math.round(20 * Math.log10(track.volume)),
+                fade_in_ms: Math.round(track.fadeIn * 1000),
+                fade_out_ms: Math.round(track.fadeOut * 1000),
+                loop: track.loop,
+                format: track.file ? track.file.name.split('.').pop().toLowerCase() : "mp3",
+                ...(assetHash ? { asset_hash: assetHash } : {})
+            };
+            
+            formData.append(`track_config_${index}`, JSON.stringify(trackConfig));
+        });
+        return formData;
+    };
+
+    const rememberAssets = (validTracks, assets = []) => {
+        assets.forEach(asset => {
+            const track = validTracks[Number(asset.index)];
+            if (track && track.file) {
+                assetHashesRef.current.set(track.file, asset.hash);
+            }
+        });
     };
 
+    // Render a short window around the playhead whenever a track setting changes
+    React.useEffect(() => {
+        const validTracks = audioTracks.filter(track => track.file && track.url);
+        if (!show || !generatedAudioUrl || !scene?.id || validTracks.length === 0) {
+            return;
+        }
+        const controller = new AbortController();
+        const timer = setTimeout(async () => {
+            setIsPreviewing(true);
+            try {
+                const playhead = originalAudioRef.current ? originalAudioRef.current.currentTime : 0;
+                const response = await fetch('http://localhost:8000/preview/audio/mix', {
+                    method: 'POST',
+                    body: buildMixFormData(validTracks, {
+                        preview_start: Math.max(playhead - 1, 0),
+                        preview_duration: PREVIEW_WINDOW_SECONDS
+                    }),
+                    signal: controller.signal
+                });
+                const result = await response.json();
+                if (!response.ok || !result.success) {
+                    throw new Error(result.detail || 'Mix preview failed');
+                }
+                rememberAssets(validTracks, result.assets);
+                // The preview is rewritten under the same name, so bust the browser cache
+                setQuickPreviewUrl(`${result.preview_url}?t=${Date.now()}`);
+            } catch (error) {
+                if (error.name !== 'AbortError') {
+                    console.error('Error rendering mix preview:', error);
+                }
+            } finally {
+                if (!controller.signal.aborted) {
+                    setIsPreviewing(false);
+                }
+            }
+        }, PREVIEW_DEBOUNCE_MS);
+        return () => {
+            clearTimeout(timer);
+            controller.abort();
+        };
+    }, [audioTracks, show, generatedAudioUrl, storyId, scene?.id]);
+
     const generateMixedAudio = async () => {
         if (!generatedAudioUrl) {
             alert('Please generate audio for this scene first.');
@@ -196,46 +310,9 @@ const SoundMixerModal = ({ show, onClose, scene, index, storyId, generatedAudioU
         try {
             setIsProcessing(true);
 
-            // Create FormData for multipart upload
-            const formData = new FormData();
-            
-            // Add metadata as JSON
-            const metadata = {
-                story_id: storyId,
-                scene_id: String(scene.id),
-                base_audio: {
-                    url: generatedAudioUrl,
-                    format: "mp3"
-                },
-                output_format: "mp3",
-                normalize: true,
-                export_quality: "high"
-            };
-            
-            formData.append('metadata', JSON.stringify(metadata));
-            
             // Add overlay track configurations and files
             const validTracks = audioTracks.filter(track => track.file && track.url);
-            
-            validTracks.forEach((track, index) => {
-                // Add the actual audio file
-                formData.append(`overlay_file_${index}`, track.file);
-                
-                // Add track configuration
-                const trackConfig = {
-                    id: track.id,
-                    name: track.name,
-                    start_time_ms: Math.round(track.startTime * 1000),
-                    duration_ms: Math.round(track.duration * 1000),
-                    volume_db: Math.round(20 * Math.log10(track.volume)),
-                    fade_in_ms: Math.round(track.fadeIn * 1000),
-                    fade_out_ms: Math.round(track.fadeOut * 1000),
-                    loop: track.loop,
-                    format: track.file ? track.file.name.split('.').pop().toLowerCase() : "mp3"
-                };
-                
-                formData.append(`track_config_${index}`, JSON.stringify(trackConfig));
-            });
+            const formData = buildMixFormData(validTracks);
 
             console.log('Sending multipart data with', validTracks.length, 'audio files');
 
@@ -247,6 +324,7 @@ const SoundMixerModal = ({ show, onClose, scene, index, storyId, generatedAudioU
             if (response.ok) {
                 const result = await response.json();
                 if (result.success) {
+                    rememberAssets(validTracks, result.assets);
                     setPreviewUrl(result.mixed_audio_url);
                 } else {
                     throw new Error(result.error || 'Audio mixing failed');
@@ -537,9 +615,12 @@ const SoundMixerModal = ({ show, onClose, scene, index, storyId, generatedAudioU
                                                     opacity: 0.5,
                                                     borderRadius: '2px',
                                                     zIndex: 1,
-                                                    border: '1px solid #2980b9'
+                                                    border: '1px solid #2980b9',
+                                                    overflow: 'hidden'
                                                 }}
-                                            />
+                                            >
+                                                {originalPeaks && <Waveform peaks={originalPeaks} height={12} color="#1f5f8b" />}
+                                            </div>
                                         );
                                         
                                         // Add audio track visualization bars
@@ -1087,11 +1168,23 @@ const SoundMixerModal = ({ show, onClose, scene, index, storyId, generatedAudioU
                             <div className="audio-preview">
                                 <div className="original-audio">
                                     <label>Original Scene Audio:</label>
-                                    <audio controls style={{ width: '100%' }}>
+                                    <audio controls preload="none" style={{ width: '100%' }} ref={originalAudioRef}>
                                         <source src={generatedAudioUrl} type="audio/mp3" />
                                     </audio>
+                                    {originalPeaks && <Waveform peaks={originalPeaks} audioRef={originalAudioRef} />}
                                 </div>
 
+                {quickPreviewUrl && (
+                    <div className="mixed-audio" style={{ marginTop: '1rem' }}>
+                        <label>
+                            Quick Preview ({PREVIEW_WINDOW_SECONDS}s around the playhead){isPreviewing ? ' - updating...' : ''}
+                        </label>
+                        <audio controls style={{ width: '100%' }} key={quickPreviewUrl}>
+                            <source src={quickPreviewUrl} type="audio/mp3" />
+                        </audio>
+                    </div>
+                )}
+
                 {previewUrl && (
                     <div className="mixed-audio" style={{ marginTop: '1rem' }}>
                         <div style={{ 
@@ -0,0 +1,36 @@
+// Reader for the WebVTT thumbnail index written next to each video preview
+// (module/previews.py): one cue per thumbnail, pointing at its cell in a
+// sprite sheet with a #xywh= media fragment.
+
+const parseTimestamp = (value) => {
+    const parts = value.trim().split(':').map(Number);
+    return parts.reduce((total, part) => total * 60 + part, 0);
+};
+
+export const parseThumbnails = (text, baseUrl) => {
+    const cues = [];
+    const blocks = text.replace(/\r/g, '').split('\n\n');
+    for (const block of blocks) {
+        const lines = block.split('\n').filter(Boolean);
+        const timing = lines.findIndex(line => line.includes('-->'));
+        if (timing < 0 || !lines[timing + 1]) continue;
+        const [start, end] = lines[timing].split('-->').map(parseTimestamp);
+        const [file, fragment = ''] = lines[timing + 1].split('#xywh=');
+        const [x, y, w, h] = fragment.split(',').map(Number);
+        cues.push({ start, end, src: new URL(file, baseUrl).href, x, y, w, h });
+    }
+    return cues;
+};
+
+export const fetchThumbnails = async (url, signal) => {
+    const response = await fetch(url, { cache: 'no-cache', signal });
+    if (!response.ok) {
+        throw new Error(`Thumbnails not available (${response.status})`);
+    }
+    return parseThumbnails(await response.text(), url);
+};
+
+export const thumbnailAt = (cues, time) => {
+    if (!cues.length) return null;
+    return cues.find(cue => time >= cue.start && time < cue.end) || cues[cues.length - 1];
+};
@@ -0,0 +1,68 @@
+import React, { useState, useRef, useEffect } from 'react';
+import { fetchPeaks, drawPeaks, waveformUrlFor } from './WaveformUtil';
+
+// Draws an audio file from its precomputed .peaks file, so the audio itself
+// is never downloaded or decoded just to show it. With an audioRef the
+// played part is highlighted and a click seeks the player. Callers that
+// already fetched the file pass it as ``peaks``.
+const Waveform = ({ url, audioUrl, peaks: loadedPeaks, audioRef, height = 48, color, playedColor }) => {
+    const [fetchedPeaks, setPeaks] = useState(null);
+    const [progress, setProgress] = useState(0);
+    const canvasRef = useRef(null);
+    const peaksUrl = loadedPeaks ? null : url || waveformUrlFor(audioUrl);
+    const peaks = loadedPeaks || fetchedPeaks;
+
+    useEffect(() => {
+        if (!peaksUrl) return;
+        const controller = new AbortController();
+        fetchPeaks(peaksUrl, controller.signal)
+            .then(setPeaks)
+            .catch(error => {
+                if (error.name !== 'AbortError') {
+                    console.warn('Could not load waveform:', error.message);
+                    setPeaks(null);
+                }
+            });
+        return () => controller.abort();
+    }, [peaksUrl]);
+
+    useEffect(() => {
+        const audio = audioRef && audioRef.current;
+        if (!audio || !peaks) return;
+        const update = () => setProgress(peaks.duration ? audio.currentTime / peaks.duration : 0);
+        audio.addEventListener('timeupdate', update);
+        audio.addEventListener('seeked', update);
+        return () => {
+            audio.removeEventListener('timeupdate', update);
+            audio.removeEventListener('seeked', update);
+        };
+    }, [audioRef, peaks]);
+
+    useEffect(() => {
+        if (!canvasRef.current) return;
+        const redraw = () => drawPeaks(canvasRef.current, peaks, { color, playedColor, progress });
+        redraw();
+        window.addEventListener('resize', redraw);
+        return () => window.removeEventListener('resize', redraw);
+    }, [peaks, progress, color, playedColor]);
+
+    const seek = (e) => {
+        const audio = audioRef && audioRef.current;
+        if (!audio || !peaks) return;
+        const rect = e.currentTarget.getBoundingClientRect();
+        audio.currentTime = ((e.clientX - rect.left) / rect.width) * peaks.duration;
+    };
+
+    if (!peaks && !peaksUrl) return null;
+
+    return (
+        <canvas
+            ref={canvasRef}
+            className="waveform-canvas"
+            onClick={seek}
+            style={{ width: '100%', height: `${height}px`, display: 'block', cursor: audioRef ? 'pointer' : 'default' }}
+        />
+    );
+};
+
+export default Waveform;
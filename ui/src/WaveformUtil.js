@@ -0,0 +1,85 @@
+// Reader for the server's .peaks waveform files (module/waveform.py).
+//
+// Layout: "PKS1", a little-endian uint32 header length, a JSON header
+// (sample_rate, duration, levels[{samples_per_peak, length, offset}]),
+// then each level as interleaved int8 [min0, max0, min1, max1, ...].
+
+const MAGIC = 'PKS1';
+
+// /files/<story>/audios/<name> -> /files/<story>/waveforms/<name>.peaks
+export const waveformUrlFor = (audioUrl) => {
+    if (!audioUrl) return null;
+    const [path] = audioUrl.split('?');
+    const match = path.match(/^(.*\/files\/[^/]+)\/audios\/([^/]+)$/);
+    return match ? `${match[1]}/waveforms/${match[2]}.peaks` : null;
+};
+
+export const parsePeaks = (buffer) => {
+    const view = new DataView(buffer);
+    const magic = new TextDecoder().decode(new Uint8Array(buffer, 0, 4));
+    if (magic !== MAGIC) {
+        throw new Error('Not a waveform file');
+    }
+    const headerLength = view.getUint32(4, true);
+    const header = JSON.parse(new TextDecoder().decode(new Uint8Array(buffer, 8, headerLength)));
+    const dataStart = 8 + headerLength;
+    const levels = header.levels.map(level => ({
+        samplesPerPeak: level.samples_per_peak,
+        length: level.length,
+        data: new Int8Array(buffer, dataStart + level.offset, level.length * 2),
+    }));
+    return { sampleRate: header.sample_rate, duration: header.duration, levels };
+};
+
+// "no-cache" revalidates against the server's ETag, so an unchanged file
+// costs a 304 while a regenerated one is picked up.
+export const fetchPeaks = async (url, signal) => {
+    const response = await fetch(url, { cache: 'no-cache', signal });
+    if (!response.ok) {
+        throw new Error(`Waveform not available (${response.status})`);
+    }
+    return parsePeaks(await response.arrayBuffer());
+};
+
+// The coarsest level that still has at least one peak per pixel
+export const pickLevel = (peaks, samplesPerPixel) => {
+    let chosen = peaks.levels[0];
+    for (const level of peaks.levels) {
+        if (level.samplesPerPeak <= samplesPerPixel) chosen = level;
+    }
+    return chosen;
+};
+
+export const drawPeaks = (canvas, peaks, { color = '#3b82f6', playedColor = '#1e40af', progress = 0 } = {}) => {
+    const ratio = window.devicePixelRatio || 1;
+    const width = Math.max(1, Math.floor(canvas.clientWidth * ratio));
+    const height = Math.max(1, Math.floor(canvas.clientHeight * ratio));
+    if (canvas.width !== width) canvas.width = width;
+    if (canvas.height !== height) canvas.height = height;
+
+    const ctx = canvas.getContext('2d');
+    ctx.clearRect(0, 0, width, height);
+    if (!peaks || !peaks.levels.length) return;
+
+    const totalSamples = peaks.duration * peaks.sampleRate;
+    const samplesPerPixel = totalSamples / width;
+    const level = pickLevel(peaks, samplesPerPixel);
+    const peaksPerPixel = samplesPerPixel / level.samplesPerPeak;
+    const middle = height / 2;
+    const scale = middle / 127;
+    const playedX = progress * width;
+
+    for (let x = 0; x < width; x++) {
+        const first = Math.floor(x * peaksPerPixel);
+        const last = Math.min(level.length, Math.max(first + 1, Math.floor((x + 1) * peaksPerPixel)));
+        if (first >= level.length) break;
+        let min = 127;
+        let max = -127;
+        for (let i = first; i < last; i++) {
+            min = Math.min(min, level.data[i * 2]);
+            max = Math.max(max, level.data[i * 2 + 1]);
+        }
+        ctx.fillStyle = x < playedX ? playedColor : color;
+        ctx.fillRect(x, middle - max * scale, 1, Math.max(1, (max - min) * scale));
+    }
+};